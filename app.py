@@ -1,136 +1,301 @@
 import sys
-import os
 import gc
-import re
 from pathlib import Path
-from PIL import Image
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, 
-                            QWidget, QPushButton, QLabel, QProgressBar, QTextEdit,
+                            QWidget, QPushButton, QLabel, QProgressBar,
                             QSpinBox, QGroupBox, QFileDialog, QCheckBox, QFrame,
                             QMessageBox, QGridLayout, QTabWidget, QTableWidget,
                             QTableWidgetItem, QHeaderView, QLineEdit, QRadioButton,
-                            QButtonGroup, QComboBox, QAbstractItemView)
+                            QButtonGroup, QComboBox, QAbstractItemView, QDoubleSpinBox, QPlainTextEdit)
 from PyQt6.QtCore import QThread, pyqtSignal, Qt, QTimer
 from PyQt6.QtGui import QFont, QPalette, QColor
-import send2trash
+from webp_core import (ConversionEngine, CONVERT_EXTENSIONS, ENCODER_PRESETS, DEFAULT_PRESET, DEFAULT_IO_THREADS,
+                       default_workers, filter_files, delete_file, format_size)
+from webp_manifest import ConversionManifest
+from webp_cache import EncodeCache, DEFAULT_CACHE_SIZE_MB
+from webp_memory import MemoryBudget, DEFAULT_MAX_PIXELS, default_memory_budget
+from webp_journal import ConversionJournal
+from webp_output import OutputLayout
+from webp_archive import ArchiveConverter, default_archive_output
+from webp_scan import ParallelScanner
+from webp_index import ScanIndex
+from webp_sniff import sniff_catalog, is_mislabeled
+from webp_metadata import MetadataIndexer, needs_metadata
+from webp_rules import ScanRules, EXAMPLE_RULES, DEFAULT_RULES_DIR, list_sites, load_rules, save_rules
+from webp_metrics import RunMetrics, DEFAULT_REPORT_PATH
+from webp_progress import ProgressTracker, file_sizes, format_progress
+from webp_log import LogBuffer, DEBUG, INFO, WARNING, ERROR, DEFAULT_LOG_CAPACITY, DEFAULT_LOG_PATH
 
 
 class ImageConverterThread(QThread):
-    progress_updated = pyqtSignal(int, int)
-    log_updated = pyqtSignal(str)
+    progress_updated = pyqtSignal(dict)
     stats_updated = pyqtSignal(int, int)
     conversion_finished = pyqtSignal()
     
-    def __init__(self, files, quality, keep_original):
+    def __init__(self, files, quality, keep_original, workers=None, manifest=None, cache=None,
+                 encode_options=None, group_variants=False, memory_budget=None, journal=None, log_buffer=None,
+                 io_threads=DEFAULT_IO_THREADS, output_layout=None, catalog=None):
         super().__init__()
         self.files = files
+        # Entry của bộ quét (có size): không phải stat lại từng file trước khi chạy
+        self.catalog = {path: catalog[path] for path in files if path in catalog} if catalog else None
+        self.log_buffer = log_buffer or LogBuffer()
         self.quality = quality
         self.keep_original = keep_original
         self.processed_count = 0
+        self.skipped_count = 0
+        self.cache_hit_count = 0
+        self.resumed_count = 0
         self.total_original_size = 0
         self.total_converted_size = 0
         self.is_running = True
+        self.manifest = manifest
+        self.cache = cache
+        self.journal = journal
+        self.metrics = RunMetrics()
+        self.engine = ConversionEngine(quality, keep_original, workers, manifest, cache, encode_options,
+                                       group_variants, memory_budget=memory_budget, journal=journal,
+                                       metrics=self.metrics, io_threads=io_threads,
+                                       output_layout=output_layout)
         
     def run(self):
-        total_files = len(self.files)
+        sizes = file_sizes(self.files, self.catalog)
+        self.tracker = ProgressTracker(len(self.files), sum(sizes.values()))
         
-        for i, file_path in enumerate(self.files):
-            if not self.is_running:
-                break
-                
-            try:
-                input_file = Path(file_path)
-                base_name = input_file.stem
-                output_file = input_file.parent / f"{base_name}.webp"
-                
-                original_size = input_file.stat().st_size
-                self.total_original_size += original_size
-                
-                with Image.open(input_file) as img:
-                    if img.mode in ("RGBA", "P"):
-                        img = img.convert("RGB")
-                    
-                    img.save(output_file, "webp", quality=self.quality, optimize=True)
-                
-                converted_size = output_file.stat().st_size
-                self.total_converted_size += converted_size
-                
-                size_reduction = ((original_size - converted_size) / original_size) * 100
-                
-                self.log_updated.emit(f"✓ {input_file.name} → {output_file.name}")
-                self.log_updated.emit(f"   Gốc: {self.format_size(original_size)} | WebP: {self.format_size(converted_size)} | Giảm: {size_reduction:.1f}%")
+        for file_path, result, error in self.engine.run(self.files):
+            if error is not None:
+                self.log(f"❌ Lỗi khi xử lý {file_path}: {str(error)}", ERROR)
+                self.report_progress(sizes.get(file_path, 0), False)
+                continue
                 
-                if not self.keep_original:
-                    os.remove(input_file)
-                    self.log_updated.emit(f"✗ Đã xóa file gốc: {input_file.name}")
+            input_file = Path(result["input"])
+            output_file = Path(result["output"])
+            
+            if result.get("resumed"):
+                self.resumed_count += 1
+                self.log(f"⏯️ Đã xong ở lần chạy trước: {input_file.name}", DEBUG)
+                self.report_progress(sizes.get(file_path, 0), False)
+                continue
+            if result.get("skipped"):
+                self.skipped_count += 1
+                self.log(f"⏭️ Bỏ qua (WebP đã cập nhật): {input_file.name}", DEBUG)
+                self.report_progress(sizes.get(file_path, 0), False)
+                continue
+            original_size = result["original_size"]
+            converted_size = result["converted_size"]
+            
+            self.total_original_size += original_size
+            self.total_converted_size += converted_size
+            
+            size_reduction = ((original_size - converted_size) / original_size) * 100
+            
+            if result["cache_hit"]:
+                self.cache_hit_count += 1
+                self.log(f"♻️ {input_file.name} → {output_file.name} (lấy từ cache)")
+            else:
+                self.log(f"✓ {input_file.name} → {output_file.name}")
+            quality_note = f" | Q: {result['quality']}" if result["quality"] not in (None, self.quality) else ""
+            self.log(f"   Gốc: {self.format_size(original_size)} | WebP: {self.format_size(converted_size)} | Giảm: {size_reduction:.1f}%{quality_note}", DEBUG)
+            
+            if result.get("target_met") is False:
+                self.log(f"⚠️ {input_file.name}: không đạt mục tiêu dung lượng/chất lượng (Q: {result['quality']})",
+                         WARNING)
+            if result["removed"]:
+                self.log(f"✗ Đã xóa file gốc: {input_file.name}", DEBUG)
+            
+            self.processed_count += 1
+            self.report_progress(original_size, True)
+        
+        # Lần cập nhật cuối luôn được gửi, kể cả khi bị dừng giữa chừng
+        self.progress_updated.emit(self.tracker.snapshot())
+        self.stats_updated.emit(self.total_original_size, self.total_converted_size)
+        
+        if self.manifest is not None:
+            self.manifest.close()
+        if self.cache is not None:
+            self.cache.close()
+        if self.journal is not None:
+            self.journal.close()
+        try:
+            self.metrics.write_report(DEFAULT_REPORT_PATH)
+        except OSError as e:
+            self.log(f"⚠️ Không ghi được báo cáo thời gian: {str(e)}", WARNING)
+        
+        self.conversion_finished.emit()
+    
+    def stop(self):
+        self.is_running = False
+        self.engine.stop()
+    
+    def log(self, message, level=INFO):
+        self.log_buffer.add(message, level)
+    
+    def report_progress(self, size, worked):
+        progress = self.tracker.advance(size, worked)
+        if progress is not None:
+            self.progress_updated.emit(progress)
+            self.stats_updated.emit(self.total_original_size, self.total_converted_size)
+        
+    def format_size(self, size_bytes):
+        return format_size(size_bytes)
+
+
+class ArchiveConverterThread(ImageConverterThread):
+    # Chuyển đổi ảnh trong zip/tar thẳng sang archive mới, không giải nén ra đĩa
+    def __init__(self, archive_path, output_path, quality, keep_original, workers=None, encode_options=None,
+                 memory_budget=None, log_buffer=None):
+        super().__init__([], quality, keep_original, workers, encode_options=encode_options,
+                         memory_budget=memory_budget, log_buffer=log_buffer)
+        self.archive_path = archive_path
+        self.output_path = output_path
+        self.converter = ArchiveConverter(quality, keep_original, workers, encode_options, memory_budget,
+                                          self.metrics)
+        
+    def run(self):
+        # Chưa biết trước số member (tar.gz đọc kiểu stream): tiến trình chỉ đếm, không có ETA
+        self.tracker = ProgressTracker(None, 0)
+        self.log(f"📦 {self.archive_path} → {self.output_path}")
+        
+        try:
+            for name, result, error in self.converter.run(self.archive_path, self.output_path):
+                if error is not None:
+                    self.log(f"❌ Lỗi khi xử lý {name}: {str(error)} (giữ nguyên ảnh gốc)", ERROR)
+                    self.report_progress(0, False)
+                    continue
+                if result.get("skipped"):
+                    self.skipped_count += 1
+                    self.log(f"⏭️ Bỏ qua {name} (không phải file thường)", DEBUG)
+                    self.report_progress(0, False)
+                    continue
                 
+                self.total_original_size += result["original_size"]
+                self.total_converted_size += result["converted_size"]
+                self.log(f"✓ {name} → {result['output']}")
+                if result.get("target_met") is False:
+                    self.log(f"⚠️ {name}: không đạt mục tiêu dung lượng/chất lượng (Q: {result['quality']})", WARNING)
                 self.processed_count += 1
-                self.progress_updated.emit(i + 1, total_files)
-                self.stats_updated.emit(self.total_original_size, self.total_converted_size)
-                
-            except Exception as e:
-                self.log_updated.emit(f"❌ Lỗi khi xử lý {file_path}: {str(e)}")
+                self.report_progress(result["original_size"], True)
+        except Exception as e:
+            self.log(f"❌ Lỗi khi xử lý archive {self.archive_path}: {str(e)}", ERROR)
+        
+        self.progress_updated.emit(self.tracker.snapshot())
+        self.stats_updated.emit(self.total_original_size, self.total_converted_size)
+        try:
+            self.metrics.write_report(DEFAULT_REPORT_PATH)
+        except OSError as e:
+            self.log(f"⚠️ Không ghi được báo cáo thời gian: {str(e)}", WARNING)
         
         self.conversion_finished.emit()
     
     def stop(self):
         self.is_running = False
+        self.converter.stop()
+
+
+class FolderScanThread(QThread):
+    # Quét thư mục ở background, đẩy từng lô entry (path, size, định dạng...) lên giao diện ngay khi tìm thấy
+    batch_found = pyqtSignal(list)
+    scan_finished = pyqtSignal(bool)
+    
+    def __init__(self, folder, extensions=None, use_index=True, rules=None, target="convert"):
+        super().__init__()
+        self.target = target
+        self.index = ScanIndex() if use_index else None
+        self.scanner = ParallelScanner([folder], extensions, index=self.index, rules=rules)
         
-    def format_size(self, size_bytes):
-        if size_bytes < 1024:
-            return f"{size_bytes} B"
-        elif size_bytes < 1024 * 1024:
-            return f"{size_bytes / 1024:.1f} KB"
-        elif size_bytes < 1024 * 1024 * 1024:
-            return f"{size_bytes / (1024 * 1024):.1f} MB"
-        else:
-            return f"{size_bytes / (1024 * 1024 * 1024):.1f} GB"
+    def run(self):
+        try:
+            for batch in self.scanner.iter_batches():
+                self.batch_found.emit(batch)
+        finally:
+            if self.index is not None:
+                self.index.close()
+        self.scan_finished.emit(self.scanner.cancelled)
+        
+    def stop(self):
+        self.scanner.cancel()
+
+
+class MetadataThread(QThread):
+    # Đọc kích thước / mode / số frame / ngày chụp từ header cho bộ lọc kích thước, không giải mã ảnh
+    batch_read = pyqtSignal(list)
+    read_finished = pyqtSignal(bool)
+    
+    def __init__(self, entries, use_index=True):
+        super().__init__()
+        # Bản sao: catalog của giao diện chỉ được sửa ở main thread (trong slot nhận batch_read)
+        self.entries = [dict(entry) for entry in entries]
+        self.index = ScanIndex() if use_index else None
+        self.indexer = MetadataIndexer(index=self.index)
+        
+    def run(self):
+        try:
+            for chunk in self.indexer.run(self.entries):
+                self.batch_read.emit(chunk)
+        finally:
+            if self.index is not None:
+                self.index.close()
+        self.read_finished.emit(not self.indexer.is_running)
+        
+    def stop(self):
+        self.indexer.stop()
 
 
 class FileDeleteThread(QThread):
-    progress_updated = pyqtSignal(int, int)
-    log_updated = pyqtSignal(str)
+    progress_updated = pyqtSignal(dict)
     stats_updated = pyqtSignal(int, int)
     deletion_finished = pyqtSignal()
     
-    def __init__(self, files, use_recycle_bin):
+    def __init__(self, files, use_recycle_bin, log_buffer=None, catalog=None):
         super().__init__()
         self.files = files
+        self.catalog = {path: catalog[path] for path in files if path in catalog} if catalog else None
+        self.log_buffer = log_buffer or LogBuffer()
         self.use_recycle_bin = use_recycle_bin
         self.deleted_count = 0
         self.total_size = 0
         self.is_running = True
         
     def run(self):
-        total_files = len(self.files)
+        sizes = file_sizes(self.files, self.catalog)
+        self.tracker = ProgressTracker(len(self.files), sum(sizes.values()))
         
-        for i, file_path in enumerate(self.files):
+        for file_path in self.files:
             if not self.is_running:
                 break
                 
             try:
                 file_obj = Path(file_path)
-                file_size = file_obj.stat().st_size
+                file_size = delete_file(file_obj, self.use_recycle_bin)
                 
                 if self.use_recycle_bin:
-                    send2trash.send2trash(str(file_obj))
-                    self.log_updated.emit(f"🗑️ Đã chuyển vào thùng rác: {file_obj.name}")
+                    self.log(f"🗑️ Đã chuyển vào thùng rác: {file_obj.name}")
                 else:
-                    os.remove(file_obj)
-                    self.log_updated.emit(f"✗ Đã xóa vĩnh viễn: {file_obj.name}")
+                    self.log(f"✗ Đã xóa vĩnh viễn: {file_obj.name}")
                 
                 self.total_size += file_size
                 self.deleted_count += 1
-                self.progress_updated.emit(i + 1, total_files)
-                self.stats_updated.emit(self.deleted_count, self.total_size)
+                self.report_progress(file_size, True)
                 
             except Exception as e:
-                self.log_updated.emit(f"❌ Lỗi khi xóa {file_path}: {str(e)}")
+                self.log(f"❌ Lỗi khi xóa {file_path}: {str(e)}", ERROR)
+                self.report_progress(sizes.get(file_path, 0), False)
         
+        self.progress_updated.emit(self.tracker.snapshot())
+        self.stats_updated.emit(self.deleted_count, self.total_size)
         self.deletion_finished.emit()
     
     def stop(self):
         self.is_running = False
+    
+    def log(self, message, level=INFO):
+        self.log_buffer.add(message, level)
+    
+    def report_progress(self, size, worked):
+        progress = self.tracker.advance(size, worked)
+        if progress is not None:
+            self.progress_updated.emit(progress)
+            self.stats_updated.emit(self.deleted_count, self.total_size)
 
 
 class WebPConverterGUI(QMainWindow):
@@ -138,11 +303,26 @@ class WebPConverterGUI(QMainWindow):
         super().__init__()
         self.selected_files = []
         self.all_scanned_files = []
+        # Thư mục gốc của lần chọn gần nhất: đường dẫn tương đối của --output-root và journal theo thư mục gốc
+        self.source_roots = []
         self.converter_thread = None
         self.delete_thread = None
+        # target ("convert" / "delete") -> lần quét của tab đó; hai tab quét độc lập, không hủy lần quét của nhau
+        self.scan_threads = {}
+        # target ("convert" / "delete") -> thư mục đang chọn, để quét lại khi đổi quy tắc loại trừ
+        self.scan_folders = {}
+        self.metadata_thread = None
+        # path -> entry lúc quét (size, mtime...): preview không phải stat lại từng file
+        self.file_catalog = {}
+        self.log_buffer = LogBuffer(DEFAULT_LOG_CAPACITY, DEFAULT_LOG_PATH)
         self.init_ui()
         self.setup_styles()
         
+        # Log được đẩy lên khung theo lô mỗi 250 ms thay vì mỗi dòng một lần append + cuộn
+        self.log_timer = QTimer(self)
+        self.log_timer.timeout.connect(self.flush_log)
+        self.log_timer.start(250)
+        
     def init_ui(self):
         self.setWindowTitle("WebP Image Converter & File Manager")
         self.setGeometry(100, 100, 1200, 900)
@@ -231,14 +411,30 @@ class WebPConverterGUI(QMainWindow):
         self.select_folder_btn = QPushButton("📂 Chọn Thư Mục")
         self.select_folder_btn.clicked.connect(self.select_folder)
         
+        self.select_archive_btn = QPushButton("📦 Chuyển Đổi Archive")
+        self.select_archive_btn.setToolTip("Chuyển ảnh trong .zip / .tar / .tar.gz sang archive mới, không giải nén")
+        self.select_archive_btn.clicked.connect(self.start_archive_conversion)
+        
+        self.cancel_scan_btn = QPushButton("⏹️ Dừng Quét")
+        self.cancel_scan_btn.clicked.connect(lambda: self.stop_scan("convert"))
+        self.cancel_scan_btn.setVisible(False)
+        
+        self.use_scan_index_checkbox = QCheckBox("🗂️ Chỉ mục quét")
+        self.use_scan_index_checkbox.setChecked(True)
+        self.use_scan_index_checkbox.setToolTip("Chỉ đọc lại thư mục có thay đổi kể từ lần quét trước")
+        
         button_layout.addWidget(self.select_files_btn)
         button_layout.addWidget(self.select_folder_btn)
+        button_layout.addWidget(self.select_archive_btn)
+        button_layout.addWidget(self.cancel_scan_btn)
+        button_layout.addWidget(self.use_scan_index_checkbox)
         
         self.file_count_label = QLabel("Chưa chọn file nào")
         self.file_count_label.setStyleSheet("color: #7f8c8d; font-style: italic;")
         
         layout.addLayout(button_layout)
         layout.addWidget(self.file_count_label)
+        self.rules_site_combo, self.rules_editor = self.create_rules_editor(layout, "convert")
         
         parent_layout.addWidget(group)
         
@@ -297,12 +493,39 @@ class WebPConverterGUI(QMainWindow):
         self.filter_regex_cb = QCheckBox("🔧 Chế độ Regex")
         self.filter_regex_cb.stateChanged.connect(self.apply_filters)
         
+        # Kích thước đọc từ header (không giải mã), lưu trong chỉ mục quét: lần lọc sau không phải đọc lại
+        dimensions_layout = QHBoxLayout()
+        dimensions_layout.addWidget(QLabel("📐 Kích thước ảnh (px):"))
+        self.filter_min_width_spinbox = QSpinBox()
+        self.filter_min_height_spinbox = QSpinBox()
+        self.filter_max_width_spinbox = QSpinBox()
+        self.filter_max_height_spinbox = QSpinBox()
+        for spinbox, prefix in ((self.filter_min_width_spinbox, "R ≥ "), (self.filter_min_height_spinbox, "C ≥ "),
+                                (self.filter_max_width_spinbox, "R ≤ "), (self.filter_max_height_spinbox, "C ≤ ")):
+            spinbox.setRange(0, 100000)
+            spinbox.setValue(0)
+            spinbox.setPrefix(prefix)
+            spinbox.setSpecialValueText(f"{prefix}bất kỳ")
+            spinbox.valueChanged.connect(self.apply_filters)
+            dimensions_layout.addWidget(spinbox)
+        self.filter_min_megapixels_spinbox = QDoubleSpinBox()
+        self.filter_min_megapixels_spinbox.setRange(0, 1000)
+        self.filter_min_megapixels_spinbox.setDecimals(1)
+        self.filter_min_megapixels_spinbox.setSingleStep(0.5)
+        self.filter_min_megapixels_spinbox.setPrefix("≥ ")
+        self.filter_min_megapixels_spinbox.setSuffix(" MP")
+        self.filter_min_megapixels_spinbox.setSpecialValueText("MP bất kỳ")
+        self.filter_min_megapixels_spinbox.valueChanged.connect(self.apply_filters)
+        dimensions_layout.addWidget(self.filter_min_megapixels_spinbox)
+        dimensions_layout.addStretch()
+        
         self.filtered_count_label = QLabel("0/0 files sẽ được chuyển đổi")
         self.filtered_count_label.setStyleSheet("color: #007bff; font-weight: bold; font-size: 13px;")
         
         main_layout.addLayout(formats_layout)
         main_layout.addLayout(pattern_layout)
         main_layout.addWidget(self.filter_regex_cb)
+        main_layout.addLayout(dimensions_layout)
         main_layout.addWidget(self.filtered_count_label)
         
         parent_layout.addWidget(group)
@@ -321,15 +544,160 @@ class WebPConverterGUI(QMainWindow):
         quality_layout.addWidget(quality_label)
         quality_layout.addWidget(self.quality_spinbox)
         
+        target_layout = QVBoxLayout()
+        target_label = QLabel("Tự tìm quality (tối đa = quality trên):")
+        target_inputs = QHBoxLayout()
+        self.target_mode_combo = QComboBox()
+        self.target_mode_combo.addItem("Cố định", None)
+        self.target_mode_combo.addItem("Dung lượng tối đa (KB)", "size")
+        self.target_mode_combo.addItem("SSIM tối thiểu", "ssim")
+        self.target_mode_combo.addItem("PSNR tối thiểu (dB)", "psnr")
+        self.target_mode_combo.currentIndexChanged.connect(self.update_target_value_range)
+        self.target_value_spinbox = QDoubleSpinBox()
+        self.target_value_spinbox.setEnabled(False)
+        self.target_value_spinbox.setFixedHeight(35)
+        target_inputs.addWidget(self.target_mode_combo)
+        target_inputs.addWidget(self.target_value_spinbox)
+        target_layout.addWidget(target_label)
+        target_layout.addLayout(target_inputs)
+        
+        preset_layout = QVBoxLayout()
+        preset_label = QLabel("Hồ sơ encode:")
+        self.preset_combo = QComboBox()
+        self.preset_combo.addItem("Nhanh (fast)", "fast")
+        self.preset_combo.addItem("Cân bằng (balanced)", "balanced")
+        self.preset_combo.addItem("Nhỏ nhất (smallest)", "smallest")
+        self.preset_combo.setCurrentIndex(self.preset_combo.findData(DEFAULT_PRESET))
+        self.preset_combo.setFixedHeight(35)
+        self.lossless_checkbox = QCheckBox("Lossless")
+        self.exact_checkbox = QCheckBox("Giữ RGB vùng trong suốt (exact)")
+        self.keep_alpha_checkbox = QCheckBox("Giữ độ trong suốt (alpha)")
+        self.keep_alpha_checkbox.setChecked(True)
+        self.keep_animation_checkbox = QCheckBox("Giữ ảnh động (GIF → WebP động)")
+        self.keep_animation_checkbox.setChecked(True)
+        preset_layout.addWidget(preset_label)
+        preset_layout.addWidget(self.preset_combo)
+        preset_layout.addWidget(self.lossless_checkbox)
+        preset_layout.addWidget(self.exact_checkbox)
+        preset_layout.addWidget(self.keep_alpha_checkbox)
+        preset_layout.addWidget(self.keep_animation_checkbox)
+        
+        workers_layout = QVBoxLayout()
+        workers_label = QLabel("Số tiến trình xử lý:")
+        self.workers_spinbox = QSpinBox()
+        self.workers_spinbox.setRange(1, max(64, default_workers()))
+        self.workers_spinbox.setValue(default_workers())
+        self.workers_spinbox.setFixedHeight(35)
+        workers_layout.addWidget(workers_label)
+        workers_layout.addWidget(self.workers_spinbox)
+        
+        io_threads_label = QLabel("Luồng đọc/ghi song song:")
+        self.io_threads_spinbox = QSpinBox()
+        self.io_threads_spinbox.setRange(0, 64)
+        self.io_threads_spinbox.setValue(DEFAULT_IO_THREADS)
+        self.io_threads_spinbox.setSpecialValueText("Tắt (tuần tự)")
+        self.io_threads_spinbox.setToolTip("Đọc trước file nguồn và ghi WebP trong lúc encode, "
+                                           "tăng lên khi ảnh nằm trên NFS")
+        self.io_threads_spinbox.setFixedHeight(35)
+        workers_layout.addWidget(io_threads_label)
+        workers_layout.addWidget(self.io_threads_spinbox)
+        
+        memory_label = QLabel("Ngân sách bộ nhớ giải mã:")
+        self.memory_budget_spinbox = QSpinBox()
+        self.memory_budget_spinbox.setRange(0, 1024 * 1024)
+        self.memory_budget_spinbox.setValue(default_memory_budget() // (1024 * 1024))
+        self.memory_budget_spinbox.setSuffix(" MB")
+        self.memory_budget_spinbox.setSpecialValueText("Không giới hạn")
+        self.memory_budget_spinbox.setFixedHeight(35)
+        workers_layout.addWidget(memory_label)
+        workers_layout.addWidget(self.memory_budget_spinbox)
+        
         self.keep_original_checkbox = QCheckBox("Giữ lại file gốc")
         self.keep_original_checkbox.setChecked(False)
         
+        self.skip_converted_checkbox = QCheckBox("Bỏ qua ảnh đã chuyển đổi")
+        self.skip_converted_checkbox.setChecked(True)
+        
+        self.use_journal_checkbox = QCheckBox("Ghi journal (tiếp tục đúng chỗ nếu bị dừng)")
+        self.use_journal_checkbox.setChecked(True)
+        
+        max_size_layout = QVBoxLayout()
+        max_size_label = QLabel("Kích thước tối đa (px):")
+        max_size_inputs = QHBoxLayout()
+        self.max_width_spinbox = QSpinBox()
+        self.max_height_spinbox = QSpinBox()
+        for spinbox, prefix in ((self.max_width_spinbox, "R: "), (self.max_height_spinbox, "C: ")):
+            spinbox.setRange(0, 20000)
+            spinbox.setValue(0)
+            spinbox.setPrefix(prefix)
+            spinbox.setSpecialValueText(f"{prefix}Không giới hạn")
+            spinbox.setFixedHeight(35)
+            max_size_inputs.addWidget(spinbox)
+        max_size_layout.addWidget(max_size_label)
+        max_size_layout.addLayout(max_size_inputs)
+        
+        cache_layout = QHBoxLayout()
+        self.use_cache_checkbox = QCheckBox("Cache kết quả encode (MB):")
+        self.use_cache_checkbox.setChecked(False)
+        self.cache_size_spinbox = QSpinBox()
+        self.cache_size_spinbox.setRange(64, 1024 * 1024)
+        self.cache_size_spinbox.setValue(DEFAULT_CACHE_SIZE_MB)
+        cache_layout.addWidget(self.use_cache_checkbox)
+        cache_layout.addWidget(self.cache_size_spinbox)
+        
+        options_layout = QVBoxLayout()
+        options_layout.addWidget(self.keep_original_checkbox)
+        options_layout.addWidget(self.skip_converted_checkbox)
+        options_layout.addWidget(self.use_journal_checkbox)
+        options_layout.addLayout(cache_layout)
+        
+        self.group_variants_checkbox = QCheckBox("Tạo size WordPress từ ảnh gốc (giải mã 1 lần)")
+        self.group_variants_checkbox.setChecked(False)
+        options_layout.addWidget(self.group_variants_checkbox)
+        
+        output_root_layout = QHBoxLayout()
+        self.output_root_input = QLineEdit()
+        self.output_root_input.setPlaceholderText("Thư mục output (trống = cạnh file gốc)")
+        output_root_button = QPushButton("Chọn...")
+        output_root_button.clicked.connect(self.select_output_root)
+        self.shard_spinbox = QSpinBox()
+        self.shard_spinbox.setRange(0, 3)
+        self.shard_spinbox.setPrefix("Shard: ")
+        self.shard_spinbox.setSpecialValueText("Giữ cấu trúc")
+        self.shard_spinbox.setToolTip("Chia output vào N cấp thư mục con theo hash (256 thư mục mỗi cấp)")
+        output_root_layout.addWidget(self.output_root_input)
+        output_root_layout.addWidget(output_root_button)
+        output_root_layout.addWidget(self.shard_spinbox)
+        options_layout.addLayout(output_root_layout)
+        
         layout.addLayout(quality_layout)
+        layout.addLayout(target_layout)
+        layout.addLayout(preset_layout)
+        layout.addLayout(workers_layout)
+        layout.addLayout(max_size_layout)
         layout.addStretch()
-        layout.addWidget(self.keep_original_checkbox)
+        layout.addLayout(options_layout)
         
         parent_layout.addWidget(group)
         
+    def update_target_value_range(self):
+        mode = self.target_mode_combo.currentData()
+        self.target_value_spinbox.setEnabled(mode is not None)
+        if mode == "size":
+            self.target_value_spinbox.setDecimals(0)
+            self.target_value_spinbox.setRange(1, 100000)
+            self.target_value_spinbox.setValue(200)
+        elif mode == "ssim":
+            self.target_value_spinbox.setDecimals(3)
+            self.target_value_spinbox.setRange(0.5, 1.0)
+            self.target_value_spinbox.setSingleStep(0.005)
+            self.target_value_spinbox.setValue(0.95)
+        elif mode == "psnr":
+            self.target_value_spinbox.setDecimals(1)
+            self.target_value_spinbox.setRange(20, 60)
+            self.target_value_spinbox.setSingleStep(0.5)
+            self.target_value_spinbox.setValue(40)
+        
     def create_delete_source_group(self, parent_layout):
         group = QGroupBox("📂 Chọn Nguồn")
         layout = QVBoxLayout(group)
@@ -342,17 +710,62 @@ class WebPConverterGUI(QMainWindow):
         self.delete_select_folder_btn = QPushButton("📂 Chọn Thư Mục")
         self.delete_select_folder_btn.clicked.connect(self.delete_select_folder)
         
+        self.delete_cancel_scan_btn = QPushButton("⏹️ Dừng Quét")
+        self.delete_cancel_scan_btn.clicked.connect(lambda: self.stop_scan("delete"))
+        self.delete_cancel_scan_btn.setVisible(False)
+        
+        self.delete_use_scan_index_checkbox = QCheckBox("🗂️ Chỉ mục quét")
+        self.delete_use_scan_index_checkbox.setChecked(True)
+        self.delete_use_scan_index_checkbox.setToolTip("Chỉ đọc lại thư mục có thay đổi kể từ lần quét trước")
+        
         button_layout.addWidget(self.delete_select_files_btn)
         button_layout.addWidget(self.delete_select_folder_btn)
+        button_layout.addWidget(self.delete_cancel_scan_btn)
+        button_layout.addWidget(self.delete_use_scan_index_checkbox)
         
         self.delete_file_count_label = QLabel("Chưa chọn file nào")
         self.delete_file_count_label.setStyleSheet("color: #7f8c8d; font-style: italic;")
         
         layout.addLayout(button_layout)
         layout.addWidget(self.delete_file_count_label)
+        self.delete_rules_site_combo, self.delete_rules_editor = self.create_rules_editor(layout, "delete")
         
         parent_layout.addWidget(group)
         
+    def create_rules_editor(self, layout, target):
+        # Quy tắc loại trừ kiểu .gitignore, lưu / nạp theo site, áp dụng từ lần quét kế tiếp
+        rules_layout = QHBoxLayout()
+        
+        site_combo = QComboBox()
+        site_combo.setEditable(True)
+        site_combo.addItems(list_sites())
+        site_combo.setCurrentText("")
+        site_combo.lineEdit().setPlaceholderText("Tên site")
+        site_combo.setToolTip(f"Bộ quy tắc được lưu trong {DEFAULT_RULES_DIR}")
+        site_combo.textActivated.connect(lambda site: self.load_site_rules(target, site))
+        
+        save_rules_btn = QPushButton("💾 Lưu Quy Tắc")
+        save_rules_btn.clicked.connect(lambda: self.save_site_rules(target))
+        
+        rescan_btn = QPushButton("🔄 Quét Lại")
+        rescan_btn.setToolTip("Quét lại thư mục đang chọn với quy tắc mới")
+        rescan_btn.clicked.connect(lambda: self.rescan_folder(target))
+        
+        rules_layout.addWidget(QLabel("🚫 Loại trừ (kiểu .gitignore):"))
+        rules_layout.addWidget(site_combo, 1)
+        rules_layout.addWidget(save_rules_btn)
+        rules_layout.addWidget(rescan_btn)
+        
+        editor = QPlainTextEdit()
+        editor.setPlaceholderText(EXAMPLE_RULES)
+        editor.setMaximumHeight(80)
+        editor.setToolTip("Mỗi dòng một mẫu. Thư mục bị loại (ví dụ cache/) không được quét cả cây con, "
+                          "'!' để lấy lại, '#' là chú thích")
+        
+        layout.addLayout(rules_layout)
+        layout.addWidget(editor)
+        return site_combo, editor
+        
     def create_delete_criteria_group(self, parent_layout):
         group = QGroupBox("🎯 Điều Kiện Xóa")
         main_layout = QVBoxLayout(group)
@@ -562,10 +975,13 @@ class WebPConverterGUI(QMainWindow):
         
         stats_layout = QHBoxLayout()
         self.processed_label = QLabel("Đã xử lý: 0")
+        self.throughput_label = QLabel("")
         self.total_label = QLabel("Tổng số: 0")
         
         stats_layout.addWidget(self.processed_label)
         stats_layout.addStretch()
+        stats_layout.addWidget(self.throughput_label)
+        stats_layout.addStretch()
         stats_layout.addWidget(self.total_label)
         
         layout.addWidget(self.progress_label)
@@ -606,16 +1022,37 @@ class WebPConverterGUI(QMainWindow):
         group = QGroupBox("📝 Nhật Ký Hoạt Động")
         layout = QVBoxLayout(group)
         
-        self.log_text = QTextEdit()
+        self.log_text = QPlainTextEdit()
         self.log_text.setMaximumHeight(150)
         self.log_text.setReadOnly(True)
+        # Khung log chỉ giữ số dòng cố định, dòng cũ tự bị bỏ; toàn bộ log nằm trong file
+        self.log_text.setMaximumBlockCount(DEFAULT_LOG_CAPACITY)
+        
+        log_controls = QHBoxLayout()
+        self.log_level_combo = QComboBox()
+        self.log_level_combo.addItem("Chi tiết", DEBUG)
+        self.log_level_combo.addItem("Thông tin", INFO)
+        self.log_level_combo.addItem("Cảnh báo", WARNING)
+        self.log_level_combo.addItem("Chỉ lỗi", ERROR)
+        self.log_level_combo.currentIndexChanged.connect(self.refresh_log)
+        
+        self.spill_log_checkbox = QCheckBox("Ghi toàn bộ log ra file")
+        self.spill_log_checkbox.setChecked(True)
+        self.spill_log_checkbox.setToolTip(str(DEFAULT_LOG_PATH))
+        self.spill_log_checkbox.toggled.connect(self.toggle_log_spill)
         
         clear_log_btn = QPushButton("🧹 Xóa Log")
         clear_log_btn.clicked.connect(self.clear_log)
         clear_log_btn.setMaximumWidth(100)
         
+        log_controls.addWidget(QLabel("Mức log:"))
+        log_controls.addWidget(self.log_level_combo)
+        log_controls.addWidget(self.spill_log_checkbox)
+        log_controls.addStretch()
+        log_controls.addWidget(clear_log_btn)
+        
         layout.addWidget(self.log_text)
-        layout.addWidget(clear_log_btn, alignment=Qt.AlignmentFlag.AlignRight)
+        layout.addLayout(log_controls)
         
         parent_layout.addWidget(group)
         
@@ -681,7 +1118,7 @@ class WebPConverterGUI(QMainWindow):
                 background-color: #28a745;
                 border-radius: 4px;
             }
-            QTextEdit {
+            QPlainTextEdit {
                 border: 1px solid #dee2e6;
                 border-radius: 6px;
                 background-color: #f8f9fa;
@@ -722,23 +1159,214 @@ class WebPConverterGUI(QMainWindow):
             "Image files (*.jpg *.jpeg *.png *.bmp *.tiff *.gif);;All files (*.*)"
         )
         if files:
+            self.stop_scan("convert")
+            self.stop_metadata_read()
+            self.file_catalog.update(sniff_catalog(files))
             self.all_scanned_files = files
+            self.source_roots = sorted({str(Path(file_path).parent) for file_path in files})
+            self.scan_folders.pop("convert", None)
             self.apply_filters()
             
     def select_folder(self):
         folder = QFileDialog.getExistingDirectory(self, "Chọn thư mục chứa ảnh")
         if folder:
+            self.source_roots = [folder]
+            self.scan_folders["convert"] = folder
+            self.rescan_folder("convert")
+            
+    def rescan_folder(self, target):
+        folder = self.scan_folders.get(target)
+        if folder is None:
+            return
+        if target == "convert":
+            self.stop_metadata_read()
             self.all_scanned_files = []
-            for root, dirs, files in os.walk(folder):
-                for file in files:
-                    if file.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.gif')) and not file.lower().endswith('.webp'):
-                        self.all_scanned_files.append(os.path.join(root, file))
             self.apply_filters()
+            self.start_scan(folder, CONVERT_EXTENSIONS, target)
+        else:
+            self.all_delete_files = []
+            self.apply_delete_filters()
+            self.start_scan(folder, None, target)
             
-    def apply_filters(self):
-        if not hasattr(self, 'all_scanned_files'):
+    def rules_widgets(self, target):
+        if target == "convert":
+            return self.rules_site_combo, self.rules_editor
+        return self.delete_rules_site_combo, self.delete_rules_editor
+        
+    def load_site_rules(self, target, site):
+        text = load_rules(site)
+        if text is not None:
+            self.rules_widgets(target)[1].setPlainText(text)
+            self.update_log(f"🗂️ Đã nạp bộ quy tắc của site '{site}'")
+            
+    def save_site_rules(self, target):
+        site_combo, editor = self.rules_widgets(target)
+        site = site_combo.currentText().strip()
+        if not site:
+            QMessageBox.warning(self, "Cảnh báo", "Nhập tên site để lưu bộ quy tắc!")
+            return
+        try:
+            path = save_rules(site, editor.toPlainText())
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "Cảnh báo", f"Không lưu được bộ quy tắc: {e}")
+            return
+        # Site mới xuất hiện trong danh sách của cả hai tab
+        for combo in (self.rules_site_combo, self.delete_rules_site_combo):
+            current = combo.currentText()
+            combo.clear()
+            combo.addItems(list_sites())
+            combo.setCurrentText(current)
+        self.update_log(f"🗂️ Đã lưu bộ quy tắc của site '{site}' vào {path}")
+            
+    def start_scan(self, folder, extensions, target):
+        # Mỗi tab một lần quét tại một thời điểm; chọn thư mục mới thì hủy lần quét cũ của chính tab đó
+        self.stop_scan(target)
+        index_checkbox = self.use_scan_index_checkbox if target == "convert" else self.delete_use_scan_index_checkbox
+        rules = ScanRules.from_text(self.rules_widgets(target)[1].toPlainText())
+        scan_thread = FolderScanThread(folder, extensions, index_checkbox.isChecked(), rules, target)
+        scan_thread.batch_found.connect(self.add_scanned_files)
+        scan_thread.scan_finished.connect(self.scan_finished)
+        self.scan_threads[target] = scan_thread
+        cancel_button = self.cancel_scan_btn if target == "convert" else self.delete_cancel_scan_btn
+        cancel_button.setVisible(True)
+        scan_thread.start()
+        
+    def stop_scan(self, target=None):
+        # Không có target (đóng cửa sổ): dừng lần quét của cả hai tab
+        targets = [target] if target is not None else list(self.scan_threads)
+        for target in targets:
+            scan_thread = self.scan_threads.get(target)
+            if scan_thread is not None and scan_thread.isRunning():
+                scan_thread.stop()
+                scan_thread.wait()
+                
+    def scanning(self, target):
+        scan_thread = self.scan_threads.get(target)
+        return scan_thread is not None and scan_thread.isRunning()
+        
+    def current_scan(self):
+        # Lô / kết thúc còn trong hàng đợi signal của lần quét đã bị thay thế thì bỏ qua
+        scan_thread = self.sender()
+        if self.scan_threads.get(scan_thread.target) is not scan_thread:
+            return None
+        return scan_thread
+        
+    def add_scanned_files(self, batch):
+        scan_thread = self.current_scan()
+        if scan_thread is None:
+            return
+        self.file_catalog.update((entry["path"], entry) for entry in batch)
+        paths = [entry["path"] for entry in batch]
+        if scan_thread.target == "convert":
+            self.all_scanned_files.extend(paths)
+            new_files = filter_files(paths, *self.convert_filter_args(), self.file_catalog,
+                                     dimensions=self.dimension_filter())
+            self.selected_files.extend(new_files)
+            self.append_preview_rows(self.preview_table, new_files)
+            self.update_file_count()
+            # Chưa quét xong thì chưa cho chuyển đổi danh sách dở dang
+            self.convert_btn.setEnabled(False)
+            self.file_count_label.setText(f"🔍 Đang quét... {len(self.all_scanned_files)} ảnh")
+        else:
+            self.all_delete_files.extend(paths)
+            new_files = filter_files(paths, *self.delete_filter_args(), self.file_catalog, strict=True)
+            self.selected_delete_files.extend(new_files)
+            self.append_preview_rows(self.delete_preview_table, new_files)
+            self.update_delete_file_count()
+            self.delete_btn.setEnabled(False)
+            self.delete_file_count_label.setText(f"🔍 Đang quét... {len(self.all_delete_files)} files")
+        
+    def scan_finished(self, cancelled):
+        scan_thread = self.current_scan()
+        if scan_thread is None:
+            return
+        if scan_thread.target == "convert":
+            self.cancel_scan_btn.setVisible(False)
+            self.update_file_count()
+            label, count = self.file_count_label, len(self.all_scanned_files)
+            if self.dimension_filter() and not cancelled:
+                self.start_metadata_read()
+        else:
+            self.delete_cancel_scan_btn.setVisible(False)
+            self.update_delete_file_count()
+            label, count = self.delete_file_count_label, len(self.all_delete_files)
+        if cancelled:
+            label.setText(f"{label.text()} (đã dừng quét, {count} file)")
+            self.update_log(f"⚠️ Đã dừng quét thư mục sau {count} file", WARNING)
+        scanner = scan_thread.scanner
+        if scanner.pruned_dirs:
+            self.update_log(f"🚫 Bỏ qua {scanner.pruned_dirs} thư mục (cả cây con) theo quy tắc loại trừ")
+        if scanner.index is not None:
+            self.update_log(f"🗂️ Chỉ mục quét: {scanner.cached_dirs} thư mục không đổi, "
+                            f"đọc lại {scanner.scanned_dirs} thư mục", DEBUG)
+            
+    def dimension_filter(self):
+        criteria = {
+            "min_width": self.filter_min_width_spinbox.value(),
+            "min_height": self.filter_min_height_spinbox.value(),
+            "max_width": self.filter_max_width_spinbox.value(),
+            "max_height": self.filter_max_height_spinbox.value(),
+            "min_pixels": int(self.filter_min_megapixels_spinbox.value() * 1_000_000),
+        }
+        return {key: value for key, value in criteria.items() if value}
+        
+    def start_metadata_read(self):
+        # Chỉ đọc header của ảnh chưa có kích thước trong catalog / chỉ mục quét; đang quét thì chờ quét xong
+        if self.scanning("convert"):
+            return
+        if self.metadata_thread is not None and self.metadata_thread.isRunning():
+            return
+        entries = [self.file_catalog[file_path] for file_path in self.all_scanned_files
+                   if file_path in self.file_catalog and needs_metadata(self.file_catalog[file_path])]
+        if not entries:
+            return
+        self.metadata_total = len(entries)
+        self.metadata_done = 0
+        self.metadata_thread = MetadataThread(entries, self.use_scan_index_checkbox.isChecked())
+        self.metadata_thread.batch_read.connect(self.add_metadata)
+        self.metadata_thread.read_finished.connect(self.metadata_finished)
+        self.convert_btn.setEnabled(False)
+        self.file_count_label.setText(f"📐 Đang đọc kích thước ảnh... 0/{self.metadata_total}")
+        self.metadata_thread.start()
+        
+    def stop_metadata_read(self):
+        if self.metadata_thread is not None and self.metadata_thread.isRunning():
+            self.metadata_thread.stop()
+            self.metadata_thread.wait()
+        
+    def add_metadata(self, chunk):
+        if self.sender() is not self.metadata_thread:
+            return
+        for entry in chunk:
+            if entry["path"] in self.file_catalog:
+                self.file_catalog[entry["path"]].update(entry)
+        self.metadata_done += len(chunk)
+        dimensions = self.dimension_filter()
+        if dimensions:
+            # Ảnh chưa có kích thước bị bộ lọc loại: giờ mới biết có được chọn hay không
+            new_files = filter_files([entry["path"] for entry in chunk], *self.convert_filter_args(),
+                                     self.file_catalog, dimensions=dimensions)
+            self.selected_files.extend(new_files)
+            self.append_preview_rows(self.preview_table, new_files)
+            self.update_file_count()
+        self.convert_btn.setEnabled(False)
+        self.file_count_label.setText(f"📐 Đang đọc kích thước ảnh... {self.metadata_done}/{self.metadata_total}")
+        
+    def metadata_finished(self, cancelled):
+        if self.sender() is not self.metadata_thread:
             return
+        self.update_file_count()
+        if cancelled:
+            self.update_log(f"⚠️ Đã dừng đọc kích thước sau {self.metadata_done}/{self.metadata_total} ảnh", WARNING)
+        else:
+            self.update_log(f"📐 Đã đọc kích thước {self.metadata_done} ảnh từ header", DEBUG)
+        
+    def select_output_root(self):
+        folder = QFileDialog.getExistingDirectory(self, "Chọn thư mục output")
+        if folder:
+            self.output_root_input.setText(folder)
             
+    def convert_filter_args(self):
         allowed_extensions = []
         if self.filter_jpg_cb.isChecked():
             allowed_extensions.extend(['.jpg', '.jpeg'])
@@ -754,35 +1382,23 @@ class WebPConverterGUI(QMainWindow):
         prefix = self.filter_prefix_input.text()
         suffix = self.filter_suffix_input.text()
         use_regex = self.filter_regex_cb.isChecked()
+        return allowed_extensions, prefix, suffix, use_regex
         
-        self.selected_files = []
-        
-        for file_path in self.all_scanned_files:
-            file_obj = Path(file_path)
-            file_name = file_obj.stem
-            file_ext = file_obj.suffix.lower()
+    def apply_filters(self):
+        if not hasattr(self, 'all_scanned_files'):
+            return
             
-            if allowed_extensions and file_ext not in allowed_extensions:
-                continue
-                
-            if use_regex:
-                try:
-                    if prefix and not re.match(prefix, file_name):
-                        continue
-                    if suffix and not re.search(suffix + '$', file_name):
-                        continue
-                except re.error:
-                    pass
-            else:
-                if prefix and not file_name.startswith(prefix):
-                    continue
-                if suffix and not file_name.endswith(suffix):
-                    continue
-                    
-            self.selected_files.append(file_path)
+        dimensions = self.dimension_filter()
+        self.selected_files = filter_files(self.all_scanned_files, *self.convert_filter_args(), self.file_catalog,
+                                           dimensions=dimensions)
             
         self.update_file_count()
         self.update_preview_table()
+        if dimensions:
+            self.start_metadata_read()
+        if self.scanning("convert") or (self.metadata_thread is not None and self.metadata_thread.isRunning()):
+            # Danh sách còn đang được bổ sung: chưa cho chuyển đổi
+            self.convert_btn.setEnabled(False)
         
     def update_file_count(self):
         total_count = len(self.all_scanned_files) if hasattr(self, 'all_scanned_files') else 0
@@ -807,13 +1423,21 @@ class WebPConverterGUI(QMainWindow):
             
     def update_preview_table(self):
         self.preview_table.setRowCount(0)
+        self.append_preview_rows(self.preview_table, self.selected_files)
         
-        for file_path in self.selected_files:
+    def append_preview_rows(self, table, files):
+        for file_path in files:
             file_obj = Path(file_path)
-            file_size = file_obj.stat().st_size
+            entry = self.file_catalog.get(file_path)
+            file_size = entry.get("size") if entry is not None else None
+            if file_size is None:
+                try:
+                    file_size = file_obj.stat().st_size
+                except OSError:
+                    file_size = 0
             
-            row = self.preview_table.rowCount()
-            self.preview_table.insertRow(row)
+            row = table.rowCount()
+            table.insertRow(row)
             
             checkbox = QCheckBox()
             checkbox.setChecked(True)
@@ -823,11 +1447,19 @@ class WebPConverterGUI(QMainWindow):
             checkbox_layout.setAlignment(Qt.AlignmentFlag.AlignCenter)
             checkbox_layout.setContentsMargins(0, 0, 0, 0)
             
-            self.preview_table.setCellWidget(row, 0, checkbox_widget)
-            self.preview_table.setItem(row, 1, QTableWidgetItem(file_obj.name))
-            self.preview_table.setItem(row, 2, QTableWidgetItem(self.format_size(file_size)))
-            self.preview_table.setItem(row, 3, QTableWidgetItem(file_obj.suffix.upper()))
-            self.preview_table.setItem(row, 4, QTableWidgetItem(str(file_obj.parent)))
+            table.setCellWidget(row, 0, checkbox_widget)
+            table.setItem(row, 1, QTableWidgetItem(file_obj.name))
+            table.setItem(row, 2, QTableWidgetItem(self.format_size(file_size)))
+            file_type = file_obj.suffix.upper()
+            if entry is not None and entry.get("format"):
+                file_type = entry["format"].upper()
+                if is_mislabeled(entry):
+                    # Đuôi không khớp nội dung: hiện cả hai để người dùng biết vì sao file được / không được chọn
+                    file_type = f"{file_type} ⚠️ {file_obj.suffix.upper() or 'không đuôi'}"
+            if entry is not None and entry.get("width"):
+                file_type = f"{file_type} · {entry['width']}×{entry['height']}"
+            table.setItem(row, 3, QTableWidgetItem(file_type))
+            table.setItem(row, 4, QTableWidgetItem(str(file_obj.parent)))
             
     def select_all_preview(self):
         for row in range(self.preview_table.rowCount()):
@@ -849,22 +1481,19 @@ class WebPConverterGUI(QMainWindow):
             "All files (*.*)"
         )
         if files:
+            self.stop_scan("delete")
+            self.file_catalog.update(sniff_catalog(files))
             self.all_delete_files = files
+            self.scan_folders.pop("delete", None)
             self.apply_delete_filters()
             
     def delete_select_folder(self):
         folder = QFileDialog.getExistingDirectory(self, "Chọn thư mục")
         if folder:
-            self.all_delete_files = []
-            for root, dirs, files in os.walk(folder):
-                for file in files:
-                    self.all_delete_files.append(os.path.join(root, file))
-            self.apply_delete_filters()
-            
-    def apply_delete_filters(self):
-        if not hasattr(self, 'all_delete_files'):
-            return
+            self.scan_folders["delete"] = folder
+            self.rescan_folder("delete")
             
+    def delete_filter_args(self):
         allowed_extensions = []
         if self.delete_filter_webp_cb.isChecked():
             allowed_extensions.append('.webp')
@@ -882,35 +1511,19 @@ class WebPConverterGUI(QMainWindow):
         prefix = self.delete_prefix_input.text()
         suffix = self.delete_suffix_input.text()
         use_regex = self.delete_regex_cb.isChecked()
+        return allowed_extensions, prefix, suffix, use_regex
         
-        self.selected_delete_files = []
-        
-        for file_path in self.all_delete_files:
-            file_obj = Path(file_path)
-            file_name = file_obj.stem
-            file_ext = file_obj.suffix.lower()
+    def apply_delete_filters(self):
+        if not hasattr(self, 'all_delete_files'):
+            return
             
-            if allowed_extensions and file_ext not in allowed_extensions:
-                continue
-                
-            if use_regex:
-                try:
-                    if prefix and not re.match(prefix, file_name):
-                        continue
-                    if suffix and not re.search(suffix + '$', file_name):
-                        continue
-                except re.error:
-                    pass
-            else:
-                if prefix and not file_name.startswith(prefix):
-                    continue
-                if suffix and not file_name.endswith(suffix):
-                    continue
-                    
-            self.selected_delete_files.append(file_path)
+        self.selected_delete_files = filter_files(self.all_delete_files, *self.delete_filter_args(), self.file_catalog,
+                                                  strict=True)
             
         self.update_delete_file_count()
         self.update_delete_preview_table()
+        if self.scanning("delete"):
+            self.delete_btn.setEnabled(False)
         
     def update_delete_file_count(self):
         total_count = len(self.all_delete_files) if hasattr(self, 'all_delete_files') else 0
@@ -937,26 +1550,7 @@ class WebPConverterGUI(QMainWindow):
         if not hasattr(self, 'selected_delete_files'):
             return
             
-        for file_path in self.selected_delete_files:
-            file_obj = Path(file_path)
-            file_size = file_obj.stat().st_size
-            
-            row = self.delete_preview_table.rowCount()
-            self.delete_preview_table.insertRow(row)
-            
-            checkbox = QCheckBox()
-            checkbox.setChecked(True)
-            checkbox_widget = QWidget()
-            checkbox_layout = QHBoxLayout(checkbox_widget)
-            checkbox_layout.addWidget(checkbox)
-            checkbox_layout.setAlignment(Qt.AlignmentFlag.AlignCenter)
-            checkbox_layout.setContentsMargins(0, 0, 0, 0)
-            
-            self.delete_preview_table.setCellWidget(row, 0, checkbox_widget)
-            self.delete_preview_table.setItem(row, 1, QTableWidgetItem(file_obj.name))
-            self.delete_preview_table.setItem(row, 2, QTableWidgetItem(self.format_size(file_size)))
-            self.delete_preview_table.setItem(row, 3, QTableWidgetItem(file_obj.suffix.upper()))
-            self.delete_preview_table.setItem(row, 4, QTableWidgetItem(str(file_obj.parent)))
+        self.append_preview_rows(self.delete_preview_table, self.selected_delete_files)
             
     def select_all_delete_preview(self):
         for row in range(self.delete_preview_table.rowCount()):
@@ -988,10 +1582,30 @@ class WebPConverterGUI(QMainWindow):
         
         quality = self.quality_spinbox.value()
         keep_original = self.keep_original_checkbox.isChecked()
-        
-        self.converter_thread = ImageConverterThread(selected_files_to_convert, quality, keep_original)
+        workers = self.workers_spinbox.value()
+        manifest = ConversionManifest() if self.skip_converted_checkbox.isChecked() else None
+        cache = None
+        if self.use_cache_checkbox.isChecked():
+            cache = EncodeCache(max_bytes=self.cache_size_spinbox.value() * 1024 * 1024)
+        
+        encode_options = self.build_encode_options()
+        
+        group_variants = self.group_variants_checkbox.isChecked()
+        memory_budget = self.build_memory_budget()
+        journal = ConversionJournal(roots=self.source_roots) if self.use_journal_checkbox.isChecked() else None
+        output_root = self.output_root_input.text().strip() or None
+        # Lập tên output ngay ở đây (để báo trùng tên) nên phải có manifest: WebP trên đĩa của file gốc khác
+        owner_of = manifest.output_owner if manifest is not None else None
+        output_layout = OutputLayout(output_root, self.source_roots, self.shard_spinbox.value(), owner_of)
+        for output, assigned in output_layout.plan(selected_files_to_convert, self.file_catalog):
+            names = ", ".join(f"{Path(path).name} → {Path(planned).name}" for path, planned in assigned)
+            self.update_log(f"⚠️ Trùng tên output {output}: {names}", WARNING)
+        
+        self.converter_thread = ImageConverterThread(selected_files_to_convert, quality, keep_original,
+                                                     workers, manifest, cache, encode_options, group_variants,
+                                                     memory_budget, journal, self.log_buffer,
+                                                     self.io_threads_spinbox.value(), output_layout, self.file_catalog)
         self.converter_thread.progress_updated.connect(self.update_progress)
-        self.converter_thread.log_updated.connect(self.update_log)
         self.converter_thread.stats_updated.connect(self.update_convert_stats)
         self.converter_thread.conversion_finished.connect(self.conversion_finished)
         
@@ -1009,6 +1623,63 @@ class WebPConverterGUI(QMainWindow):
         
         self.converter_thread.start()
         
+    def build_encode_options(self):
+        encode_options = {
+            "max_width": self.max_width_spinbox.value(),
+            "max_height": self.max_height_spinbox.value(),
+            "keep_alpha": self.keep_alpha_checkbox.isChecked(),
+            "flatten_animation": not self.keep_animation_checkbox.isChecked(),
+            # Chống decompression bomb cả khi ngân sách bộ nhớ = "Không giới hạn"
+            "max_pixels": DEFAULT_MAX_PIXELS,
+        }
+        encode_options.update(ENCODER_PRESETS[self.preset_combo.currentData()])
+        if self.lossless_checkbox.isChecked():
+            encode_options["lossless"] = True
+        if self.exact_checkbox.isChecked():
+            encode_options["exact"] = True
+        target_mode = self.target_mode_combo.currentData()
+        if target_mode == "size":
+            encode_options["target_size"] = int(self.target_value_spinbox.value() * 1024)
+        elif target_mode is not None:
+            encode_options["target_metric"] = target_mode
+            encode_options["target_value"] = self.target_value_spinbox.value()
+        return encode_options
+        
+    def build_memory_budget(self):
+        if self.memory_budget_spinbox.value() > 0:
+            return MemoryBudget(self.memory_budget_spinbox.value() * 1024 * 1024)
+        return None
+        
+    def start_archive_conversion(self):
+        archive_path, _ = QFileDialog.getOpenFileName(
+            self, "Chọn archive", "",
+            "Archives (*.zip *.tar *.tar.gz *.tgz *.tar.bz2 *.tbz2 *.tar.xz *.txz);;All files (*.*)"
+        )
+        if not archive_path:
+            return
+        output_path, _ = QFileDialog.getSaveFileName(self, "Lưu archive kết quả", default_archive_output(archive_path))
+        if not output_path:
+            return
+        
+        self.reset_stats()
+        self.converter_thread = ArchiveConverterThread(archive_path, output_path, self.quality_spinbox.value(),
+                                                       self.keep_original_checkbox.isChecked(),
+                                                       self.workers_spinbox.value(), self.build_encode_options(),
+                                                       self.build_memory_budget(), self.log_buffer)
+        self.converter_thread.progress_updated.connect(self.update_progress)
+        self.converter_thread.stats_updated.connect(self.update_convert_stats)
+        self.converter_thread.conversion_finished.connect(self.conversion_finished)
+        
+        # Không biết trước số member: thanh tiến trình chạy kiểu "bận"
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setMaximum(0)
+        
+        self.convert_btn.setEnabled(False)
+        self.stop_convert_btn.setEnabled(True)
+        self.progress_label.setText("Đang chuyển đổi archive...")
+        
+        self.converter_thread.start()
+        
     def stop_conversion(self):
         if self.converter_thread and self.converter_thread.isRunning():
             self.converter_thread.stop()
@@ -1049,9 +1720,9 @@ class WebPConverterGUI(QMainWindow):
             
         self.reset_stats()
         
-        self.delete_thread = FileDeleteThread(selected_files_to_delete, use_recycle)
+        self.delete_thread = FileDeleteThread(selected_files_to_delete, use_recycle, self.log_buffer,
+                                              self.file_catalog)
         self.delete_thread.progress_updated.connect(self.update_progress)
-        self.delete_thread.log_updated.connect(self.update_log)
         self.delete_thread.stats_updated.connect(self.update_delete_stats)
         self.delete_thread.deletion_finished.connect(self.deletion_finished)
         
@@ -1077,17 +1748,39 @@ class WebPConverterGUI(QMainWindow):
             self.deletion_finished()
             self.update_log("⚠️ Quá trình xóa đã bị dừng")
             
-    def update_progress(self, current, total):
+    def update_progress(self, progress):
+        current = progress["done"]
+        total = progress["total"]
         self.progress_bar.setValue(current)
         self.processed_label.setText(f"Đã xử lý: {current}")
-        self.progress_label.setText(f"Đang xử lý... ({current}/{total})")
+        self.progress_label.setText(f"Đang xử lý... ({current}/{total})" if total is not None
+                                    else f"Đang xử lý... ({current})")
+        self.throughput_label.setText(format_progress(progress))
         
-    def update_log(self, message):
-        self.log_text.append(message)
+    def update_log(self, message, level=INFO):
+        self.log_buffer.add(message, level)
+        
+    def flush_log(self):
+        lines = self.log_buffer.drain(self.log_level_combo.currentData())
+        if not lines:
+            return
+        # Một lần append cho cả lô: chỉ layout và cuộn một lần
+        self.log_text.appendPlainText("\n".join(lines))
         self.log_text.verticalScrollBar().setValue(
             self.log_text.verticalScrollBar().maximum()
         )
         
+    def refresh_log(self):
+        # Đổi mức lọc: dựng lại khung log từ các dòng gần nhất còn trong bộ nhớ
+        self.log_buffer.drain()
+        self.log_text.setPlainText("\n".join(self.log_buffer.snapshot(self.log_level_combo.currentData())))
+        self.log_text.verticalScrollBar().setValue(
+            self.log_text.verticalScrollBar().maximum()
+        )
+        
+    def toggle_log_spill(self, checked):
+        self.log_buffer.set_spill_path(DEFAULT_LOG_PATH if checked else None)
+        
     def update_convert_stats(self, original_size, converted_size):
         self.stat_value_1.setText(self.format_size(original_size))
         self.stat_value_2.setText(self.format_size(converted_size))
@@ -1108,16 +1801,10 @@ class WebPConverterGUI(QMainWindow):
         self.stat_value_2.setText("0 B")
         self.stat_value_3.setText("0 B (0%)")
         self.processed_label.setText("Đã xử lý: 0")
+        self.throughput_label.setText("")
         
     def format_size(self, size_bytes):
-        if size_bytes < 1024:
-            return f"{size_bytes} B"
-        elif size_bytes < 1024 * 1024:
-            return f"{size_bytes / 1024:.1f} KB"
-        elif size_bytes < 1024 * 1024 * 1024:
-            return f"{size_bytes / (1024 * 1024):.1f} MB"
-        else:
-            return f"{size_bytes / (1024 * 1024 * 1024):.1f} GB"
+        return format_size(size_bytes)
         
     def conversion_finished(self):
         self.progress_label.setText("Hoàn thành!")
@@ -1126,7 +1813,15 @@ class WebPConverterGUI(QMainWindow):
         
         if self.converter_thread:
             processed = self.converter_thread.processed_count
+            skipped = self.converter_thread.skipped_count
+            cache_hits = self.converter_thread.cache_hit_count
+            resumed = self.converter_thread.resumed_count
             total = self.progress_bar.maximum()
+            if total == 0:
+                # Archive: thanh tiến trình đang ở chế độ "bận", số member chỉ biết khi đã xong
+                total = processed + skipped
+                self.progress_bar.setMaximum(max(total, 1))
+                self.progress_bar.setValue(max(total, 1))
             total_original = self.converter_thread.total_original_size
             total_converted = self.converter_thread.total_converted_size
             
@@ -1135,6 +1830,16 @@ class WebPConverterGUI(QMainWindow):
                 total_percentage = (total_saved / total_original) * 100
                 self.update_log(f"🎉 Hoàn thành! Đã xử lý {processed}/{total} ảnh")
                 self.update_log(f"📊 Tổng kết: Tiết kiệm {self.format_size(total_saved)} ({total_percentage:.1f}%)")
+            if skipped > 0:
+                self.update_log(f"⏭️ Đã bỏ qua {skipped} ảnh đã chuyển đổi trước đó")
+            if resumed > 0:
+                self.update_log(f"⏯️ {resumed} ảnh đã xong ở lần chạy bị gián đoạn trước, tiếp tục từ journal")
+            if cache_hits > 0:
+                self.update_log(f"♻️ {cache_hits} ảnh được lấy từ cache thay vì encode lại")
+            stage_summary = self.converter_thread.metrics.stage_summary()
+            if stage_summary:
+                self.update_log(f"⏱️ Thời gian theo bước: {stage_summary}")
+                self.update_log(f"   Báo cáo chi tiết: {DEFAULT_REPORT_PATH}")
             
         QTimer.singleShot(2000, self.clear_memory)
         
@@ -1156,6 +1861,7 @@ class WebPConverterGUI(QMainWindow):
         QTimer.singleShot(2000, self.clear_memory)
         
     def clear_log(self):
+        self.log_buffer.clear()
         self.log_text.clear()
         
     def clear_memory(self):
@@ -1181,7 +1887,10 @@ class WebPConverterGUI(QMainWindow):
                 event.ignore()
                 return
                 
+        self.stop_scan()
+        self.stop_metadata_read()
         self.clear_memory()
+        self.log_buffer.close()
         event.accept()
 
 
@@ -0,0 +1,578 @@
+import argparse
+import os
+import sys
+from pathlib import Path
+
+from webp_core import (ConversionEngine, CONVERT_EXTENSIONS, FORMAT_EXTENSIONS, ENCODER_PRESETS, DEFAULT_PRESET,
+                       DEFAULT_IO_THREADS, default_workers, extensions_for_formats, scan_entries, filter_files,
+                       format_size)
+from webp_progress import ProgressTracker, file_sizes, format_eta, format_progress
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="convert-webp",
+        description="Chuyển đổi ảnh sang WebP không cần giao diện (không dùng PyQt6)",
+    )
+    parser.add_argument("paths", nargs="+",
+                        help="File ảnh, thư mục hoặc archive (.zip, .tar, .tar.gz...) cần chuyển đổi")
+    parser.add_argument("-q", "--quality", type=int, default=85, help="Chất lượng WebP 1-100 (mặc định 85)")
+    parser.add_argument("-w", "--workers", type=int, default=default_workers(),
+                        help="Số tiến trình xử lý (mặc định = số nhân CPU)")
+    parser.add_argument("--io-threads", type=int, default=DEFAULT_IO_THREADS,
+                        help=f"Số luồng đọc trước/ghi song song với encode, 0 = tuần tự như cũ "
+                             f"(mặc định {DEFAULT_IO_THREADS}, tăng lên khi ảnh nằm trên NFS)")
+    parser.add_argument("--preset", choices=sorted(ENCODER_PRESETS), default=DEFAULT_PRESET,
+                        help="Hồ sơ encode: fast (nhanh ~3.5x), balanced (mặc định), smallest (nhỏ nhất, chậm nhất)")
+    parser.add_argument("--method", type=int, choices=range(7), default=None, metavar="0-6",
+                        help="Ghi đè method (effort) của libwebp: 0 nhanh nhất, 6 nén tốt nhất")
+    parser.add_argument("--lossless", action="store_true", help="Encode lossless")
+    parser.add_argument("--alpha-quality", type=int, default=None,
+                        help="Chất lượng kênh alpha 0-100 (mặc định 100)")
+    parser.add_argument("--exact", action="store_true",
+                        help="Giữ nguyên giá trị RGB ở vùng trong suốt (không áp dụng cho ảnh động)")
+    parser.add_argument("--no-animation", action="store_true",
+                        help="Chỉ lấy frame đầu của GIF động thay vì tạo WebP động")
+    parser.add_argument("--no-alpha", action="store_true",
+                        help="Bỏ kênh alpha, chuyển mọi ảnh sang RGB như phiên bản cũ")
+    target_group = parser.add_mutually_exclusive_group()
+    target_group.add_argument("--target-size", type=int, default=0,
+                              help="Tìm quality cao nhất (<= --quality) cho file không vượt quá số KB này")
+    target_group.add_argument("--min-ssim", type=float, default=None,
+                              help="Tìm quality thấp nhất đạt SSIM tối thiểu so với ảnh gốc, ví dụ 0.95")
+    target_group.add_argument("--min-psnr", type=float, default=None,
+                              help="Tìm quality thấp nhất đạt PSNR tối thiểu (dB) so với ảnh gốc, ví dụ 40")
+    parser.add_argument("--max-width", type=int, default=0,
+                        help="Thu nhỏ ảnh rộng hơn giá trị này (px), giải mã JPEG trực tiếp ở kích thước nhỏ")
+    parser.add_argument("--max-height", type=int, default=0,
+                        help="Thu nhỏ ảnh cao hơn giá trị này (px)")
+    parser.add_argument("--memory-budget", type=int, default=None,
+                        help="Tổng bộ nhớ ước tính cho các ảnh đang giải mã song song, tính bằng MB "
+                             "(mặc định 1/2 RAM, 0 = tắt). Ảnh vượt ngân sách được xử lý tuần tự")
+    parser.add_argument("--max-pixels", type=int, default=None,
+                        help="Từ chối ảnh có số pixel lớn hơn giá trị này (chống decompression bomb, mặc định 1 tỷ)")
+    parser.add_argument("--formats", default="jpg,png",
+                        help="Định dạng cần chuyển đổi, phân tách bằng dấu phẩy (mặc định jpg,png)")
+    parser.add_argument("--prefix", default="", help="Chỉ chuyển file có tiền tố này")
+    parser.add_argument("--suffix", default="", help="Chỉ chuyển file có hậu tố này")
+    parser.add_argument("--regex", action="store_true", help="Hiểu prefix/suffix là biểu thức regex")
+    parser.add_argument("--min-dimensions", default=None, metavar="RxC",
+                        help="Chỉ chuyển ảnh có chiều rộng và chiều cao từ mức này trở lên, ví dụ 64x64 để bỏ icon "
+                             "(kích thước đọc từ header, không giải mã)")
+    parser.add_argument("--max-dimensions", default=None, metavar="RxC",
+                        help="Chỉ chuyển ảnh có chiều rộng và chiều cao không vượt quá mức này")
+    parser.add_argument("--min-megapixels", type=float, default=None,
+                        help="Chỉ chuyển ảnh có từ chừng này megapixel trở lên")
+    parser.add_argument("--max-megapixels", type=float, default=None,
+                        help="Chỉ chuyển ảnh có không quá chừng này megapixel")
+    parser.add_argument("--keep-original", action="store_true", help="Giữ lại file gốc")
+    parser.add_argument("--output-root", default=None,
+                        help="Ghi WebP vào cây thư mục riêng (giữ cấu trúc thư mục con) thay vì cạnh file gốc")
+    parser.add_argument("--archive-output", default=None,
+                        help="Archive kết quả khi đầu vào là một archive (mặc định <tên>-webp.<đuôi> cạnh archive gốc; "
+                             "đuôi quyết định định dạng: .zip, .tar, .tar.gz, .tar.xz...)")
+    parser.add_argument("--shard", type=int, choices=range(4), default=0, metavar="0-3",
+                        help="Với --output-root: chia output vào N cấp thư mục con theo hash (256 thư mục mỗi cấp)")
+    parser.add_argument("--manifest", default=None,
+                        help="File manifest lưu trạng thái chuyển đổi (mặc định ~/.convert_webp/manifest.sqlite)")
+    parser.add_argument("--no-manifest", action="store_true",
+                        help="Không dùng manifest, luôn chuyển đổi lại mọi file")
+    parser.add_argument("--scan-index", default=None,
+                        help="Chỉ mục quét: chỉ đọc lại thư mục có mtime thay đổi "
+                             "(mặc định ~/.convert_webp/scan-index.sqlite)")
+    parser.add_argument("--no-scan-index", action="store_true",
+                        help="Không dùng chỉ mục quét, luôn đọc lại toàn bộ cây thư mục")
+    parser.add_argument("--rescan", action="store_true",
+                        help="Đọc lại mọi thư mục và làm mới chỉ mục quét")
+    parser.add_argument("--exclude", action="append", default=[], metavar="MẪU",
+                        help="Bỏ qua file / thư mục theo mẫu kiểu .gitignore (dùng nhiều lần được), ví dụ "
+                             "'cache/' hoặc '/wp-content/backup*/': thư mục bị loại không được quét cả cây con")
+    parser.add_argument("--include", action="append", default=[], metavar="MẪU",
+                        help="Lấy lại file / thư mục đã bị loại (như '!MẪU' trong .gitignore), xét sau --exclude")
+    parser.add_argument("--rules", default=None,
+                        help="File quy tắc kiểu .gitignore (mỗi dòng một mẫu, '!' để lấy lại, '#' là chú thích)")
+    parser.add_argument("--site", default=None,
+                        help="Dùng bộ quy tắc đã lưu cho site này (~/.convert_webp/rules/<site>.rules)")
+    parser.add_argument("--save-rules", default=None, metavar="SITE",
+                        help="Lưu các quy tắc đang dùng (--site, --rules, --exclude, --include) thành bộ quy tắc "
+                             "của site này")
+    parser.add_argument("--hash", action="store_true",
+                        help="Lưu SHA-256 của file gốc để bỏ qua cả khi chỉ mtime thay đổi")
+    parser.add_argument("--journal", default=None,
+                        help="File journal ghi từng bước chuyển đổi để chạy lại tiếp tục đúng chỗ bị dừng "
+                             "(mặc định ~/.convert_webp/journals/<hash thư mục gốc>.jsonl)")
+    parser.add_argument("--no-journal", action="store_true",
+                        help="Không ghi journal, lần chạy bị gián đoạn phải bắt đầu lại từ đầu")
+    parser.add_argument("--cache", action="store_true",
+                        help="Dùng cache kết quả encode theo nội dung file (ảnh trùng lặp chỉ encode một lần)")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Thư mục cache (mặc định ~/.convert_webp/cache)")
+    parser.add_argument("--cache-size", type=int, default=None,
+                        help="Dung lượng tối đa của cache tính bằng MB (mặc định 2048)")
+    parser.add_argument("--cache-link", action="store_true",
+                        help="Tạo hardlink tới file trong cache thay vì copy (tiết kiệm dung lượng, nhưng sửa "
+                             "WebP tại chỗ sẽ sửa luôn bản trong cache dùng cho các ảnh trùng lặp sau)")
+    # Copy đã là mặc định; giữ cờ cũ để script có sẵn không lỗi
+    parser.add_argument("--cache-copy", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--wp-variants", action="store_true",
+                        help="Gom ảnh gốc với các size WordPress (-150x150, -300x200...), giải mã ảnh gốc một lần")
+    parser.add_argument("--wp-metadata", default=None,
+                        help="File JSON chứa danh sách wp_get_attachment_metadata() làm bảng size "
+                             "(đường dẫn 'file' tính từ thư mục đầu tiên trong paths)")
+    parser.add_argument("--report", default=None,
+                        help="Ghi báo cáo JSON: thời gian từng bước (stat/open/decode/encode/write/delete) "
+                             "theo định dạng và nhóm dung lượng")
+    parser.add_argument("--prometheus", default=None,
+                        help="Ghi histogram thời gian từng bước ra file .prom cho node_exporter textfile collector")
+    parser.add_argument("--watch", action="store_true",
+                        help="Sau lượt chuyển đổi đầu, tiếp tục theo dõi thư mục và chuyển đổi ảnh mới upload "
+                             "(inotify trên Linux, polling ở nơi khác)")
+    parser.add_argument("--watch-polling", action="store_true",
+                        help="Dùng polling thay vì inotify (ổ mạng NFS/SMB không phát sự kiện inotify)")
+    parser.add_argument("--watch-interval", type=float, default=30.0,
+                        help="Chu kỳ polling tính bằng giây (mặc định 30)")
+    parser.add_argument("--settle", type=float, default=2.0,
+                        help="Số giây file phải yên (không còn bị ghi) trước khi chuyển đổi (mặc định 2)")
+    parser.add_argument("--batch-size", type=int, default=50,
+                        help="Số ảnh tối đa mỗi lô khi theo dõi thư mục (mặc định 50)")
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ liệt kê file sẽ được chuyển đổi")
+    parser.add_argument("--quiet", action="store_true", help="Chỉ in dòng tổng kết")
+    parser.add_argument("--no-progress", action="store_true",
+                        help="Không hiện dòng tiến trình (file/s, MB/s, thời gian còn lại) trên terminal")
+    return parser
+
+
+def collect_files(paths, index=None, rescan=False, rules=None):
+    # Trả về catalog: path -> entry (có định dạng đọc từ header, xem webp_sniff), theo thứ tự quét
+    from webp_archive import is_archive
+    from webp_sniff import sniff_catalog
+
+    catalog = {}
+    for path in paths:
+        if is_archive(path):
+            # Archive được xử lý riêng, xem convert_archive
+            continue
+        if os.path.isdir(path):
+            entries = scan_entries(path, CONVERT_EXTENSIONS, index, rescan, rules)
+            catalog.update((entry["path"], entry) for entry in entries)
+        else:
+            catalog.update(sniff_catalog([path]))
+    return catalog
+
+
+def parse_formats(parser, value):
+    formats = [fmt.strip().lower() for fmt in value.split(",") if fmt.strip()]
+    formats = ["jpg" if fmt == "jpeg" else "tiff" if fmt == "tif" else fmt for fmt in formats]
+    unknown = [fmt for fmt in formats if fmt not in FORMAT_EXTENSIONS or fmt == "webp"]
+    if unknown:
+        parser.error(f"định dạng không hỗ trợ: {', '.join(unknown)}")
+    return formats
+
+
+def build_rules(parser, args):
+    # Thứ tự: bộ quy tắc của site, file --rules, --exclude rồi --include (quy tắc sau cùng khớp quyết định)
+    from webp_rules import ScanRules, load_rules, save_rules
+
+    rules = ScanRules()
+    if args.site:
+        text = load_rules(args.site)
+        if text is None:
+            parser.error(f"chưa có bộ quy tắc nào được lưu cho site '{args.site}'")
+        for line in text.splitlines():
+            rules.add(line)
+    if args.rules:
+        try:
+            text = Path(args.rules).read_text(encoding="utf-8")
+        except OSError as e:
+            parser.error(f"không đọc được file quy tắc {args.rules}: {e}")
+        for line in text.splitlines():
+            rules.add(line)
+    for pattern in args.exclude:
+        rules.add(pattern)
+    for pattern in args.include:
+        rules.add("!" + pattern)
+    if args.save_rules:
+        try:
+            path = save_rules(args.save_rules, rules.text())
+        except (OSError, ValueError) as e:
+            parser.error(f"không lưu được bộ quy tắc: {e}")
+        print(f"🗂️ Đã lưu bộ quy tắc vào {path}", file=sys.stderr)
+    return rules
+
+
+def parse_dimension_filter(parser, args):
+    from webp_metadata import parse_dimensions
+
+    criteria = {}
+    for option, value, keys in (("--min-dimensions", args.min_dimensions, ("min_width", "min_height")),
+                                ("--max-dimensions", args.max_dimensions, ("max_width", "max_height"))):
+        if value is None:
+            continue
+        size = parse_dimensions(value)
+        if size is None:
+            parser.error(f"{option} phải có dạng RỘNGxCAO, ví dụ 800x600")
+        criteria.update(zip(keys, size))
+    if args.min_megapixels:
+        criteria["min_pixels"] = int(args.min_megapixels * 1_000_000)
+    if args.max_megapixels:
+        criteria["max_pixels"] = int(args.max_megapixels * 1_000_000)
+    return criteria
+
+
+def read_dimensions(entries, index, workers):
+    # Chỉ chạy khi có bộ lọc kích thước; ảnh đã có trong chỉ mục quét không bị đọc lại
+    from webp_metadata import MetadataIndexer
+
+    indexer = MetadataIndexer(workers, index)
+    for _ in indexer.run(entries):
+        pass
+    if indexer.read_count:
+        print(f"📐 Đã đọc kích thước {indexer.read_count} ảnh từ header", file=sys.stderr)
+
+
+def print_collisions(collisions):
+    for output, assigned in collisions:
+        names = ", ".join(f"{Path(path).name} → {Path(planned).name}" for path, planned in assigned)
+        print(f"⚠️ Trùng tên output {output}: {names}", file=sys.stderr)
+
+
+def convert_files(engine, files, args, catalog=None):
+    print_collisions(engine.plan_outputs(files, catalog))
+    sizes = file_sizes(files, catalog)
+    tracker = ProgressTracker(len(files), sum(sizes.values()))
+    # Dòng tiến trình ghi đè tại chỗ trên stderr, chỉ khi là terminal (không làm bẩn log của cron)
+    show_progress = sys.stderr.isatty() and not args.no_progress
+
+    def report_progress(size, worked):
+        progress = tracker.advance(size, worked)
+        if progress is not None and show_progress:
+            sys.stderr.write(f"\r\033[K[{progress['done']}/{progress['total']}] {format_progress(progress)}")
+            sys.stderr.flush()
+
+    def clear_progress():
+        if show_progress:
+            sys.stderr.write("\r\033[K")
+            sys.stderr.flush()
+
+    stats = new_stats(len(files), tracker)
+    try:
+        for file_path, result, error in engine.run(files):
+            if error is not None:
+                stats["errors"] += 1
+                clear_progress()
+                print(f"❌ Lỗi khi xử lý {file_path}: {error}", file=sys.stderr)
+                report_progress(sizes.get(file_path, 0), False)
+                continue
+
+            if result.get("resumed"):
+                stats["resumed"] += 1
+                report_progress(sizes.get(file_path, 0), False)
+                continue
+            if result.get("skipped"):
+                stats["skipped"] += 1
+                report_progress(sizes.get(file_path, 0), False)
+                continue
+
+            if not args.quiet:
+                clear_progress()
+            record_converted(stats, result, args)
+            report_progress(result["original_size"], True)
+    finally:
+        clear_progress()
+    return stats
+
+
+def new_stats(total, tracker):
+    return {
+        "total": total,
+        "processed": 0,
+        "resumed": 0,
+        "cache_hits": 0,
+        "target_missed": 0,
+        "skipped": 0,
+        "errors": 0,
+        "original_size": 0,
+        "converted_size": 0,
+        "tracker": tracker,
+    }
+
+
+def record_converted(stats, result, args):
+    stats["processed"] += 1
+    if result["cache_hit"]:
+        stats["cache_hits"] += 1
+    original_size = result["original_size"]
+    converted_size = result["converted_size"]
+    stats["original_size"] += original_size
+    stats["converted_size"] += converted_size
+
+    if not args.quiet:
+        size_reduction = ((original_size - converted_size) / original_size) * 100
+        quality_note = f", q={result['quality']}" if result["quality"] not in (None, args.quality) else ""
+        print(f"✓ {Path(result['input']).name} → {Path(result['output']).name} "
+              f"({format_size(original_size)} → {format_size(converted_size)}, "
+              f"{-size_reduction:+.1f}%{quality_note})")
+    if result.get("target_met") is False:
+        # Đã hết khoảng quality tìm kiếm: vẫn ghi WebP tốt nhất có được nhưng không báo là đạt mục tiêu
+        stats["target_missed"] += 1
+        print(f"⚠️ {Path(result['input']).name}: không đạt {target_description(args)} "
+              f"(q={result['quality']}, {format_size(converted_size)})", file=sys.stderr)
+
+
+def target_description(args):
+    if args.target_size:
+        return f"--target-size {args.target_size} KB"
+    if args.min_ssim is not None:
+        return f"--min-ssim {args.min_ssim}"
+    return f"--min-psnr {args.min_psnr}"
+
+
+def convert_archive(converter, input_path, output_path, args, stats=None):
+    # Số member chỉ biết khi đọc hết archive (tar.gz đọc kiểu stream): không có dòng tiến trình, chỉ đếm
+    if stats is None:
+        stats = new_stats(0, ProgressTracker(None, 0))
+    if not args.quiet:
+        print(f"📦 {input_path} → {output_path}")
+    try:
+        for name, result, error in converter.run(input_path, output_path):
+            stats["total"] += 1
+            if error is not None:
+                stats["errors"] += 1
+                print(f"❌ Lỗi khi xử lý {input_path}:{name}: {error}", file=sys.stderr)
+                stats["tracker"].advance(0, False)
+                continue
+            if result.get("skipped"):
+                # Symlink/hardlink trong tar không ghi được vào zip
+                stats["skipped"] += 1
+                print(f"⏭️ Bỏ qua {input_path}:{name} (không phải file thường)", file=sys.stderr)
+                stats["tracker"].advance(0, False)
+                continue
+            record_converted(stats, result, args)
+            stats["tracker"].advance(result["original_size"], True)
+    except Exception as e:
+        # Archive hỏng / hết chỗ ghi: archive kết quả dở đã bị xóa, các archive khác vẫn chạy tiếp
+        stats["errors"] += 1
+        print(f"❌ Lỗi khi xử lý archive {input_path}: {e}", file=sys.stderr)
+    return stats
+
+
+def print_summary(stats, metrics):
+    total_original_size = stats["original_size"]
+    total_saved = total_original_size - stats["converted_size"]
+    total_percentage = (total_saved / total_original_size) * 100 if total_original_size > 0 else 0
+    print(f"🎉 Hoàn thành! Đã xử lý {stats['processed']}/{stats['total']} ảnh, "
+          f"bỏ qua: {stats['skipped']}, lỗi: {stats['errors']}")
+    print(f"📊 Tổng kết: Tiết kiệm {format_size(total_saved)} ({total_percentage:.1f}%)")
+    tracker = stats["tracker"]
+    progress = tracker.snapshot()
+    if progress["elapsed"] > 0:
+        print(f"⚡ Trung bình {progress['done'] / progress['elapsed']:.1f} file/s, "
+              f"{format_size(int(tracker.worked_bytes / progress['elapsed']))}/s "
+              f"trong {format_eta(progress['elapsed'])}")
+    if stats["resumed"]:
+        print(f"⏯️ {stats['resumed']} ảnh đã xong ở lần chạy bị gián đoạn trước, tiếp tục từ journal")
+    if stats["cache_hits"]:
+        print(f"♻️ {stats['cache_hits']} ảnh được lấy từ cache thay vì encode lại")
+    if stats["target_missed"]:
+        print(f"⚠️ {stats['target_missed']} ảnh không đạt mục tiêu dung lượng/chất lượng kể cả ở quality giới hạn")
+    stage_summary = metrics.stage_summary()
+    if stage_summary:
+        print(f"⏱️ Thời gian theo bước: {stage_summary}")
+
+
+def watch_folders(engine, args, allowed_extensions, metrics, dimensions=None, rules=None):
+    import signal
+    from webp_watch import watch, create_watcher, InotifyWatcher
+    from webp_sniff import sniff_catalog
+
+    roots = [path for path in args.paths if os.path.isdir(path)]
+    # systemd/docker dừng bằng SIGTERM: dừng êm như Ctrl-C (đóng manifest, cache, journal)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    watcher = create_watcher(roots, allowed_extensions, args.watch_interval, args.watch_polling, rules)
+    mode = "inotify" if isinstance(watcher, InotifyWatcher) else f"polling mỗi {args.watch_interval:g}s"
+    print(f"👀 Đang theo dõi {', '.join(roots)} ({mode}), Ctrl-C để dừng")
+    sys.stdout.flush()
+
+    def handle_batch(batch):
+        catalog = sniff_catalog(batch)
+        files = filter_files(batch, allowed_extensions, args.prefix, args.suffix, args.regex, catalog)
+        if dimensions:
+            read_dimensions([catalog[path] for path in files], None, args.workers)
+            files = filter_files(files, [], catalog=catalog, dimensions=dimensions)
+        if not files:
+            return
+        stats = convert_files(engine, files, args, catalog)
+        if args.prometheus:
+            # Cập nhật textfile sau mỗi lô để dashboard thấy daemon vẫn đang chạy
+            metrics.write_prometheus(args.prometheus)
+        print(f"🎉 Lô {len(files)} ảnh: đã xử lý {stats['processed']}, bỏ qua {stats['skipped']}, "
+              f"lỗi {stats['errors']}")
+        sys.stdout.flush()
+
+    engine.start_pool()
+    try:
+        watch(roots, allowed_extensions, handle_batch, args.settle, args.batch_size, watcher=watcher, rules=rules)
+    finally:
+        engine.shutdown_pool()
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if not 1 <= args.quality <= 100:
+        parser.error("--quality phải nằm trong khoảng 1-100")
+    if args.alpha_quality is not None and not 0 <= args.alpha_quality <= 100:
+        parser.error("--alpha-quality phải nằm trong khoảng 0-100")
+    if args.max_width < 0 or args.max_height < 0:
+        parser.error("--max-width/--max-height không được âm")
+
+    allowed_extensions = extensions_for_formats(parse_formats(parser, args.formats))
+    dimensions = parse_dimension_filter(parser, args)
+    rules = build_rules(parser, args)
+    index = None
+    if not args.no_scan_index and any(os.path.isdir(path) for path in args.paths):
+        from webp_index import ScanIndex
+        index = ScanIndex(args.scan_index)
+    try:
+        catalog = collect_files(args.paths, index, args.rescan, rules)
+        files = filter_files(list(catalog), allowed_extensions, args.prefix, args.suffix, args.regex, catalog)
+        if dimensions:
+            read_dimensions([catalog[path] for path in files], index, args.workers)
+            files = filter_files(files, [], catalog=catalog, dimensions=dimensions)
+    finally:
+        if index is not None:
+            index.close()
+    from webp_archive import is_archive, archive_suffix, default_archive_output
+    archives = [path for path in args.paths if is_archive(path)]
+    if args.archive_output and len(archives) != 1:
+        parser.error("--archive-output chỉ dùng được với đúng một archive đầu vào")
+    if args.archive_output and archive_suffix(args.archive_output) is None:
+        parser.error("--archive-output phải có đuôi .zip, .tar, .tar.gz, .tgz, .tar.bz2 hoặc .tar.xz")
+    archive_outputs = {path: args.archive_output or default_archive_output(path) for path in archives}
+
+    if args.shard and not args.output_root:
+        parser.error("--shard cần --output-root")
+    from webp_output import OutputLayout
+    source_roots = [path if os.path.isdir(path) else os.path.dirname(os.path.abspath(path)) for path in args.paths]
+    output_layout = OutputLayout(args.output_root, source_roots, args.shard)
+
+    if args.dry_run:
+        print_collisions(output_layout.plan(files, catalog))
+        from webp_sniff import is_mislabeled
+        for file_path in files:
+            line = f"{file_path} → {output_layout.output_for(file_path)}" if args.output_root else file_path
+            entry = catalog.get(file_path)
+            if entry is not None and is_mislabeled(entry):
+                line += f" (nội dung là {entry['format'].upper()})"
+            print(line)
+        for archive_path, archive_output in archive_outputs.items():
+            print(f"📦 {archive_path} → {archive_output}")
+        print(f"{len(files)} files sẽ được chuyển đổi" + (f", {len(archives)} archive" if archives else ""))
+        return 0
+
+    if args.watch and not any(os.path.isdir(path) for path in args.paths):
+        parser.error("--watch cần ít nhất một thư mục trong paths")
+    if not files and not archives and not args.watch:
+        print("Không có file nào để chuyển đổi")
+        return 0
+
+    manifest = None
+    if not args.no_manifest:
+        from webp_manifest import ConversionManifest
+        manifest = ConversionManifest(args.manifest, hash_content=args.hash)
+
+    cache = None
+    if args.cache or args.cache_dir or args.cache_size:
+        from webp_cache import EncodeCache, DEFAULT_CACHE_SIZE_MB
+        cache_size = args.cache_size or DEFAULT_CACHE_SIZE_MB
+        cache = EncodeCache(args.cache_dir, cache_size * 1024 * 1024, use_link=args.cache_link)
+
+    encode_options = {
+        "max_width": args.max_width,
+        "max_height": args.max_height,
+        "keep_alpha": not args.no_alpha,
+        "flatten_animation": args.no_animation,
+    }
+    encode_options.update(ENCODER_PRESETS[args.preset])
+    if args.method is not None:
+        encode_options["method"] = args.method
+    if args.lossless:
+        encode_options["lossless"] = True
+    if args.alpha_quality is not None:
+        encode_options["alpha_quality"] = args.alpha_quality
+    if args.exact:
+        encode_options["exact"] = True
+    if args.target_size:
+        encode_options["target_size"] = args.target_size * 1024
+    elif args.min_ssim is not None:
+        encode_options["target_metric"] = "ssim"
+        encode_options["target_value"] = args.min_ssim
+    elif args.min_psnr is not None:
+        encode_options["target_metric"] = "psnr"
+        encode_options["target_value"] = args.min_psnr
+
+    wp_metadata = None
+    if args.wp_metadata:
+        from webp_variants import load_wp_metadata
+        uploads_root = next((path for path in args.paths if os.path.isdir(path)), ".")
+        wp_metadata = load_wp_metadata(args.wp_metadata, uploads_root)
+
+    # Ngưỡng pixel luôn được áp dụng, kể cả khi tắt ngân sách bộ nhớ (--memory-budget 0)
+    from webp_memory import MemoryBudget, DEFAULT_MAX_PIXELS
+    encode_options["max_pixels"] = args.max_pixels or DEFAULT_MAX_PIXELS
+    memory_budget = None
+    if args.memory_budget != 0:
+        budget_bytes = args.memory_budget * 1024 * 1024 if args.memory_budget else None
+        memory_budget = MemoryBudget(budget_bytes, encode_options["max_pixels"])
+
+    journal = None
+    if not args.no_journal:
+        from webp_journal import ConversionJournal
+        journal = ConversionJournal(args.journal, source_roots)
+
+    from webp_metrics import RunMetrics
+    metrics = RunMetrics()
+
+    engine = ConversionEngine(args.quality, args.keep_original, args.workers, manifest, cache, encode_options,
+                              args.wp_variants or wp_metadata is not None, wp_metadata, memory_budget, journal,
+                              metrics, args.io_threads, output_layout)
+    stats = None
+    converter = None
+    try:
+        if files:
+            stats = convert_files(engine, files, args, catalog)
+        if archives:
+            from webp_archive import ArchiveConverter
+            converter = ArchiveConverter(
+                args.quality, args.keep_original, args.workers, encode_options, memory_budget, metrics,
+                lambda name: bool(filter_files([name], allowed_extensions, args.prefix, args.suffix, args.regex)))
+            for archive_path, archive_output in archive_outputs.items():
+                stats = convert_archive(converter, archive_path, archive_output, args, stats)
+        if stats is not None:
+            print_summary(stats, metrics)
+        if args.watch:
+            watch_folders(engine, args, allowed_extensions, metrics, dimensions, rules)
+    except KeyboardInterrupt:
+        engine.stop()
+        if converter is not None:
+            converter.stop()
+        print("⚠️ Quá trình chuyển đổi đã bị dừng", file=sys.stderr)
+        return 0 if args.watch else 130
+    finally:
+        if manifest is not None:
+            manifest.close()
+        if cache is not None:
+            cache.close()
+        if journal is not None:
+            journal.close()
+        if args.report:
+            metrics.write_report(args.report)
+        if args.prometheus:
+            metrics.write_prometheus(args.prometheus)
+
+    return 1 if stats is not None and stats["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,27 @@
+import zipfile
+
+from webp_archive import CONVERT_EXTENSIONS, default_archive_output, plan_names
+
+
+def select(name):
+    return name.lower().endswith(CONVERT_EXTENSIONS)
+
+
+def test_zip_names_follow_extension_priority(tmp_path):
+    archive = tmp_path / "media.zip"
+    with zipfile.ZipFile(archive, "w") as z:
+        for name in ("a/photo.png", "a/readme.txt", "a/photo.jpg", "b/x.webp", "b/x.png"):
+            z.writestr(name, b"")
+
+    reserved, planned = plan_names(str(archive), select)
+    assert planned == {
+        "a/photo.jpg": "a/photo.webp",
+        "a/photo.png": "a/photo.png.webp",
+        "b/x.png": "b/x.png.webp",
+    }
+    assert {"a/readme.txt", "b/x.webp"} <= reserved
+
+
+def test_tar_names_are_assigned_while_streaming(tmp_path):
+    assert plan_names(str(tmp_path / "media.tar.gz"), select) == (set(), {})
+    assert default_archive_output("/backup/media.tar.gz") == "/backup/media-webp.tar.gz"
@@ -0,0 +1,110 @@
+import os
+
+from webp_journal import ConversionJournal, default_journal_path
+
+PARAMS = {"quality": 85}
+
+
+def converted(tmp_path, name="photo.jpg"):
+    source = tmp_path / name
+    source.write_bytes(b"source")
+    output = source.with_suffix(".webp")
+    output.write_bytes(b"webp")
+    return source, output, {
+        "input": str(source),
+        "output": str(output),
+        "original_size": 6,
+        "converted_size": 4,
+        "removed": False,
+        "source_mtime_ns": source.stat().st_mtime_ns,
+    }
+
+
+def interrupted_run(path, result):
+    journal = ConversionJournal(path)
+    journal.open(PARAMS, False)
+    journal.submit(result["input"])
+    journal.written(result)
+    # Không có end(): tiến trình chết giữa chừng
+    journal.close()
+
+
+def test_resume_after_interrupted_run(tmp_path):
+    source, output, result = converted(tmp_path)
+    path = tmp_path / "journal.jsonl"
+    interrupted_run(path, result)
+
+    journal = ConversionJournal(path)
+    assert journal.open(PARAMS, False)
+    resumed = journal.resume_result(str(source), str(output))
+    assert resumed["resumed"] and resumed["skipped"]
+    journal.close()
+
+
+def test_finished_or_changed_config_starts_over(tmp_path):
+    source, output, result = converted(tmp_path)
+    path = tmp_path / "journal.jsonl"
+
+    interrupted_run(path, result)
+    journal = ConversionJournal(path)
+    assert not journal.open({"quality": 70}, False)
+    journal.end()
+    journal.close()
+
+    journal = ConversionJournal(path)
+    assert not journal.open(PARAMS, False)
+    assert journal.resume_result(str(source), str(output)) is None
+    journal.close()
+
+
+def test_untrusted_entries_are_not_resumed(tmp_path):
+    source, output, result = converted(tmp_path)
+    pending, pending_output, _ = converted(tmp_path, "pending.jpg")
+    stale_temp = tmp_path / f".{pending_output.name}.123.tmp"
+    stale_temp.write_bytes(b"partial")
+    path = tmp_path / "journal.jsonl"
+    journal = ConversionJournal(path)
+    journal.open(PARAMS, False)
+    journal.written(result)
+    journal.submit(str(pending))
+    journal.close()
+
+    # Output bị thay sau lần chạy trước
+    output.write_bytes(b"other webp")
+    journal = ConversionJournal(path)
+    assert journal.open(PARAMS, False)
+    assert journal.resume_result(str(source), str(output)) is None
+    # Mới giao cho worker: chuyển đổi lại và dọn file tạm còn sót
+    assert journal.resume_result(str(pending), str(pending_output)) is None
+    assert not stale_temp.exists()
+    journal.close()
+
+
+def test_reopen_does_not_leak_handles(tmp_path):
+    journal = ConversionJournal(tmp_path / "journal.jsonl")
+    journal.open(PARAMS, False)
+    first = journal.file
+    journal.end()
+    journal.open(PARAMS, False)
+    assert first.closed
+    journal.close()
+
+
+def test_concurrent_process_gets_private_journal(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    daemon = ConversionJournal(path)
+    daemon.open(PARAMS, False)
+    cron = ConversionJournal(path)
+    cron.open(PARAMS, True)
+    if os.name == "posix":
+        assert cron.path != path
+        cron.end()
+        cron.close()
+        assert not cron.path.exists()
+    daemon.close()
+
+
+def test_default_path_is_scoped_per_root(tmp_path):
+    a = default_journal_path([str(tmp_path / "a")])
+    assert a == default_journal_path([str(tmp_path / "a") + os.sep + "."])
+    assert a != default_journal_path([str(tmp_path / "b")])
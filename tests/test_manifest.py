@@ -0,0 +1,75 @@
+import os
+
+from webp_core import hash_file
+from webp_manifest import ConversionManifest
+
+PARAMS = {"quality": 85}
+
+
+def record(manifest, source, output):
+    manifest.record({
+        "input": str(source),
+        "output": str(output),
+        "original_size": source.stat().st_size,
+        "converted_size": output.stat().st_size,
+        "source_mtime_ns": source.stat().st_mtime_ns,
+        "source_hash": None,
+    }, PARAMS)
+
+
+def converted(tmp_path, hash_content=False):
+    source = tmp_path / "photo.jpg"
+    source.write_bytes(b"source")
+    output = tmp_path / "photo.webp"
+    output.write_bytes(b"webp")
+    manifest = ConversionManifest(tmp_path / "manifest.sqlite", hash_content)
+    return manifest, source, output
+
+
+def test_unchanged_file_is_skipped(tmp_path):
+    manifest, source, output = converted(tmp_path)
+    record(manifest, source, output)
+    skipped = manifest.current_result(str(source), PARAMS, str(output))
+    assert skipped["skipped"] and skipped["output"] == str(output)
+    manifest.close()
+
+
+def test_changes_force_reconversion(tmp_path):
+    manifest, source, output = converted(tmp_path)
+    record(manifest, source, output)
+    assert manifest.current_result(str(source), {"quality": 70}) is None
+    assert manifest.current_result(str(source), PARAMS, str(tmp_path / "out" / "photo.webp")) is None
+
+    output.write_bytes(b"resized webp")
+    assert manifest.current_result(str(source), PARAMS) is None
+
+    output.write_bytes(b"webp")
+    stat = source.stat()
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert manifest.current_result(str(source), PARAMS) is None
+    manifest.close()
+
+
+def test_touched_file_with_same_hash_is_skipped(tmp_path):
+    manifest, source, output = converted(tmp_path, hash_content=True)
+    manifest.record({
+        "input": str(source),
+        "output": str(output),
+        "original_size": source.stat().st_size,
+        "converted_size": output.stat().st_size,
+        "source_mtime_ns": source.stat().st_mtime_ns,
+        "source_hash": hash_file(source),
+    }, PARAMS)
+    stat = source.stat()
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert manifest.current_result(str(source), PARAMS) is not None
+    assert manifest.lookup(str(source))[1] == source.stat().st_mtime_ns
+    manifest.close()
+
+
+def test_output_owner(tmp_path):
+    manifest, source, output = converted(tmp_path)
+    assert manifest.output_owner(str(output)) is None
+    record(manifest, source, output)
+    assert manifest.output_owner(str(output)) == str(source)
+    manifest.close()
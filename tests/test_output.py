@@ -0,0 +1,78 @@
+import os
+
+from webp_output import MAP_FILENAME, OutputLayout
+
+
+def paths(tmp_path, *names):
+    return [str(tmp_path / name) for name in names]
+
+
+def test_default_output_next_to_source(tmp_path):
+    layout = OutputLayout()
+    source, = paths(tmp_path, "photo.jpg")
+    assert layout.plan([source]) == []
+    assert layout.output_for(source) == str(tmp_path / "photo.webp")
+
+
+def test_collision_prefers_jpg_in_any_order(tmp_path):
+    jpg, png = paths(tmp_path, "photo.jpg", "photo.png")
+    for files in ([jpg, png], [png, jpg]):
+        layout = OutputLayout()
+        collisions = layout.plan(files)
+        assert layout.output_for(jpg) == str(tmp_path / "photo.webp")
+        assert layout.output_for(png) == str(tmp_path / "photo.png.webp")
+        assert [output for output, _ in collisions] == [str(tmp_path / "photo.webp")]
+
+
+def test_alternative_does_not_take_another_default(tmp_path):
+    # photo.png.jpg có output mặc định photo.png.webp, cũng là tên thay thế đầu tiên của photo.png
+    jpg, png, double = paths(tmp_path, "photo.jpg", "photo.png", "photo.png.jpg")
+    layout = OutputLayout()
+    layout.plan([png, jpg, double])
+    assert layout.output_for(double) == str(tmp_path / "photo.png.webp")
+    assert layout.output_for(png) not in (layout.output_for(jpg), layout.output_for(double))
+
+
+def test_output_root_mirrors_tree_and_keeps_names(tmp_path):
+    source_root = tmp_path / "src"
+    output_root = tmp_path / "out"
+    jpg, png = str(source_root / "2024" / "photo.jpg"), str(source_root / "2024" / "photo.png")
+    layout = OutputLayout(output_root, [source_root])
+    layout.plan([png])
+    layout.prepare()
+    assert layout.output_for(png) == str(output_root / "2024" / "photo.webp")
+    assert (output_root / MAP_FILENAME).exists()
+
+    # Lần chạy sau: photo.png giữ tên đã cấp, photo.jpg mới đến phải nhường
+    layout = OutputLayout(output_root, [source_root])
+    layout.plan([jpg, png])
+    assert layout.output_for(png) == str(output_root / "2024" / "photo.webp")
+    assert layout.output_for(jpg) == str(output_root / "2024" / "photo.jpg.webp")
+
+
+def test_shard_levels(tmp_path):
+    source_root = tmp_path / "src"
+    layout = OutputLayout(tmp_path / "out", [source_root], shard_levels=2)
+    source = str(source_root / "a" / "photo.jpg")
+    layout.plan([source])
+    relative = os.path.relpath(layout.output_for(source), tmp_path / "out").split(os.sep)
+    assert len(relative) == 3 and all(len(part) == 2 for part in relative[:2])
+    assert relative[2] == "photo.webp"
+
+
+def test_in_place_respects_owner_on_disk(tmp_path):
+    jpg, png = paths(tmp_path, "photo.jpg", "photo.png")
+    (tmp_path / "photo.webp").write_bytes(b"webp of photo.jpg")
+    owners = {str(tmp_path / "photo.webp"): jpg}
+
+    # photo.jpg đã bị xóa sau lần chuyển đổi trước: photo.png vẫn không được ghi đè WebP của nó
+    layout = OutputLayout(owner_of=owners.get)
+    layout.plan([png])
+    assert layout.output_for(png) == str(tmp_path / "photo.png.webp")
+
+    # Chủ sở hữu giữ tên của mình, kể cả khi định dạng ưu tiên thấp hơn
+    owners[str(tmp_path / "photo.webp")] = png
+    layout = OutputLayout(owner_of=owners.get)
+    layout.plan([jpg, png])
+    assert layout.output_for(png) == str(tmp_path / "photo.webp")
+    assert layout.output_for(jpg) == str(tmp_path / "photo.jpg.webp")
@@ -0,0 +1,48 @@
+import io
+
+import pytest
+
+from webp_quality import SEARCH_MIN_QUALITY, encode_to_target, search_quality
+
+
+def fake_encode(img, quality, options):
+    # Dung lượng tăng đều theo quality, đủ để kiểm tra biên tìm kiếm mà không cần encode thật
+    return b"x" * (quality * 100)
+
+
+@pytest.mark.parametrize("hint", [None, 20, 37, 50, 51, 85])
+def test_search_quality_finds_lowest_passing(hint):
+    assert search_quality(lambda q: q >= 51, SEARCH_MIN_QUALITY, 85, hint) == 51
+
+
+def test_search_quality_none_when_nothing_passes():
+    assert search_quality(lambda q: False, SEARCH_MIN_QUALITY, 85) is None
+
+
+def test_target_size_picks_highest_quality_under_budget():
+    data, quality, target_met = encode_to_target(None, {"quality": 85, "target_size": 5000}, fake_encode)
+    assert (quality, len(data), target_met) == (50, 5000, True)
+
+
+def test_target_size_keeps_max_quality_when_it_fits():
+    data, quality, target_met = encode_to_target(None, {"quality": 85, "target_size": 10 ** 6}, fake_encode)
+    assert (quality, target_met) == (85, True)
+
+
+def test_target_size_unreachable_is_reported():
+    data, quality, target_met = encode_to_target(None, {"quality": 85, "target_size": 1000}, fake_encode)
+    assert quality == SEARCH_MIN_QUALITY
+    assert len(data) > 1000
+    assert target_met is False
+
+
+def test_metric_unreachable_is_reported():
+    Image = pytest.importorskip("PIL.Image")
+    from webp_core import encode_webp
+
+    img = Image.effect_noise((64, 64), 64).convert("RGB")
+    options = {"quality": 60, "target_metric": "psnr", "target_value": 99}
+    data, quality, target_met = encode_to_target(img, options, encode_webp)
+    assert (quality, target_met) == (60, False)
+    with Image.open(io.BytesIO(data)) as encoded:
+        assert encoded.size == img.size
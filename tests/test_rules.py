@@ -0,0 +1,52 @@
+from webp_rules import ScanRules, prune_walk
+
+
+def test_unanchored_directory_rule():
+    rules = ScanRules.from_text("cache/\n")
+    assert rules.excluded("cache", True)
+    assert rules.excluded("wp-content/cache", True)
+    # Chỉ thư mục: file tên cache không bị loại
+    assert not rules.excluded("cache")
+
+
+def test_anchored_rule_only_matches_from_root():
+    rules = ScanRules.from_text("/uploads/tmp\n")
+    assert rules.excluded("uploads/tmp", True)
+    assert not rules.excluded("site/uploads/tmp", True)
+
+
+def test_last_matching_rule_wins_and_negation():
+    rules = ScanRules.from_text("*.png\n!keep.png\n")
+    assert rules.excluded("a/photo.png")
+    assert not rules.excluded("a/keep.png")
+    assert not rules.excluded("a/photo.jpg")
+
+
+def test_double_star_and_character_class():
+    rules = ScanRules.from_text("backup*/\nsizes/**/thumb-[0-9].jpg\n")
+    assert rules.excluded("backup-2024", True)
+    assert rules.excluded("sizes/a/b/thumb-3.jpg")
+    assert rules.excluded("sizes/thumb-3.jpg")
+    assert not rules.excluded("sizes/thumb-x.jpg")
+
+
+def test_comments_blank_lines_and_escapes():
+    rules = ScanRules.from_text("# chú thích\n\n\\#hash.jpg\n")
+    assert len(rules.rules) == 1
+    assert rules.excluded("#hash.jpg")
+    assert not ScanRules.from_text("# chỉ chú thích\n")
+
+
+def test_excluded_parent_excludes_path():
+    rules = ScanRules.from_text("node_modules/\n!node_modules/keep.png\n")
+    # Như git: thư mục cha đã bị loại thì không lấy lại được file bên trong
+    assert rules.excludes_path("node_modules/keep.png")
+    assert not rules.excludes_path("src/keep.png")
+
+
+def test_prune_walk_removes_excluded_directories(tmp_path):
+    rules = ScanRules.from_text("cache/\n*.tmp\n")
+    dirnames = ["cache", "2024"]
+    files = prune_walk(rules, str(tmp_path), str(tmp_path / "uploads"), dirnames, ["a.jpg", "b.tmp"])
+    assert dirnames == ["2024"]
+    assert files == ["a.jpg"]
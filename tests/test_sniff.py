@@ -0,0 +1,47 @@
+import pytest
+
+from webp_core import filter_files
+from webp_sniff import UNKNOWN_FORMAT, format_extension, is_mislabeled, should_sniff, sniff_bytes, sniff_catalog
+
+
+@pytest.mark.parametrize("header, expected", [
+    (b"\xff\xd8\xff\xe0" + b"\0" * 12, "jpg"),
+    (b"\x89PNG\r\n\x1a\n" + b"\0" * 8, "png"),
+    (b"GIF89a" + b"\0" * 10, "gif"),
+    (b"RIFF\x10\0\0\0WEBPVP8 ", "webp"),
+    (b"II*\x00" + b"\0" * 12, "tiff"),
+    (b"BM\x36\0\0\0\0\0\0\0" + b"\0" * 6, "bmp"),
+    (b"<?php echo 1; ?>", UNKNOWN_FORMAT),
+])
+def test_sniff_bytes(header, expected):
+    assert sniff_bytes(header) == expected
+
+
+def test_should_sniff_only_images_and_extensionless():
+    assert should_sniff("/a/photo.JPG")
+    assert should_sniff("/a/photo")
+    assert should_sniff("/a/.hidden")
+    assert not should_sniff("/a/style.css")
+
+
+def test_mislabeled_entry_uses_real_extension():
+    entry = {"path": "/a/photo.jpg", "format": "png"}
+    assert is_mislabeled(entry)
+    assert format_extension(entry, ".jpg") == ".png"
+    # File .webp luôn giữ đuôi, kể cả khi nội dung là JPEG
+    assert format_extension({"path": "/a/photo.webp", "format": "jpg"}, ".webp") == ".webp"
+    assert not is_mislabeled({"path": "/a/photo.jpeg", "format": "jpg"})
+
+
+def test_filter_files_by_content(tmp_path):
+    png_as_jpg = tmp_path / "photo.jpg"
+    png_as_jpg.write_bytes(b"\x89PNG\r\n\x1a\n" + b"\0" * 8)
+    no_suffix = tmp_path / "upload"
+    no_suffix.write_bytes(b"\xff\xd8\xff\xe0" + b"\0" * 12)
+    files = [str(png_as_jpg), str(no_suffix)]
+    catalog = sniff_catalog(files)
+
+    assert filter_files(files, [".png"], catalog=catalog) == [str(png_as_jpg)]
+    assert filter_files(files, [".jpg"], catalog=catalog) == [str(no_suffix)]
+    # Tab xóa: file đặt sai đuôi bị loại hẳn
+    assert filter_files(files, [".jpg", ".png"], catalog=catalog, strict=True) == []
@@ -0,0 +1,372 @@
+import io
+import itertools
+import os
+import posixpath
+import shutil
+import tarfile
+import time
+import zipfile
+from pathlib import Path
+
+from webp_core import CONVERT_EXTENSIONS, apply_pixel_limit, default_workers, encode_image, stage, temp_path
+from webp_output import extension_priority
+
+
+# Đuôi -> chế độ ghi tarfile. Ghi kiểu stream ("w|"), đọc kiểu stream ("r|*"): không bao giờ seek lại
+TAR_SUFFIXES = {
+    ".tar": "w|",
+    ".tar.gz": "w|gz",
+    ".tgz": "w|gz",
+    ".tar.bz2": "w|bz2",
+    ".tbz2": "w|bz2",
+    ".tar.xz": "w|xz",
+    ".txz": "w|xz",
+}
+ARCHIVE_SUFFIXES = (".zip",) + tuple(TAR_SUFFIXES)
+
+COPY_CHUNK = 1024 * 1024
+
+# Không nén lại những gì vốn đã nén: zip chỉ deflate các file khác
+STORED_EXTENSIONS = (".webp",) + CONVERT_EXTENSIONS
+
+
+def archive_suffix(path):
+    name = str(path).lower()
+    return next((suffix for suffix in sorted(ARCHIVE_SUFFIXES, key=len, reverse=True) if name.endswith(suffix)),
+                None)
+
+
+def is_archive(path):
+    return archive_suffix(path) is not None and os.path.isfile(path)
+
+
+def default_archive_output(path):
+    # backup.tar.gz -> backup-webp.tar.gz, cùng thư mục
+    suffix = archive_suffix(path)
+    name = os.path.basename(path)
+    return os.path.join(os.path.dirname(path), name[:len(name) - len(suffix)] + "-webp" + suffix)
+
+
+def webp_name(name):
+    return posixpath.splitext(name)[0] + ".webp"
+
+
+def output_candidates(source_name):
+    # photo.jpg và photo.png cùng thư mục: ảnh nhường tên thành photo.png.webp (tên gốc + .webp)
+    stem = posixpath.splitext(source_name)[0]
+    return itertools.chain((webp_name(source_name), source_name + ".webp"),
+                           (f"{stem}-{index}.webp" for index in itertools.count(2)))
+
+
+def zip_time(mtime):
+    # zip chỉ lưu được từ 1980
+    return time.localtime(max(mtime, 315532800))[:6]
+
+
+def iter_entries(path):
+    # Mỗi entry chỉ dùng được trong lúc đang lặp tới nó: tar đọc kiểu stream, không quay lại được
+    if archive_suffix(path) == ".zip":
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                yield {
+                    "name": info.filename.rstrip("/") if info.is_dir() else info.filename,
+                    "size": info.file_size,
+                    "mtime": time.mktime(info.date_time + (0, 0, -1)),
+                    "mode": (info.external_attr >> 16) & 0o7777 or (0o755 if info.is_dir() else 0o644),
+                    "type": "dir" if info.is_dir() else "file",
+                    "open": lambda info=info: archive.open(info),
+                    "tarinfo": None,
+                }
+        return
+
+    with tarfile.open(path, "r|*") as archive:
+        for member in archive:
+            yield {
+                "name": member.name,
+                "size": member.size,
+                "mtime": member.mtime,
+                "mode": member.mode,
+                "type": "file" if member.isfile() else "dir" if member.isdir() else "other",
+                "open": lambda member=member: archive.extractfile(member),
+                "tarinfo": member,
+            }
+
+
+def plan_names(path, select):
+    # Trả về (tên không được chiếm, member ảnh -> tên output).
+    # zip có sẵn danh sách member: cấp tên trước khi encode theo đúng quy tắc của chế độ thư mục (photo.jpg giữ
+    # photo.webp, photo.png thành photo.png.webp), không phụ thuộc ảnh nào encode xong trước; tên file không
+    # phải ảnh (ví dụ photo.webp có sẵn) không bị output chiếm.
+    # tar đọc kiểu stream nên tên được cấp theo thứ tự member lúc giao cho worker.
+    if archive_suffix(path) != ".zip":
+        return set(), {}
+    with zipfile.ZipFile(path) as archive:
+        names = [name for name in archive.namelist() if not name.endswith("/")]
+    taken = {name for name in names if not select(name)}
+    reserved = set(taken)
+    groups = {}
+    for name in names:
+        if select(name):
+            groups.setdefault(webp_name(name), []).append(name)
+
+    # Lượt 1 cấp tên mặc định, lượt 2 mới cấp tên thay thế (như OutputLayout.plan)
+    planned = {}
+    losers = []
+    for output, members in groups.items():
+        members.sort(key=lambda name: (extension_priority(name), name))
+        start = 0
+        if output not in taken:
+            planned[members[0]] = output
+            taken.add(output)
+            start = 1
+        losers.extend(members[start:])
+    for name in losers:
+        if name in planned:
+            # Tên member trùng lặp trong zip: bản sau được cấp tên lúc giao cho worker
+            continue
+        planned[name] = next(candidate for candidate in output_candidates(name) if candidate not in taken)
+        taken.add(planned[name])
+    return reserved | set(planned.values()), planned
+
+
+class ArchiveWriter:
+    # Ghi vào file tạm cùng thư mục, chỉ rename thành output khi commit(): dừng giữa chừng không để lại archive dở
+    def __init__(self, path):
+        self.path = Path(path)
+        self.tmp_path = temp_path(self.path)
+        self.file = open(self.tmp_path, "wb")
+        self.names = set()
+
+    def output_name(self, source_name, reserved=()):
+        # Giữ tên ngay khi cấp (lúc giao cho worker), trước khi ảnh được ghi
+        name = next(name for name in output_candidates(source_name) if name not in self.names and name not in reserved)
+        self.names.add(name)
+        return name
+
+    def add(self, name, fileobj, size, entry):
+        # entry: member gốc, lấy mtime/quyền (và chủ sở hữu với tar) cho member mới
+        self.names.add(name)
+        self.write(name, fileobj, size, entry)
+
+    def commit(self):
+        self.close_archive()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        try:
+            self.close_archive()
+        except Exception:
+            pass
+        self.file.close()
+        self.tmp_path.unlink(missing_ok=True)
+
+
+class ZipWriter(ArchiveWriter):
+    def __init__(self, path):
+        super().__init__(path)
+        self.archive = zipfile.ZipFile(self.file, "w")
+
+    def write(self, name, fileobj, size, entry):
+        info = zipfile.ZipInfo(name, date_time=zip_time(entry["mtime"]))
+        info.file_size = size
+        stored = posixpath.splitext(name)[1].lower() in STORED_EXTENSIONS
+        info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+        info.external_attr = (0o100000 | entry["mode"]) << 16
+        with self.archive.open(info, "w") as dest:
+            shutil.copyfileobj(fileobj, dest, COPY_CHUNK)
+
+    def add_dir(self, entry):
+        info = zipfile.ZipInfo(entry["name"] + "/", date_time=zip_time(entry["mtime"]))
+        info.external_attr = ((0o040000 | entry["mode"]) << 16) | 0x10
+        self.archive.writestr(info, b"")
+
+    def add_other(self, entry):
+        # Symlink, hardlink, thiết bị trong tar không biểu diễn được trong zip
+        return False
+
+    def close_archive(self):
+        self.archive.close()
+
+
+class TarWriter(ArchiveWriter):
+    def __init__(self, path, mode):
+        super().__init__(path)
+        self.archive = tarfile.open(fileobj=self.file, mode=mode)
+
+    def write(self, name, fileobj, size, entry):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = entry["mtime"]
+        info.mode = entry["mode"]
+        if entry["tarinfo"] is not None:
+            source = entry["tarinfo"]
+            info.uid, info.gid, info.uname, info.gname = source.uid, source.gid, source.uname, source.gname
+        self.archive.addfile(info, fileobj)
+
+    def add_dir(self, entry):
+        info = entry["tarinfo"] or tarfile.TarInfo(entry["name"])
+        info.type = tarfile.DIRTYPE
+        info.mtime = entry["mtime"]
+        info.mode = entry["mode"]
+        self.archive.addfile(info)
+
+    def add_other(self, entry):
+        self.archive.addfile(entry["tarinfo"])
+        return True
+
+    def close_archive(self):
+        self.archive.close()
+
+
+def open_writer(path):
+    suffix = archive_suffix(path)
+    if suffix == ".zip":
+        return ZipWriter(path)
+    if suffix in TAR_SUFFIXES:
+        return TarWriter(path, TAR_SUFFIXES[suffix])
+    raise ValueError(f"Không hỗ trợ định dạng archive: {path}")
+
+
+def convert_member(data, options):
+    # Chạy trong worker: giải mã thẳng từ bytes của member, không giải nén ra đĩa
+    if options.get("max_pixels"):
+        apply_pixel_limit(options["max_pixels"])
+    timings = {}
+    webp_data, quality, target_met = encode_image(io.BytesIO(data), options, timings)
+    return webp_data, quality, target_met, timings
+
+
+class ArchiveConverter:
+    def __init__(self, quality, keep_original, workers=None, encode_options=None, memory_budget=None,
+                 metrics=None, select=None):
+        self.options = {"quality": quality, "keep_original": keep_original}
+        self.options.update(encode_options or {})
+        if memory_budget is not None:
+            self.options.setdefault("max_pixels", memory_budget.max_pixels)
+        self.keep_original = keep_original
+        self.workers = max(1, workers or default_workers())
+        self.memory_budget = memory_budget
+        self.metrics = metrics
+        # select(tên member) -> có chuyển đổi member này không
+        self.select = select or (lambda name: posixpath.splitext(name)[1].lower() in CONVERT_EXTENSIONS)
+        self.is_running = True
+
+    def run(self, input_path, output_path):
+        from concurrent.futures import ProcessPoolExecutor
+        from PIL import Image
+
+        # Bộ nhớ có giới hạn: tối đa 2 x workers ảnh (bytes nén + ước tính giải mã theo ngân sách) cùng lúc.
+        # Member không phải ảnh được copy theo từng khối 1 MB.
+        max_pending = self.workers * 2
+        reserved, planned = plan_names(input_path, self.select)
+        writer = open_writer(output_path)
+        # Theo thứ tự giao cho worker: ảnh được ghi vào archive mới theo thứ tự member gốc
+        pending = {}
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                try:
+                    for entry in iter_entries(input_path):
+                        if not self.is_running:
+                            break
+                        if entry["type"] == "dir":
+                            writer.add_dir(entry)
+                            continue
+                        if entry["type"] != "file":
+                            if not writer.add_other(entry):
+                                yield entry["name"], {"input": entry["name"], "skipped": True}, None
+                            continue
+                        if not self.select(entry["name"]):
+                            with entry["open"]() as source:
+                                writer.add(entry["name"], source, entry["size"], entry)
+                            continue
+
+                        timings = {}
+                        with stage(timings, "read"):
+                            with entry["open"]() as source:
+                                data = source.read()
+                        try:
+                            estimate = self.estimate(entry["name"], data)
+                        except Image.DecompressionBombError as e:
+                            # Quá ngưỡng pixel: không giải mã, giữ nguyên member gốc trong archive mới
+                            writer.add(entry["name"], io.BytesIO(data), len(data), entry)
+                            if self.metrics is not None:
+                                self.metrics.record_error()
+                            yield entry["name"], None, e
+                            continue
+                        while pending and (len(pending) >= max_pending or
+                                           (self.memory_budget is not None and
+                                            not self.memory_budget.can_admit(estimate))):
+                            yield from self.collect(pending, writer)
+                        if self.memory_budget is not None:
+                            self.memory_budget.acquire(estimate)
+                        output_name = planned.pop(entry["name"], None) or writer.output_name(entry["name"], reserved)
+                        future = executor.submit(convert_member, data, self.options)
+                        pending[future] = (entry, output_name, data, estimate, timings)
+
+                    while pending and self.is_running:
+                        yield from self.collect(pending, writer)
+                finally:
+                    # Dừng / lỗi: không chờ các ảnh chưa bắt đầu encode
+                    for future in pending:
+                        future.cancel()
+            if self.is_running:
+                writer.commit()
+            else:
+                writer.abort()
+        except BaseException:
+            writer.abort()
+            raise
+        finally:
+            if self.metrics is not None:
+                self.metrics.finish()
+
+    def estimate(self, name, data):
+        # Header không đọc được thì ước tính 0 (worker sẽ báo lỗi); quá ngưỡng pixel thì DecompressionBombError.
+        # Không để worker tự phát hiện: Pillow chỉ báo lỗi từ 2 x MAX_IMAGE_PIXELS, dưới đó chỉ cảnh báo.
+        if self.memory_budget is None:
+            return 0
+        return self.memory_budget.estimate(name, self.options, io.BytesIO(data))
+
+    def collect(self, pending, writer):
+        # Luôn chờ ảnh được giao sớm nhất (các worker khác vẫn encode tiếp): archive mới có cùng thứ tự member
+        # ở mọi lần chạy, không phụ thuộc ảnh nào encode xong trước
+        future = next(iter(pending))
+        entry, output_name, data, estimate, timings = pending.pop(future)
+        try:
+            webp_data, quality, target_met, worker_timings = future.result()
+        except Exception as e:
+            # Không chuyển đổi được: giữ nguyên ảnh gốc trong archive mới để không mất dữ liệu
+            writer.add(entry["name"], io.BytesIO(data), len(data), entry)
+            if self.metrics is not None:
+                self.metrics.record_error()
+            yield entry["name"], None, e
+            return
+        finally:
+            if self.memory_budget is not None:
+                self.memory_budget.release(estimate)
+
+        timings.update(worker_timings)
+        with stage(timings, "write"):
+            writer.add(output_name, io.BytesIO(webp_data), len(webp_data), entry)
+            if self.keep_original:
+                writer.add(entry["name"], io.BytesIO(data), len(data), entry)
+        result = {
+            "input": entry["name"],
+            "output": output_name,
+            "original_size": len(data),
+            "converted_size": len(webp_data),
+            "removed": not self.keep_original,
+            "cache_hit": False,
+            "quality": quality,
+            "target_met": target_met,
+            "timings": timings,
+        }
+        if self.metrics is not None:
+            self.metrics.record(result)
+        yield entry["name"], result, None
+
+    def stop(self):
+        self.is_running = False
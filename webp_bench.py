@@ -0,0 +1,387 @@
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from webp_core import (ConversionEngine, CONVERT_EXTENSIONS, default_workers, scan_folder, filter_files,
+                       delete_file, format_size)
+
+
+CORPUS_INFO = "corpus.json"
+DEFAULT_RESULTS_DIR = "bench-results"
+
+CORPUS_SIZES = {
+    "small": (320, 240),
+    "medium": (1280, 960),
+    "large": (3000, 2000),
+}
+SIZE_WEIGHTS = {"small": 0.5, "medium": 0.4, "large": 0.1}
+FORMAT_WEIGHTS = {"jpg": 0.6, "png": 0.25, "gif": 0.1, "tiff": 0.05}
+
+# Mỗi (định dạng, kích thước) chỉ render vài ảnh mẫu rồi ghi lặp lại: tạo 1 triệu file mất vài phút thay vì vài giờ
+TEMPLATE_VARIANTS = 4
+
+# Tên file giống thư viện media thật, để bộ lọc prefix/suffix/regex có cái để khớp
+NAME_PATTERNS = (
+    ("IMG_{index:06d}", 0.4),
+    ("photo-{index}", 0.3),
+    ("photo-{index}-300x200", 0.15),
+    ("banner_{index}", 0.15),
+)
+
+FILTER_CASES = {
+    "extensions": {"allowed_extensions": [".jpg", ".jpeg", ".png"], "prefix": "", "suffix": "", "use_regex": False},
+    "prefix": {"allowed_extensions": [], "prefix": "IMG_", "suffix": "", "use_regex": False},
+    "regex": {"allowed_extensions": [], "prefix": "", "suffix": r"-\d+x\d+", "use_regex": True},
+}
+
+
+def weighted_choice(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def render_template(fmt, size, variant):
+    from PIL import Image, ImageDraw
+
+    width, height = CORPUS_SIZES[size]
+    rng = random.Random(f"{fmt}-{size}-{variant}")
+    if variant % 2 == 0:
+        # Ảnh kiểu ảnh chụp: nhiễu + dải màu, khó nén
+        img = Image.merge("RGB", [Image.effect_noise((width, height), rng.randint(20, 60)) for _ in range(3)])
+        img = Image.blend(img, Image.linear_gradient("L").resize((width, height)).convert("RGB"), 0.5)
+    else:
+        # Ảnh kiểu đồ họa: nền phẳng và hình khối, nén tốt
+        img = Image.new("RGB", (width, height), tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(img)
+        for _ in range(12):
+            x0, y0 = rng.randrange(width), rng.randrange(height)
+            x1, y1 = min(width, x0 + rng.randrange(1, width // 2)), min(height, y0 + rng.randrange(1, height // 2))
+            draw.rectangle((x0, y0, x1, y1), fill=tuple(rng.randrange(256) for _ in range(3)))
+
+    buffer = io.BytesIO()
+    if fmt == "jpg":
+        img.save(buffer, "JPEG", quality=90)
+    elif fmt == "png":
+        if variant % 4 == 3:
+            img = img.convert("RGBA")
+            img.putalpha(Image.linear_gradient("L").resize((width, height)))
+        img.save(buffer, "PNG")
+    elif fmt == "gif":
+        frames = [img.convert("P", palette=Image.Palette.ADAPTIVE)]
+        if variant % 4 == 1:
+            # Một phần GIF là ảnh động để đo cả đường animation
+            frames += [img.rotate(angle).convert("P", palette=Image.Palette.ADAPTIVE) for angle in (90, 180)]
+        frames[0].save(buffer, "GIF", save_all=len(frames) > 1, append_images=frames[1:], duration=100, loop=0)
+    else:
+        img.save(buffer, "TIFF")
+    return buffer.getvalue()
+
+
+def generate_corpus(root, file_count, depth=2, fanout=8, sizes=None, formats=None, seed=1):
+    rng = random.Random(seed)
+    root = Path(root)
+    size_weights = {name: SIZE_WEIGHTS[name] for name in (sizes or SIZE_WEIGHTS)}
+    format_weights = {name: FORMAT_WEIGHTS[name] for name in (formats or FORMAT_WEIGHTS)}
+    name_weights = dict(NAME_PATTERNS)
+    templates = {}
+    total_bytes = 0
+
+    leaf_count = fanout ** depth
+    for index in range(file_count):
+        leaf = index % leaf_count
+        parts = []
+        for _ in range(depth):
+            parts.append(f"d{leaf % fanout:02d}")
+            leaf //= fanout
+        directory = root.joinpath(*parts)
+        if index < leaf_count:
+            directory.mkdir(parents=True, exist_ok=True)
+
+        fmt = weighted_choice(rng, format_weights)
+        size = weighted_choice(rng, size_weights)
+        variant = rng.randrange(TEMPLATE_VARIANTS)
+        key = (fmt, size, variant)
+        if key not in templates:
+            templates[key] = render_template(fmt, size, variant)
+        data = templates[key]
+
+        name = weighted_choice(rng, name_weights).format(index=index)
+        (directory / f"{name}.{fmt}").write_bytes(data)
+        total_bytes += len(data)
+
+    info = {
+        "files": file_count,
+        "bytes": total_bytes,
+        "depth": depth,
+        "fanout": fanout,
+        "sizes": list(size_weights),
+        "formats": list(format_weights),
+        "seed": seed,
+    }
+    (root / CORPUS_INFO).write_text(json.dumps(info, indent=2), encoding="utf-8")
+    return info
+
+
+def timed(func, repeat):
+    # Lần đầu có thể chạy với cache filesystem còn lạnh: giữ cả min lẫn median
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        durations.append(time.perf_counter() - start)
+    return result, {"min": min(durations), "median": statistics.median(durations), "runs": durations}
+
+
+def rate_entry(count, seconds, **extra):
+    entry = {"count": count, "seconds": seconds, "per_second": count / seconds if seconds > 0 else 0.0}
+    entry.update(extra)
+    return entry
+
+
+def bench_scan(corpus, repeat):
+    files, timing = timed(lambda: scan_folder(str(corpus), CONVERT_EXTENSIONS), repeat)
+    return files, rate_entry(len(files), timing["min"], timing=timing)
+
+
+def bench_filter(files, repeat):
+    results = {}
+    for name, case in FILTER_CASES.items():
+        selected, timing = timed(lambda: filter_files(files, case["allowed_extensions"], case["prefix"],
+                                                      case["suffix"], case["use_regex"]), repeat)
+        results[name] = rate_entry(len(files), timing["min"], selected=len(selected), timing=timing)
+    return results
+
+
+def bench_preview(files, limit):
+    # Bảng preview là widget Qt: chỉ đo được khi có PyQt6, chạy offscreen không cần màn hình
+    try:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        from PyQt6.QtWidgets import QApplication
+        from app import WebPConverterGUI
+    except ImportError as e:
+        return {"skipped": f"không có PyQt6 ({e})"}
+
+    app = QApplication.instance() or QApplication([])
+    window = WebPConverterGUI()
+    window.all_scanned_files = files[:limit]
+    window.selected_files = files[:limit]
+    start = time.perf_counter()
+    window.update_preview_table()
+    app.processEvents()
+    seconds = time.perf_counter() - start
+    window.close()
+    return rate_entry(len(window.selected_files), seconds)
+
+
+def bench_convert_and_delete(files, sample, workers, seed):
+    from webp_metrics import RunMetrics
+
+    sample_files = random.Random(seed).sample(files, min(sample, len(files)))
+    work_dir = Path(tempfile.mkdtemp(prefix="webp-bench-"))
+    try:
+        # Copy mẫu ra thư mục tạm (đánh số để không trùng tên) để corpus dùng lại được cho lần sau
+        copies = []
+        for index, file_path in enumerate(sample_files):
+            copy_path = work_dir / f"{index:06d}-{Path(file_path).name}"
+            shutil.copyfile(file_path, copy_path)
+            copies.append(str(copy_path))
+        input_bytes = sum(os.path.getsize(path) for path in copies)
+
+        metrics = RunMetrics()
+        engine = ConversionEngine(85, True, workers, metrics=metrics)
+        errors = 0
+        start = time.perf_counter()
+        for _, _, error in engine.run(copies):
+            if error is not None:
+                errors += 1
+        convert_seconds = time.perf_counter() - start
+        metrics.finish()
+        convert = rate_entry(len(copies), convert_seconds, bytes=input_bytes,
+                             mb_per_second=input_bytes / (1024 * 1024) / convert_seconds if convert_seconds else 0.0,
+                             errors=errors, workers=workers, stages=metrics.stage_totals())
+
+        to_delete = [str(path) for path in work_dir.iterdir()]
+        start = time.perf_counter()
+        for file_path in to_delete:
+            delete_file(file_path, False)
+        delete = rate_entry(len(to_delete), time.perf_counter() - start)
+        return convert, delete
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def environment_info():
+    try:
+        import PIL
+        pillow_version = PIL.__version__
+    except ImportError:
+        pillow_version = None
+    try:
+        repo_dir = os.path.dirname(os.path.abspath(__file__))
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo_dir,
+                                capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "pillow": pillow_version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "commit": commit,
+    }
+
+
+def run_benchmarks(corpus, repeat=3, sample=200, workers=None, preview_limit=5000, seed=1, label=None):
+    corpus = Path(corpus)
+    info_path = corpus / CORPUS_INFO
+    corpus_info = json.loads(info_path.read_text(encoding="utf-8")) if info_path.exists() else {}
+
+    files, scan = bench_scan(corpus, repeat)
+    results = {"scan": scan, "filter": bench_filter(files, repeat), "preview": bench_preview(files, preview_limit)}
+    if sample > 0 and files:
+        results["convert"], results["delete"] = bench_convert_and_delete(files, sample, workers or default_workers(),
+                                                                          seed)
+    return {
+        "label": label,
+        "timestamp": time.time(),
+        "environment": environment_info(),
+        "corpus": dict(corpus_info, path=str(corpus.resolve()), scanned_files=len(files)),
+        "results": results,
+    }
+
+
+def flatten_rates(report):
+    # {"scan": 123.0, "filter.regex": 4567.0, ...}: số file/giây của từng phép đo để so sánh
+    rates = {}
+    for name, entry in report["results"].items():
+        if "per_second" in entry:
+            rates[name] = entry["per_second"]
+        else:
+            for sub_name, sub_entry in entry.items():
+                if isinstance(sub_entry, dict) and "per_second" in sub_entry:
+                    rates[f"{name}.{sub_name}"] = sub_entry["per_second"]
+    if "convert" in report["results"]:
+        rates["convert.mb"] = report["results"]["convert"]["mb_per_second"]
+    return rates
+
+
+def print_report(report):
+    for name, rate in flatten_rates(report).items():
+        unit = "MB/s" if name.endswith(".mb") else "file/s"
+        print(f"  {name:<20} {rate:>14,.1f} {unit}")
+    preview = report["results"]["preview"]
+    if "skipped" in preview:
+        print(f"  {'preview':<20} bỏ qua: {preview['skipped']}")
+    convert = report["results"].get("convert")
+    if convert:
+        total = sum(convert["stages"].values())
+        if total > 0:
+            shares = " · ".join(f"{name} {seconds / total * 100:.0f}%" for name, seconds in convert["stages"].items()
+                                if seconds / total >= 0.005)
+            print(f"  {'convert.stages':<20} {shares}")
+
+
+def compare_reports(baseline, current):
+    old_rates = flatten_rates(baseline)
+    new_rates = flatten_rates(current)
+    print(f"  {'phép đo':<20} {'trước':>14} {'sau':>14} {'thay đổi':>10}")
+    for name in list(old_rates) + [name for name in new_rates if name not in old_rates]:
+        old_rate = old_rates.get(name)
+        new_rate = new_rates.get(name)
+        if old_rate and new_rate:
+            change = f"{(new_rate / old_rate - 1) * 100:+.1f}%"
+        else:
+            change = "-"
+        old_text = f"{old_rate:,.1f}" if old_rate is not None else "-"
+        new_text = f"{new_rate:,.1f}" if new_rate is not None else "-"
+        print(f"  {name:<20} {old_text:>14} {new_text:>14} {change:>10}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="webp_bench", description="Benchmark quét / lọc / preview / chuyển đổi / xóa")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="Tạo corpus ảnh tổng hợp")
+    generate.add_argument("corpus", help="Thư mục corpus (sẽ được tạo)")
+    generate.add_argument("--files", type=int, default=10000, help="Số file (mặc định 10000, tối đa tùy ý)")
+    generate.add_argument("--depth", type=int, default=2, help="Độ sâu cây thư mục (mặc định 2)")
+    generate.add_argument("--fanout", type=int, default=8, help="Số thư mục con mỗi cấp (mặc định 8)")
+    generate.add_argument("--sizes", default=",".join(SIZE_WEIGHTS),
+                          help="Kích thước ảnh: small,medium,large (corpus 1 triệu file nên chỉ dùng small)")
+    generate.add_argument("--formats", default=",".join(FORMAT_WEIGHTS), help="Định dạng: jpg,png,gif,tiff")
+    generate.add_argument("--seed", type=int, default=1)
+
+    run = commands.add_parser("run", help="Chạy benchmark trên một corpus và lưu kết quả")
+    run.add_argument("corpus", help="Thư mục corpus")
+    run.add_argument("--repeat", type=int, default=3, help="Số lần lặp cho quét/lọc (lấy nhanh nhất)")
+    run.add_argument("--sample", type=int, default=200,
+                     help="Số file lấy mẫu để đo chuyển đổi và xóa (0 = bỏ qua)")
+    run.add_argument("-w", "--workers", type=int, default=default_workers())
+    run.add_argument("--preview-limit", type=int, default=5000, help="Số dòng tối đa khi đo bảng preview")
+    run.add_argument("--seed", type=int, default=1)
+    run.add_argument("--label", default=None, help="Tên lần chạy, ví dụ pillow-12.3")
+    run.add_argument("--output", default=DEFAULT_RESULTS_DIR, help="Thư mục lưu kết quả JSON")
+
+    compare = commands.add_parser("compare", help="So sánh hai file kết quả")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    return parser
+
+
+def parse_choices(parser, value, choices):
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in names if name not in choices]
+    if unknown or not names:
+        parser.error(f"giá trị không hỗ trợ: {value}")
+    return names
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        sizes = parse_choices(parser, args.sizes, SIZE_WEIGHTS)
+        formats = parse_choices(parser, args.formats, FORMAT_WEIGHTS)
+        start = time.perf_counter()
+        info = generate_corpus(args.corpus, args.files, args.depth, args.fanout, sizes, formats, args.seed)
+        print(f"✓ Đã tạo {info['files']} file ({format_size(info['bytes'])}) trong "
+              f"{time.perf_counter() - start:.1f}s: {args.corpus}")
+        return 0
+
+    if args.command == "run":
+        report = run_benchmarks(args.corpus, args.repeat, args.sample, args.workers, args.preview_limit, args.seed,
+                                args.label)
+        output_dir = Path(args.output)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        name = time.strftime("%Y%m%d-%H%M%S", time.localtime(report["timestamp"]))
+        if args.label:
+            name += f"-{args.label}"
+        output_file = output_dir / f"{name}.json"
+        output_file.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"📊 {report['corpus']['scanned_files']} file, commit {report['environment']['commit']}, "
+              f"Pillow {report['environment']['pillow']}")
+        print_report(report)
+        print(f"✓ Đã lưu kết quả: {output_file}")
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, "r", encoding="utf-8") as f:
+        current = json.load(f)
+    compare_reports(baseline, current)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+import hashlib
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from webp_core import params_key, temp_path, write_output
+
+
+DEFAULT_CACHE_DIR = Path.home() / ".convert_webp" / "cache"
+DEFAULT_CACHE_SIZE_MB = 2048
+
+COMMIT_EVERY = 500
+
+
+def cache_key(source_hash, params):
+    return hashlib.sha256(f"{source_hash}:{params_key(params)}".encode()).hexdigest()
+
+
+def blob_path(cache_dir, key):
+    return Path(cache_dir) / "blobs" / key[:2] / f"{key}.webp"
+
+
+def fetch_blob(blob, output_file, use_link=False):
+    # Chạy trong worker: blob có thể vừa bị evict bởi tiến trình chính, khi đó coi như miss.
+    # Mặc định copy: output là file riêng, tối ưu/sửa tại chỗ không làm hỏng blob của mọi lần trúng cache sau.
+    # use_link: hardlink vào file tạm rồi os.replace để output cũ được thay atomic như write_output.
+    try:
+        if use_link:
+            # Output đã là hardlink tới đúng blob này (rename giữa hai link cùng inode không làm gì cả)
+            if output_file.exists() and os.path.samefile(blob, output_file):
+                return True
+            tmp_path = temp_path(output_file)
+            try:
+                tmp_path.unlink(missing_ok=True)
+                os.link(blob, tmp_path)
+                os.replace(tmp_path, output_file)
+                return True
+            except OSError:
+                tmp_path.unlink(missing_ok=True)
+        write_output(output_file, Path(blob).read_bytes())
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def store_blob(blob, data):
+    blob.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = blob.with_name(f"{blob.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        # Output có thể là hardlink tới blob này và file gốc bị xóa ngay sau đó: dữ liệu phải xuống đĩa trước
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, blob)
+
+
+class EncodeCache:
+    def __init__(self, path=None, max_bytes=DEFAULT_CACHE_SIZE_MB * 1024 * 1024, use_link=False):
+        self.path = Path(path) if path else DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        self.use_link = use_link
+        self.pending_writes = 0
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path / "index.sqlite"), check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                key TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS blobs_last_used ON blobs (last_used)")
+        self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def record(self, key, size, hit):
+        now = time.time()
+        if hit and self.conn.execute("UPDATE blobs SET last_used = ? WHERE key = ?", (now, key)).rowcount:
+            self._mark_dirty()
+            return
+
+        # Blob mới, hoặc blob có trên đĩa nhưng index chưa kịp commit trước lần dừng trước
+        previous = self.conn.execute("SELECT size FROM blobs WHERE key = ?", (key,)).fetchone()
+        if previous is not None:
+            self.total_bytes -= previous[0]
+        self.conn.execute("INSERT OR REPLACE INTO blobs (key, size, last_used) VALUES (?, ?, ?)",
+                          (key, size, now))
+        self.total_bytes += size
+        self._mark_dirty()
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        # Xóa tới 90% ngân sách để không phải evict lại sau mỗi blob mới
+        target = self.max_bytes * 0.9
+        while self.total_bytes > target:
+            rows = self.conn.execute("SELECT key, size FROM blobs ORDER BY last_used ASC LIMIT 256").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self.total_bytes <= target:
+                    break
+                try:
+                    os.remove(blob_path(self.path, key))
+                except FileNotFoundError:
+                    pass
+                self.conn.execute("DELETE FROM blobs WHERE key = ?", (key,))
+                self.total_bytes -= size
+        self.flush()
+
+    def _mark_dirty(self):
+        self.pending_writes += 1
+        if self.pending_writes >= COMMIT_EVERY:
+            self.flush()
+
+    def flush(self):
+        self.conn.commit()
+        self.pending_writes = 0
+
+    def close(self):
+        self.flush()
+        self.conn.close()
@@ -0,0 +1,899 @@
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Không import PIL / send2trash / concurrent.futures ở mức module: CLI chỉ nạp khi thực sự cần
+
+CONVERT_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.gif')
+
+FORMAT_EXTENSIONS = {
+    "webp": ['.webp'],
+    "jpg": ['.jpg', '.jpeg'],
+    "png": ['.png'],
+    "bmp": ['.bmp'],
+    "tiff": ['.tiff', '.tif'],
+    "gif": ['.gif'],
+}
+
+
+# Luồng I/O của pipeline: đọc trước file nguồn và ghi WebP song song với các worker encode.
+# Thường chỉ chờ đĩa/NFS (nhả GIL) nên không cần nhiều hơn vài luồng.
+DEFAULT_IO_THREADS = 4
+
+# File lớn hơn ngưỡng này không được đọc trước vào RAM của tiến trình chính
+PREFETCH_MAX_BYTES = 64 * 1024 * 1024
+# Tổng bytes đã đọc trước nhưng chưa giao cho worker, khi không có ngân sách bộ nhớ (có thì lấy 1/4 ngân sách)
+PREFETCH_BUFFER_BYTES = 256 * 1024 * 1024
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def extensions_for_formats(formats):
+    allowed_extensions = []
+    for fmt in formats:
+        allowed_extensions.extend(FORMAT_EXTENSIONS[fmt])
+    return allowed_extensions
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def params_key(params):
+    return json.dumps(params, sort_keys=True, separators=(",", ":"))
+
+
+def scan_entries(folder, extensions=None, index=None, rescan=False, rules=None):
+    # Quét song song (xem webp_scan), sắp xếp lại để thứ tự không phụ thuộc thread nào xong trước
+    from webp_scan import ParallelScanner
+
+    scanner = ParallelScanner([folder], extensions, index=index, rescan=rescan, rules=rules)
+    return sorted((entry for batch in scanner.iter_batches() for entry in batch), key=lambda entry: entry["path"])
+
+
+def scan_folder(folder, extensions=None, index=None, rescan=False, rules=None):
+    return [entry["path"] for entry in scan_entries(folder, extensions, index, rescan, rules)]
+
+
+def filter_files(files, allowed_extensions, prefix="", suffix="", use_regex=False, catalog=None, strict=False,
+                 dimensions=None):
+    # catalog: path -> entry của bộ quét; file có đuôi không khớp định dạng đọc từ header được lọc theo nội dung.
+    # strict: file đặt sai đuôi bị loại hẳn (tab xóa: không xóa nhầm ảnh đang được dùng dưới tên khác)
+    # dimensions: lọc theo kích thước đã đọc từ header (webp_metadata.matches_dimensions), không giải mã ảnh
+    from webp_sniff import format_extension, is_mislabeled
+    from webp_metadata import matches_dimensions
+
+    selected_files = []
+
+    for file_path in files:
+        file_obj = Path(file_path)
+        file_name = file_obj.stem
+        file_ext = file_obj.suffix.lower()
+        entry = catalog.get(file_path) if catalog else None
+        if entry is not None and is_mislabeled(entry):
+            if strict:
+                continue
+            file_ext = format_extension(entry, file_ext)
+
+        if allowed_extensions and file_ext not in allowed_extensions:
+            continue
+
+        if dimensions and not matches_dimensions(entry, dimensions):
+            continue
+
+        if use_regex:
+            try:
+                if prefix and not re.match(prefix, file_name):
+                    continue
+                if suffix and not re.search(suffix + '$', file_name):
+                    continue
+            except re.error:
+                pass
+        else:
+            if prefix and not file_name.startswith(prefix):
+                continue
+            if suffix and not file_name.endswith(suffix):
+                continue
+
+        selected_files.append(file_path)
+
+    return selected_files
+
+
+def delete_file(file_path, use_recycle_bin):
+    file_obj = Path(file_path)
+    file_size = file_obj.stat().st_size
+
+    if use_recycle_bin:
+        import send2trash
+        send2trash.send2trash(str(file_obj))
+    else:
+        os.remove(file_obj)
+
+    return file_size
+
+
+# Các option ảnh hưởng tới nội dung file WebP; manifest và cache dùng chúng để biết output còn hợp lệ không
+ENCODE_OPTION_KEYS = ("quality", "max_width", "max_height", "target_size", "target_metric", "target_value",
+                      "method", "lossless", "alpha_quality", "exact", "keep_alpha", "flatten_animation")
+
+# Hồ sơ tốc độ/nén của libwebp. "balanced" giữ mặc định của libwebp (method 4) như trước đây.
+# Số đo: 40 ảnh tổng hợp 1200x800 (nửa ảnh chụp nhiễu, nửa đồ họa phẳng), quality 85, 1 nhân, Pillow 12.3:
+#   fast      method 0   ~37.6 ảnh/s   ~26.7 KB/ảnh
+#   balanced  method 4   ~10.3 ảnh/s   ~21.1 KB/ảnh
+#   smallest  method 6    ~7.0 ảnh/s   ~20.6 KB/ảnh
+ENCODER_PRESETS = {
+    "fast": {"method": 0},
+    "balanced": {},
+    "smallest": {"method": 6},
+}
+DEFAULT_PRESET = "balanced"
+
+
+def encode_params(options):
+    # Bỏ các option đang tắt (0/None/False) để manifest và cache cũ vẫn khớp khi thêm option mới
+    return {key: options[key] for key in ENCODE_OPTION_KEYS if options.get(key)}
+
+
+@contextmanager
+def stage(timings, name):
+    # Cộng dồn thời gian (giây) của một bước vào dict timings; timings=None thì không đo
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def fit_size(size, max_width, max_height):
+    width, height = size
+    scale = 1.0
+    if max_width and width > max_width:
+        scale = min(scale, max_width / width)
+    if max_height and height > max_height:
+        scale = min(scale, max_height / height)
+    if scale >= 1.0:
+        return None
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def shrink_image(img, target):
+    from PIL import Image
+
+    # Image.reduce (box filter, rất rẻ) tới khoảng 2x kích thước đích, sau đó LANCZOS cho chất lượng
+    factor = min(img.width // (target[0] * 2), img.height // (target[1] * 2))
+    if factor >= 2:
+        try:
+            img = img.reduce(factor)
+        except ValueError:
+            pass
+    if img.size != target:
+        img = img.resize(target, Image.Resampling.LANCZOS)
+    return img
+
+
+def prepare_image(img, options, timings=None):
+    target = fit_size(img.size, options.get("max_width"), options.get("max_height"))
+    if target is not None and img.format == "JPEG":
+        # DCT scaling: libjpeg giải mã thẳng ở 1/2, 1/4 hoặc 1/8 kích thước, không cần buffer full-size
+        img.draft(img.mode, target)
+    with stage(timings, "decode"):
+        img.load()
+
+    keep_alpha = options.get("keep_alpha", True)
+    if img.mode in ("P", "1"):
+        # Ảnh palette chỉ resize được bằng NEAREST, phải đổi mode trước khi thu nhỏ
+        with stage(timings, "convert"):
+            img = normalize_mode(img, keep_alpha)
+
+    if target is not None:
+        with stage(timings, "resize"):
+            img = shrink_image(img, target)
+    # Đổi mode sau khi thu nhỏ để bản copy (nếu cần) chỉ có kích thước đích
+    with stage(timings, "convert"):
+        return normalize_mode(img, keep_alpha)
+
+
+def has_alpha(img):
+    if hasattr(img, "has_transparency_data"):
+        return img.has_transparency_data
+    return img.mode in ("RGBA", "LA", "PA", "RGBa", "La") or "transparency" in img.info
+
+
+def normalize_mode(img, keep_alpha=True):
+    # WebP nhận trực tiếp RGB và RGBA: chỉ tạo buffer mới khi mode khác hoặc khi phải bỏ alpha
+    if img.mode == "RGB" or (img.mode == "RGBA" and keep_alpha):
+        return img
+    if keep_alpha and has_alpha(img):
+        return img.convert("RGBA")
+    return img.convert("RGB")
+
+
+def encode_webp(img, quality, options):
+    save_options = {}
+    for key in ("method", "lossless", "alpha_quality", "exact"):
+        if options.get(key) is not None:
+            save_options[key] = options[key]
+
+    buffer = io.BytesIO()
+    img.save(buffer, "webp", quality=quality, optimize=True, **save_options)
+    return buffer.getvalue()
+
+
+def save_webp(img, options, timings=None):
+    with stage(timings, "encode"):
+        if options.get("target_size") or options.get("target_metric"):
+            from webp_quality import encode_to_target
+            return encode_to_target(img, options, encode_webp)
+        return encode_webp(img, options["quality"], options), options["quality"], None
+
+
+# Chỉ các định dạng này có nhiều frame là ảnh động. MPO (JPEG máy ảnh kèm ảnh preview) và TIFF nhiều trang
+# cũng có is_animated nhưng các frame khác kích thước: chuyển frame 0 như ảnh tĩnh.
+ANIMATION_FORMATS = ("GIF", "PNG", "WEBP")
+
+
+def is_animated(img, options):
+    return (getattr(img, "is_animated", False) and img.format in ANIMATION_FORMATS
+            and not options.get("flatten_animation"))
+
+
+def read_animation(img, options, timings=None):
+    # Trả về (frames, durations). frames None: không cần thu nhỏ / bỏ alpha, Pillow đọc lần lượt từng frame từ img
+    # lúc encode (chỉ giữ một frame trong bộ nhớ). Ngược lại mỗi frame được xử lý như ảnh tĩnh (prepare_image)
+    # và giữ lại ở kích thước đích.
+    target = fit_size(img.size, options.get("max_width"), options.get("max_height"))
+    keep_alpha = options.get("keep_alpha", True)
+    transform = target is not None or not keep_alpha
+    frames = [] if transform else None
+    durations = []
+    with stage(timings, "decode"):
+        for index in range(img.n_frames):
+            img.seek(index)
+            durations.append(img.info.get("duration", 100))
+            if not transform:
+                continue
+            # Frame palette phải đổi mode trước khi thu nhỏ; frame giữ lại phải là bản copy vì img sẽ seek tiếp
+            frame = normalize_mode(img, keep_alpha)
+            if target is not None:
+                frame = shrink_image(frame, target)
+            frames.append(img.copy() if frame is img else frame)
+        img.seek(0)
+    return frames, durations
+
+
+def encode_animation(img, options, timings=None):
+    frames, durations = read_animation(img, options, timings)
+    first = frames[0] if frames else img
+
+    save_options = {"method": 4}
+    for key in ("method", "lossless", "alpha_quality"):
+        if options.get(key) is not None:
+            save_options[key] = options[key]
+    # GIF không có NETSCAPE extension chỉ chạy một lần; loop mặc định của Pillow (0) là lặp vô hạn
+    save_options["loop"] = img.info.get("loop", 1)
+
+    def encode(_, quality, options):
+        buffer = io.BytesIO()
+        first.save(buffer, "webp", save_all=True, append_images=frames[1:] if frames else [], duration=durations,
+                   quality=quality, **save_options)
+        return buffer.getvalue()
+
+    # Giải mã từng frame xen kẽ với encode nên cả lượt này được tính là encode. exact không có trong encoder
+    # animation của Pillow. Chế độ dung lượng / SSIM / PSNR encode lại cả animation ở mỗi bước tìm kiếm;
+    # SSIM / PSNR được đo trên frame đầu.
+    with stage(timings, "encode"):
+        if options.get("target_size") or options.get("target_metric"):
+            from webp_quality import encode_to_target
+            return encode_to_target(first, options, encode)
+        return encode(first, options["quality"], options), options["quality"], None
+
+
+def apply_pixel_limit(max_pixels):
+    # Pillow chỉ báo lỗi từ 2 x MAX_IMAGE_PIXELS, giữa 1x và 2x chỉ cảnh báo: check_pixels kiểm tra đúng ngưỡng
+    # sau khi đọc header nên bỏ cảnh báo đó
+    import warnings
+    from PIL import Image
+
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+
+
+def check_pixels(img, options):
+    max_pixels = options.get("max_pixels")
+    if max_pixels and img.width * img.height > max_pixels:
+        from PIL import Image
+        raise Image.DecompressionBombError(
+            f"Ảnh {img.width}x{img.height} vượt ngưỡng {max_pixels} pixel, nghi là decompression bomb")
+
+
+def encode_image(source, options, timings=None):
+    from PIL import Image
+
+    with stage(timings, "open"):
+        img = Image.open(source)
+    with img:
+        check_pixels(img, options)
+        if is_animated(img, options):
+            return encode_animation(img, options, timings)
+        return save_webp(prepare_image(img, options, timings), options, timings)
+
+
+def output_path(file_path, outputs=None):
+    # outputs: bảng file gốc -> output do OutputLayout lập trước khi chạy (thư mục output riêng, trùng tên)
+    if outputs:
+        planned = outputs.get(os.path.abspath(file_path))
+        if planned is not None:
+            return Path(planned)
+    input_file = Path(file_path)
+    return input_file.parent / f"{input_file.stem}.webp"
+
+
+def temp_path(output_file):
+    # File ẩn cùng thư mục (rename cùng filesystem mới atomic), kèm pid để các worker không đụng nhau
+    return output_file.with_name(f".{output_file.name}.{os.getpid()}.tmp")
+
+
+def remove_stale_temps(output_file):
+    # File tạm còn sót lại khi tiến trình bị kill giữa lúc ghi
+    prefix = f".{output_file.name}."
+    try:
+        names = os.listdir(output_file.parent)
+    except OSError:
+        return
+    for name in names:
+        if name.startswith(prefix) and name.endswith(".tmp"):
+            try:
+                os.remove(output_file.parent / name)
+            except OSError:
+                pass
+
+
+def write_output(output_file, data):
+    # Ghi ra file tạm, fsync rồi os.replace: output luôn là bản cũ hoặc bản mới đầy đủ, không bao giờ dở dang.
+    # os.replace chỉ đổi entry thư mục nên blob cache đang hardlink tới output cũ không bị ghi đè.
+    tmp_path = temp_path(output_file)
+    try:
+        # File tạm cũ (pid trùng) có thể là hardlink tới blob cache: unlink trước khi mở để ghi
+        tmp_path.unlink(missing_ok=True)
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, output_file)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+class PrefetchBuffer:
+    # Giới hạn phần đã đọc trước nhưng chưa giao cho worker theo tổng bytes, không theo số file:
+    # thư mục toàn ảnh 50 MB không giữ hàng GB trong hàng đợi. Hết chỗ thì luồng I/O chỉ stat, worker tự đọc.
+    def __init__(self, limit_bytes):
+        self.limit_bytes = limit_bytes
+        self.used_bytes = 0
+        self.lock = threading.Lock()
+
+    def reserve(self, size):
+        with self.lock:
+            if self.used_bytes + size > self.limit_bytes:
+                return False
+            self.used_bytes += size
+            return True
+
+    def free(self, size):
+        with self.lock:
+            self.used_bytes -= size
+
+    def release(self, prefetched):
+        # prefetched: kết quả read_source; file không được đọc trước thì không giữ chỗ nào
+        if prefetched is not None and prefetched["data"] is not None:
+            self.free(prefetched["size"])
+
+
+def read_source(file_path, buffer=None):
+    # Chạy trong luồng I/O của tiến trình chính: đọc trước cả file để worker không phải chờ đĩa/NFS.
+    # File quá lớn (hoặc buffer đã đầy) chỉ stat, worker tự đọc.
+    timings = {}
+    with stage(timings, "read"):
+        with open(file_path, "rb") as f:
+            source_stat = os.fstat(f.fileno())
+            data = None
+            if source_stat.st_size <= PREFETCH_MAX_BYTES and (buffer is None or buffer.reserve(source_stat.st_size)):
+                try:
+                    data = f.read()
+                except BaseException:
+                    if buffer is not None:
+                        buffer.free(source_stat.st_size)
+                    raise
+    return {"data": data, "size": source_stat.st_size, "mtime_ns": source_stat.st_mtime_ns, "timings": timings}
+
+
+def write_result(result):
+    # Bước ghi của pipeline, chạy trong luồng I/O: worker chỉ trả về bytes WebP
+    with stage(result["timings"], "write"):
+        write_output(Path(result["output"]), result.pop("data"))
+    return result
+
+
+def convert_file(file_path, options, decoded=None, timings=None, prefetched=None):
+    # timings: thời gian từng bước (giây), nhận sẵn từ convert_group khi ảnh đã được giải mã ở đó
+    # prefetched: kết quả read_source, bytes và stat đã được tiến trình chính đọc trước
+    timings = {} if timings is None else timings
+    input_file = Path(file_path)
+    output_file = output_path(input_file, options.get("outputs"))
+
+    if prefetched is not None:
+        timings.update(prefetched["timings"])
+        original_size = prefetched["size"]
+        source_mtime_ns = prefetched["mtime_ns"]
+        data = prefetched["data"]
+    else:
+        with stage(timings, "stat"):
+            source_stat = input_file.stat()
+        original_size = source_stat.st_size
+        source_mtime_ns = source_stat.st_mtime_ns
+        data = None
+    source_hash = None
+    key = None
+    cache_hit = False
+    quality = None
+    target_met = None
+    deferred = False
+
+    if decoded is not None:
+        source = None
+        if options.get("hash_content"):
+            with stage(timings, "hash"):
+                source_hash = hash_file(input_file)
+    elif data is not None:
+        if options.get("hash_content"):
+            with stage(timings, "hash"):
+                source_hash = hash_bytes(data)
+        source = io.BytesIO(data)
+    elif options.get("hash_content"):
+        with stage(timings, "hash"):
+            data = input_file.read_bytes()
+            source_hash = hash_bytes(data)
+        source = io.BytesIO(data)
+    else:
+        source = input_file
+
+    if options.get("cache_dir"):
+        import webp_cache
+        key = webp_cache.cache_key(source_hash, encode_params(options))
+        blob = webp_cache.blob_path(options["cache_dir"], key)
+        with stage(timings, "write"):
+            cache_hit = webp_cache.fetch_blob(blob, output_file, options["cache_link"])
+        if not cache_hit:
+            if decoded is not None:
+                webp_data, quality, target_met = save_webp(decoded, options, timings)
+            else:
+                webp_data, quality, target_met = encode_image(source, options, timings)
+            with stage(timings, "write"):
+                webp_cache.store_blob(blob, webp_data)
+                if not webp_cache.fetch_blob(blob, output_file, options["cache_link"]):
+                    write_output(output_file, webp_data)
+    else:
+        if decoded is not None:
+            webp_data, quality, target_met = save_webp(decoded, options, timings)
+        else:
+            webp_data, quality, target_met = encode_image(source, options, timings)
+        if options.get("defer_write"):
+            # Trả bytes về tiến trình chính, luồng I/O ghi trong lúc worker encode ảnh tiếp theo
+            deferred = True
+        else:
+            with stage(timings, "write"):
+                write_output(output_file, webp_data)
+
+    converted_size = len(webp_data) if deferred else output_file.stat().st_size
+
+    # File gốc do tiến trình chính xóa sau khi đã ghi journal, xem ConversionEngine.finish_result
+    result = {
+        "input": str(input_file),
+        "output": str(output_file),
+        "original_size": original_size,
+        "converted_size": converted_size,
+        "removed": False,
+        "source_mtime_ns": source_mtime_ns,
+        "source_hash": source_hash,
+        "cache_key": key,
+        "cache_hit": cache_hit,
+        "quality": quality,
+        "target_met": target_met,
+        "timings": timings,
+    }
+    if deferred:
+        result["data"] = webp_data
+    return result
+
+
+def job_paths(file_path, sizes):
+    paths = [file_path]
+    for data in (sizes or {}).values():
+        paths.append(str(Path(file_path).parent / data["file"]))
+    return paths
+
+
+def convert_job(file_path, sizes, options, prefetched=None):
+    if options.get("max_pixels"):
+        apply_pixel_limit(options["max_pixels"])
+
+    if sizes:
+        import webp_variants
+        return webp_variants.convert_group(file_path, sizes, options)
+
+    try:
+        return [(file_path, convert_file(file_path, options, prefetched=prefetched), None)]
+    except Exception as e:
+        return [(file_path, None, e)]
+
+
+def ignore_interrupts():
+    # Worker của pool sống cả phiên --watch: Ctrl-C (gửi cho cả nhóm tiến trình) chỉ để tiến trình chính xử lý,
+    # SIGTERM kết thúc worker ngay thay vì thành KeyboardInterrupt (handler kế thừa từ tiến trình chính khi fork)
+    import signal
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+class ConversionEngine:
+    def __init__(self, quality, keep_original, workers=None, manifest=None, cache=None, encode_options=None,
+                 group_variants=False, wp_metadata=None, memory_budget=None, journal=None, metrics=None,
+                 io_threads=DEFAULT_IO_THREADS, output_layout=None):
+        self.options = {
+            "quality": quality,
+            "keep_original": keep_original,
+            "hash_content": cache is not None or (manifest is not None and manifest.hash_content),
+            "cache_dir": str(cache.path) if cache is not None else None,
+            "cache_link": cache.use_link if cache is not None else False,
+        }
+        self.options.update(encode_options or {})
+        # Có cache thì worker tự tạo output từ blob (copy hoặc hardlink); còn lại worker trả bytes cho luồng I/O ghi
+        self.io_threads = max(0, io_threads or 0)
+        self.options["defer_write"] = self.io_threads > 0 and cache is None
+        if memory_budget is not None:
+            self.options.setdefault("max_pixels", memory_budget.max_pixels)
+        self.workers = max(1, workers or default_workers())
+        self.manifest = manifest
+        self.cache = cache
+        self.group_variants = group_variants
+        self.wp_metadata = wp_metadata
+        self.memory_budget = memory_budget
+        self.journal = journal
+        self.metrics = metrics
+        if output_layout is None:
+            from webp_output import OutputLayout
+            output_layout = OutputLayout()
+        if manifest is not None and output_layout.owner_of is None:
+            output_layout.owner_of = manifest.output_owner
+        self.output_layout = output_layout
+        # Quality chọn được gần nhất theo thư mục: ảnh cùng thư mục thường cần quality gần nhau
+        self.quality_hints = {} if self.options.get("target_size") or self.options.get("target_metric") else None
+        # Pool worker dùng chung cho nhiều lần run() (chế độ --watch), xem start_pool()
+        self.executor = None
+        self.is_running = True
+
+    def encode_params(self):
+        return encode_params(self.options)
+
+    def iter_jobs(self, files, params):
+        remaining = []
+        for file_path in files:
+            output = self.output_layout.output_for(file_path)
+            if self.journal is not None and self.journal.resumed:
+                resumed = self.journal.resume_result(file_path, output)
+                if resumed is not None:
+                    yield file_path, None, resumed
+                    continue
+            if self.manifest is not None:
+                skipped = self.manifest.current_result(file_path, params, output)
+                if skipped is not None:
+                    yield file_path, None, skipped
+                    continue
+            if self.group_variants:
+                remaining.append(file_path)
+            else:
+                yield file_path, None, None
+
+        if self.group_variants:
+            from webp_variants import group_variants
+            for file_path, sizes in group_variants(remaining, self.wp_metadata):
+                yield file_path, sizes, None
+
+    def job_options(self, file_path, sizes=None):
+        # Mỗi job chỉ mang theo output của chính các file trong job, không phải cả bảng
+        options = dict(self.options, outputs={os.path.abspath(path): self.output_layout.output_for(path)
+                                              for path in job_paths(file_path, sizes)})
+        if self.quality_hints is not None:
+            hint = self.quality_hints.get(os.path.dirname(os.path.abspath(file_path)))
+            if hint is not None:
+                options["quality_hint"] = hint
+        return options
+
+    def plan_outputs(self, files, catalog=None):
+        # Lập vị trí output cho cả lô trước khi encode; trả về các nhóm trùng tên đã được đổi tên
+        return self.output_layout.plan(files, catalog)
+
+    def estimate_job(self, file_path, prefetched=None):
+        if self.memory_budget is None:
+            return 0
+        # Đã đọc trước thì đọc header từ bộ nhớ, không tốn thêm một lượt I/O. Bytes đọc trước nằm trong ngân sách
+        # đến khi encode xong: bản ở tiến trình chính (giữ đến khi future xong) và bản pickle sang worker.
+        if prefetched is not None and prefetched["data"] is not None:
+            estimate = self.memory_budget.estimate(file_path, self.options, io.BytesIO(prefetched["data"]))
+            return estimate + 2 * len(prefetched["data"])
+        return self.memory_budget.estimate(file_path, self.options)
+
+    def release_job(self, job):
+        if self.memory_budget is not None:
+            self.memory_budget.release(job[2])
+
+    def finish_result(self, result):
+        # Thứ tự ghi journal: output đã nằm trên đĩa -> xóa file gốc -> ghi nhận đã xóa.
+        # Chết giữa chừng thì lần chạy sau chỉ còn thiếu bước xóa, không phải encode lại.
+        if self.journal is not None and not result.get("resumed"):
+            self.journal.written(result)
+        if not self.options["keep_original"] and not result["removed"]:
+            try:
+                with stage(result.setdefault("timings", {}), "delete"):
+                    os.remove(result["input"])
+            except FileNotFoundError:
+                pass
+            result["removed"] = True
+            if self.journal is not None:
+                self.journal.removed(result["input"])
+
+    def record_result(self, result, params):
+        if self.metrics is not None:
+            self.metrics.record(result)
+        if self.quality_hints is not None and result["quality"] is not None:
+            self.quality_hints[os.path.dirname(os.path.abspath(result["input"]))] = result["quality"]
+        if self.manifest is not None:
+            self.manifest.record(result, params)
+        if self.cache is not None and result["cache_key"] is not None:
+            self.cache.record(result["cache_key"], result["converted_size"], result["cache_hit"])
+
+    def complete_result(self, result, params):
+        try:
+            self.finish_result(result)
+        except OSError as e:
+            self.record_error()
+            return None, e
+        self.record_result(result, params)
+        return result, None
+
+    def run(self, files):
+        from collections import deque
+        from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+        from concurrent.futures.process import BrokenProcessPool
+
+        # Pipeline 3 bước với hàng đợi có giới hạn: luồng I/O đọc trước -> worker giải mã/encode -> luồng I/O ghi.
+        # Đĩa và CPU chạy song song nên thông lượng tiến gần bước chậm hơn thay vì tổng của hai bước.
+        # Giữ số task encode đang chờ ở mức 2 x workers để không phải giữ hàng trăm nghìn future trong bộ nhớ
+        max_pending = self.workers * 2
+        # Ngoài số task encode còn trống chỗ, đọc trước thêm chừng này file, trong giới hạn tổng bytes của buffer
+        max_prefetch = self.io_threads * 2
+        prefetch_buffer = PrefetchBuffer(self.memory_budget.budget_bytes // 4 if self.memory_budget is not None
+                                         else PREFETCH_BUFFER_BYTES)
+        params = self.encode_params()
+        files = list(files)
+        self.plan_outputs(files)
+        self.output_layout.prepare()
+        if self.journal is not None:
+            self.journal.open(params, self.options["keep_original"])
+        job_iter = self.iter_jobs(files, params)
+        exhausted = False
+        reads = {}        # future đọc -> (file_path, sizes)
+        ready = deque()   # [file_path, sizes, prefetched, estimate] chờ chỗ trong pool / ngân sách bộ nhớ
+        encodes = {}      # future encode -> (file_path, sizes, estimate)
+        writes = {}       # future ghi -> (result_path, result)
+        io_pool = ThreadPoolExecutor(max_workers=self.io_threads) if self.io_threads else None
+
+        pool_broken = False
+        with self.worker_pool() as executor:
+            try:
+                while True:
+                    while (self.is_running and not exhausted and
+                           len(reads) + len(ready) < max_pending - len(encodes) + max_prefetch):
+                        job = next(job_iter, None)
+                        if job is None:
+                            exhausted = True
+                            break
+                        file_path, sizes, skipped = job
+                        if skipped is not None:
+                            # Journal: output đã ghi xong ở lần trước, chỉ còn thiếu bước xóa file gốc.
+                            # Manifest: output còn đúng nhưng lần trước có thể đã giữ lại file gốc (--keep-original).
+                            if skipped.get("resumed") or not self.options["keep_original"]:
+                                try:
+                                    self.finish_result(skipped)
+                                except OSError as e:
+                                    self.record_error()
+                                    yield file_path, None, e
+                                    continue
+                            if self.metrics is not None:
+                                self.metrics.record_skipped()
+                            yield file_path, skipped, None
+                            continue
+                        if io_pool is None or sizes:
+                            # Nhóm biến thể WordPress đọc nhiều file trong worker, không đọc trước
+                            ready.append([file_path, sizes, None, None])
+                        else:
+                            reads[io_pool.submit(read_source, file_path, prefetch_buffer)] = (file_path, sizes)
+
+                    while self.is_running and ready and len(encodes) < max_pending:
+                        job = ready[0]
+                        file_path, sizes, prefetched, estimate = job
+                        if estimate is None:
+                            try:
+                                estimate = job[3] = self.estimate_job(file_path, prefetched)
+                            except Exception as e:
+                                ready.popleft()
+                                prefetch_buffer.release(prefetched)
+                                for result_path in job_paths(file_path, sizes):
+                                    self.record_error()
+                                    yield result_path, None, e
+                                continue
+                        if self.memory_budget is not None:
+                            # Chưa đủ ngân sách bộ nhớ: giữ job lại, chờ một job đang chạy xong
+                            if not self.memory_budget.can_admit(estimate):
+                                break
+                            self.memory_budget.acquire(estimate)
+                        ready.popleft()
+                        # Từ đây bytes đọc trước được tính trong estimate của ngân sách bộ nhớ
+                        prefetch_buffer.release(prefetched)
+                        if self.journal is not None:
+                            for result_path in job_paths(file_path, sizes):
+                                self.journal.submit(result_path)
+                        future = executor.submit(convert_job, file_path, sizes, self.job_options(file_path, sizes),
+                                                 prefetched)
+                        encodes[future] = (file_path, sizes, estimate)
+
+                    if not self.is_running:
+                        # Dừng: bỏ phần chưa encode, nhưng vẫn chờ ghi xong những gì worker đã encode
+                        for job in ready:
+                            prefetch_buffer.release(job[2])
+                        ready.clear()
+                        for future in list(reads):
+                            if future.cancel():
+                                del reads[future]
+                        for future in list(encodes):
+                            if future.cancel():
+                                self.release_job(encodes.pop(future))
+
+                    if not (reads or encodes or writes or ready):
+                        break
+
+                    done, _ = wait(list(reads) + list(encodes) + list(writes), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if future in reads:
+                            file_path, sizes = reads.pop(future)
+                            if not self.is_running:
+                                if future.exception() is None:
+                                    prefetch_buffer.release(future.result())
+                                continue
+                            try:
+                                ready.append([file_path, sizes, future.result(), None])
+                            except Exception as e:
+                                self.record_error()
+                                yield file_path, None, e
+                            continue
+
+                        if future in writes:
+                            result_path, result = writes.pop(future)
+                            try:
+                                future.result()
+                            except Exception as e:
+                                self.record_error()
+                                yield result_path, None, e
+                                continue
+                            result, error = self.complete_result(result, params)
+                            yield result_path, result, error
+                            continue
+
+                        file_path, sizes, estimate = encodes.pop(future)
+                        self.release_job((file_path, sizes, estimate))
+                        try:
+                            job_results = future.result()
+                        except Exception as e:
+                            pool_broken = pool_broken or isinstance(e, BrokenProcessPool)
+                            job_results = [(result_path, None, e) for result_path in job_paths(file_path, sizes)]
+                        for result_path, result, error in job_results:
+                            if error is not None:
+                                self.record_error()
+                                yield result_path, None, error
+                            elif "data" in result:
+                                writes[io_pool.submit(write_result, result)] = (result_path, result)
+                            else:
+                                result, error = self.complete_result(result, params)
+                                yield result_path, result, error
+                if self.is_running and self.journal is not None:
+                    self.journal.end()
+            finally:
+                for future in list(reads) + list(encodes):
+                    future.cancel()
+                if pool_broken:
+                    self.restart_pool()
+                if io_pool is not None:
+                    # Chờ các lần ghi đang chạy xong: write_output luôn atomic, không để lại output dở
+                    io_pool.shutdown(wait=True, cancel_futures=True)
+                if self.manifest is not None:
+                    self.manifest.flush()
+                if self.cache is not None:
+                    self.cache.flush()
+                if self.journal is not None:
+                    self.journal.sync()
+                if self.metrics is not None:
+                    self.metrics.finish()
+
+    def start_pool(self):
+        # Chế độ --watch: một pool worker cho cả phiên thay vì tạo lại (spawn tiến trình + import PIL) mỗi lô
+        from concurrent.futures import ProcessPoolExecutor
+
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=ignore_interrupts)
+
+    def shutdown_pool(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+    def restart_pool(self):
+        # Worker chết (OOM killer...) làm hỏng cả pool: lô sau dùng pool mới
+        if self.executor is not None:
+            self.shutdown_pool()
+            self.start_pool()
+
+    @contextmanager
+    def worker_pool(self):
+        from concurrent.futures import ProcessPoolExecutor
+        from concurrent.futures.process import BrokenProcessPool
+
+        if self.executor is None:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                yield executor
+            return
+        try:
+            yield self.executor
+        except BrokenProcessPool:
+            self.restart_pool()
+            raise
+
+    def record_error(self):
+        if self.metrics is not None:
+            self.metrics.record_error()
+
+    def stop(self):
+        self.is_running = False
+
+
+
+def format_size(size_bytes):
+    if size_bytes < 1024:
+        return f"{size_bytes} B"
+    elif size_bytes < 1024 * 1024:
+        return f"{size_bytes / 1024:.1f} KB"
+    elif size_bytes < 1024 * 1024 * 1024:
+        return f"{size_bytes / (1024 * 1024):.1f} MB"
+    else:
+        return f"{size_bytes / (1024 * 1024 * 1024):.1f} GB"
@@ -0,0 +1,139 @@
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+
+DEFAULT_INDEX_PATH = Path.home() / ".convert_webp" / "scan-index.sqlite"
+
+# Chỉ mục chỉ là bản sao của hệ thống file: đổi cấu trúc bảng thì dựng lại từ đầu, không cần migrate
+SCHEMA_VERSION = 3
+
+COMMIT_EVERY = 500
+
+# FS có mtime thô (FAT 2 giây, ext3 1 giây): thư mục vừa sửa trong khoảng này có thể còn được ghi thêm
+# mà mtime không đổi, nên không tin mtime đó và lần sau quét lại
+RACY_SECONDS = 2
+
+ENTRY_COLUMNS = ("path", "size", "mtime_ns", "format", "width", "height", "mode", "frames", "taken_at")
+
+
+def subtree_range(directory):
+    # Mọi đường dẫn nằm dưới directory nằm trong [prefix, prefix_end): so sánh chuỗi dùng được index
+    prefix = directory.rstrip(os.sep) + os.sep
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+
+class ScanIndex:
+    # path, size, mtime, định dạng theo header (và kích thước, mode, số frame, ngày chụp khi đã đọc,
+    # xem webp_metadata) của mọi file đã quét, cùng mtime của từng thư mục.
+    # Mtime thư mục chỉ đổi khi thêm / xóa / đổi tên file bên trong: thư mục không đổi thì không cần readdir.
+    def __init__(self, path=None):
+        self.path = Path(path) if path else DEFAULT_INDEX_PATH
+        self.pending_writes = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS dirs")
+            self.conn.execute("DROP TABLE IF EXISTS files")
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS dirs (
+                path TEXT PRIMARY KEY,
+                parent TEXT NOT NULL,
+                mtime_ns INTEGER NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                dir TEXT NOT NULL,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                format TEXT,
+                width INTEGER,
+                height INTEGER,
+                mode TEXT,
+                frames INTEGER,
+                taken_at TEXT,
+                PRIMARY KEY (dir, path)
+            ) WITHOUT ROWID
+        """)
+        # File cùng thư mục nằm liền nhau trên đĩa: đọc lại một thư mục là một lượt quét tuần tự
+        self.conn.execute("CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent)")
+        self.conn.commit()
+
+    def dir_mtimes(self, root):
+        # Đọc một lần cho cả cây trước khi quét, thay vì một truy vấn cho mỗi thư mục
+        prefix, prefix_end = subtree_range(root)
+        rows = self.conn.execute("SELECT path, mtime_ns FROM dirs WHERE path = ? OR (path >= ? AND path < ?)",
+                                 (root, prefix, prefix_end))
+        return dict(rows)
+
+    def cached_directory(self, directory):
+        rows = self.conn.execute(f"SELECT {', '.join(ENTRY_COLUMNS)} FROM files WHERE dir = ?", (directory,))
+        entries = [dict(zip(ENTRY_COLUMNS, row)) for row in rows]
+        subdirs = [row[0] for row in self.conn.execute("SELECT path FROM dirs WHERE parent = ?", (directory,))]
+        return entries, subdirs
+
+    def update_directory(self, directory, mtime_ns, entries, subdirs):
+        # Thư mục vừa được đọc lại: thay danh sách file, giữ format/metadata của file không đổi size + mtime
+        known = {entry["path"]: entry for entry in self.cached_directory(directory)[0]}
+        for entry in entries:
+            previous = known.get(entry["path"])
+            same = previous is not None and (previous["size"], previous["mtime_ns"]) == (entry["size"],
+                                                                                        entry["mtime_ns"])
+            for column in ENTRY_COLUMNS[3:]:
+                entry.setdefault(column, previous[column] if same else None)
+
+        if mtime_ns >= time.time_ns() - RACY_SECONDS * 1_000_000_000:
+            mtime_ns = 0
+        self.conn.execute("INSERT OR REPLACE INTO dirs (path, parent, mtime_ns) VALUES (?, ?, ?)",
+                          (directory, os.path.dirname(directory), mtime_ns))
+        self.conn.execute("DELETE FROM files WHERE dir = ?", (directory,))
+        placeholders = ", ".join("?" * (len(ENTRY_COLUMNS) + 1))
+        self.conn.executemany(
+            f"INSERT INTO files (dir, {', '.join(ENTRY_COLUMNS)}) VALUES ({placeholders})",
+            [(directory,) + tuple(entry[column] for column in ENTRY_COLUMNS) for entry in entries]
+        )
+
+        # Thư mục con bị xóa / đổi tên: bỏ cả cây con. Thư mục con mới được ghi trước với mtime 0 (chưa quét),
+        # để nếu lần quét này bị dừng trước khi tới nó thì lần sau vẫn biết phải quét.
+        _, previous_subdirs = self.cached_directory(directory)
+        for subdir in set(previous_subdirs) - set(subdirs):
+            self.forget(subdir)
+        self.conn.executemany("INSERT OR IGNORE INTO dirs (path, parent, mtime_ns) VALUES (?, ?, 0)",
+                              [(subdir, directory) for subdir in subdirs])
+        self._mark_dirty()
+        return entries
+
+    def update_columns(self, entries, columns):
+        # Định dạng / metadata đọc từ header sau khi thư mục đã được ghi vào chỉ mục
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        self.conn.executemany(
+            f"UPDATE files SET {assignments} WHERE dir = ? AND path = ?",
+            [tuple(entry[column] for column in columns) + (os.path.dirname(entry["path"]), entry["path"])
+             for entry in entries]
+        )
+        self._mark_dirty()
+
+    def forget(self, directory):
+        prefix, prefix_end = subtree_range(directory)
+        self.conn.execute("DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)",
+                          (directory, prefix, prefix_end))
+        self.conn.execute("DELETE FROM files WHERE dir = ? OR (dir >= ? AND dir < ?)",
+                          (directory, prefix, prefix_end))
+        self._mark_dirty()
+
+    def _mark_dirty(self):
+        self.pending_writes += 1
+        if self.pending_writes >= COMMIT_EVERY:
+            self.flush()
+
+    def flush(self):
+        self.conn.commit()
+        self.pending_writes = 0
+
+    def close(self):
+        self.flush()
+        self.conn.close()
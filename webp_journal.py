@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+from webp_core import output_path, params_key, remove_stale_temps
+
+
+DEFAULT_JOURNAL_DIR = Path.home() / ".convert_webp"
+DEFAULT_JOURNAL_PATH = DEFAULT_JOURNAL_DIR / "journal.jsonl"
+
+# fsync journal sau mỗi N dòng: kill tiến trình không mất gì (dữ liệu đã nằm trong page cache),
+# mất điện chỉ mất vài file cuối và chúng sẽ được chuyển đổi lại
+FSYNC_EVERY = 100
+
+
+def default_journal_path(roots=()):
+    # Mỗi bộ thư mục gốc một journal: cron trên thư mục này và daemon --watch trên thư mục khác không ghi đè nhau
+    roots = sorted({os.path.abspath(root) for root in roots})
+    if not roots:
+        return DEFAULT_JOURNAL_PATH
+    digest = hashlib.sha1("\n".join(roots).encode("utf-8")).hexdigest()[:12]
+    return DEFAULT_JOURNAL_DIR / "journals" / f"{digest}.jsonl"
+
+
+class ConversionJournal:
+    # Journal append-only dạng JSON lines, mỗi file đi qua các bước:
+    #   submit  -> đã giao cho worker (output có thể đang là file tạm dở dang)
+    #   written -> output đã ghi xong và rename vào chỗ
+    #   removed -> đã xóa file gốc (chỉ khi không giữ file gốc)
+    # Dòng "begin" ghi cấu hình của lần chạy, dòng "end" đánh dấu chạy xong trọn vẹn.
+    def __init__(self, path=None, roots=()):
+        self.path = Path(path) if path else default_journal_path(roots)
+        self.entries = {}
+        self.file = None
+        self.lock_file = None
+        # Journal riêng của tiến trình này (journal chung đang bị tiến trình khác giữ), xóa khi chạy xong
+        self.private = False
+        self.finished = False
+        self.pending_lines = 0
+        self.resumed = False
+
+    def open(self, params, keep_original):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Chế độ --watch gọi open() mỗi đợt: đóng handle của đợt trước
+        self.close_file()
+        if self.lock_file is None and not self.private:
+            self.lock()
+        self.finished = False
+        config = {"params": params_key(params), "keep_original": keep_original}
+        previous_config, finished = self.load()
+
+        # Chỉ tiếp tục khi lần trước bị gián đoạn với đúng cấu hình này, ngược lại bắt đầu journal mới
+        self.resumed = previous_config == config and not finished
+        if not self.resumed:
+            self.entries = {}
+        self.file = open(self.path, "a" if self.resumed else "w", encoding="utf-8")
+        if self.resumed:
+            # Dòng cuối có thể bị cắt ngang khi tiến trình chết giữa lúc ghi
+            self.file.write("\n")
+        else:
+            self._append({"op": "begin", "time": time.time(), **config})
+        self.sync()
+        return self.resumed
+
+    def lock(self):
+        # Giữ khóa suốt tiến trình: cron và daemon --watch cùng thư mục gốc không truncate journal của nhau,
+        # tiến trình đến sau ghi journal riêng theo pid
+        try:
+            import fcntl
+        except ImportError:
+            return
+        lock_file = open(self.path.with_name(self.path.name + ".lock"), "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            self.path = self.path.with_name(f"{self.path.stem}-{os.getpid()}{self.path.suffix}")
+            self.private = True
+            return
+        self.lock_file = lock_file
+
+    def load(self):
+        self.entries = {}
+        config = None
+        finished = False
+        try:
+            f = open(self.path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return None, False
+
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                op = record.get("op")
+                if op == "begin":
+                    config = {"params": record.get("params"), "keep_original": record.get("keep_original")}
+                    self.entries = {}
+                    finished = False
+                elif op == "end":
+                    finished = True
+                elif op in ("submit", "written", "removed"):
+                    entry = self.entries.setdefault(record["path"], {})
+                    entry["step"] = op
+                    if op == "written":
+                        entry["result"] = record["result"]
+        return config, finished
+
+    def resume_result(self, file_path, expected_output=None):
+        entry = self.entries.get(os.path.abspath(file_path))
+        if entry is None:
+            return None
+
+        output = expected_output if expected_output is not None else output_path(file_path)
+        if "result" not in entry:
+            # Đã giao cho worker nhưng chưa ghi xong: dọn file tạm còn sót, chuyển đổi lại từ đầu
+            remove_stale_temps(Path(output))
+            return None
+
+        result = entry["result"]
+        if os.path.abspath(result["output"]) != os.path.abspath(output):
+            return None
+        try:
+            output_size = os.path.getsize(result["output"])
+            source_stat = os.stat(file_path)
+        except OSError:
+            return None
+        # File gốc bị sửa hoặc output bị thay sau lần chạy trước: không tin journal nữa
+        if output_size != result["converted_size"] or source_stat.st_mtime_ns != result["source_mtime_ns"]:
+            return None
+        return dict(result, skipped=True, resumed=True)
+
+    def submit(self, file_path):
+        self._append({"op": "submit", "path": os.path.abspath(file_path)})
+
+    def written(self, result):
+        self._append({"op": "written", "path": os.path.abspath(result["input"]), "result": result})
+
+    def removed(self, file_path):
+        self._append({"op": "removed", "path": os.path.abspath(file_path)})
+
+    def end(self):
+        self._append({"op": "end", "time": time.time()})
+        self.sync()
+        self.finished = True
+
+    def _append(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        self.pending_lines += 1
+        if self.pending_lines >= FSYNC_EVERY:
+            self.sync()
+
+    def sync(self):
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        self.pending_lines = 0
+
+    def close_file(self):
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
+
+    def close(self):
+        self.close_file()
+        if self.private and self.finished:
+            # Journal riêng không bao giờ được tiếp tục: chạy xong thì bỏ
+            try:
+                self.path.unlink()
+            except OSError:
+                pass
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
@@ -0,0 +1,80 @@
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+DEFAULT_LOG_CAPACITY = 2000
+DEFAULT_LOG_PATH = Path.home() / ".convert_webp" / "app.log"
+
+
+class LogBuffer:
+    # Các thread chỉ ghi vào đây (rẻ, không qua signal); giao diện lấy ra theo lô bằng timer.
+    # Chỉ giữ `capacity` dòng gần nhất trong bộ nhớ, toàn bộ log (nếu bật) được ghi ra file.
+    def __init__(self, capacity=DEFAULT_LOG_CAPACITY, spill_path=None):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.recent = deque(maxlen=capacity)
+        self.pending = deque(maxlen=capacity)
+        self.dropped_count = 0
+        self.spill_file = None
+        self.spill_path = None
+        if spill_path is not None:
+            self.set_spill_path(spill_path)
+
+    def set_spill_path(self, path):
+        with self.lock:
+            if self.spill_file is not None:
+                self.spill_file.close()
+                self.spill_file = None
+            self.spill_path = Path(path) if path else None
+            if self.spill_path is not None:
+                self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+                self.spill_file = open(self.spill_path, "a", encoding="utf-8")
+
+    def add(self, message, level=INFO):
+        with self.lock:
+            if len(self.pending) == self.capacity:
+                # Giao diện không kịp lấy: bỏ dòng cũ nhất chưa hiển thị, chỉ đếm lại (file log vẫn đủ)
+                self.dropped_count += 1
+            self.recent.append((level, message))
+            self.pending.append((level, message))
+            if self.spill_file is not None:
+                self.spill_file.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {LEVEL_NAMES.get(level, level)} "
+                                      f"{message}\n")
+
+    def drain(self, min_level=DEBUG):
+        with self.lock:
+            entries = list(self.pending)
+            self.pending.clear()
+            dropped = self.dropped_count
+            self.dropped_count = 0
+            if self.spill_file is not None:
+                self.spill_file.flush()
+
+        lines = [message for level, message in entries if level >= min_level]
+        if dropped:
+            lines.insert(0, f"… {dropped} dòng log không được hiển thị" +
+                         (f" (xem {self.spill_path})" if self.spill_path is not None else ""))
+        return lines
+
+    def snapshot(self, min_level=DEBUG):
+        # Dựng lại khung log khi đổi mức lọc: chỉ từ các dòng còn giữ trong bộ nhớ
+        with self.lock:
+            return [message for level, message in self.recent if level >= min_level]
+
+    def clear(self):
+        with self.lock:
+            self.recent.clear()
+            self.pending.clear()
+            self.dropped_count = 0
+
+    def close(self):
+        self.set_spill_path(None)
@@ -0,0 +1,110 @@
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from webp_core import hash_file, params_key
+
+
+DEFAULT_MANIFEST_PATH = Path.home() / ".convert_webp" / "manifest.sqlite"
+
+COMMIT_EVERY = 500
+
+
+class ConversionManifest:
+    def __init__(self, path=None, hash_content=False):
+        self.path = Path(path) if path else DEFAULT_MANIFEST_PATH
+        self.hash_content = hash_content
+        self.pending_writes = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # GUI tạo manifest ở main thread nhưng QThread mới là nơi dùng nó
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                content_hash TEXT,
+                params TEXT NOT NULL,
+                output TEXT NOT NULL,
+                output_size INTEGER NOT NULL,
+                converted_at REAL NOT NULL
+            )
+        """)
+        # Tra ngược output -> file gốc khi lập tên output (webp_output), tránh ghi đè WebP của file gốc khác
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_output ON entries (output)")
+        self.conn.commit()
+
+    def lookup(self, file_path):
+        return self.conn.execute(
+            "SELECT size, mtime_ns, content_hash, params, output, output_size FROM entries WHERE path = ?",
+            (os.path.abspath(file_path),)
+        ).fetchone()
+
+    def current_result(self, file_path, params, expected_output=None):
+        row = self.lookup(file_path)
+        if row is None:
+            return None
+
+        size, mtime_ns, content_hash, stored_params, output, output_size = row
+        if stored_params != params_key(params):
+            return None
+        # Đổi thư mục output (hoặc output được cấp tên khác vì trùng tên): phải ghi lại vào chỗ mới
+        if expected_output is not None and os.path.abspath(expected_output) != output:
+            return None
+
+        try:
+            st = os.stat(file_path)
+            output_st = os.stat(output)
+        except OSError:
+            return None
+
+        if output_st.st_size != output_size or st.st_size != size:
+            return None
+
+        if st.st_mtime_ns != mtime_ns:
+            # mtime đổi (touch, copy, rsync) nhưng nội dung có thể vẫn y nguyên
+            if not (self.hash_content and content_hash and hash_file(file_path) == content_hash):
+                return None
+            self.conn.execute("UPDATE entries SET mtime_ns = ? WHERE path = ?",
+                              (st.st_mtime_ns, os.path.abspath(file_path)))
+            self._mark_dirty()
+
+        return {
+            "input": str(file_path),
+            "output": output,
+            "original_size": size,
+            "converted_size": output_size,
+            "removed": False,
+            "skipped": True,
+        }
+
+    def output_owner(self, output):
+        # File gốc được chuyển đổi ra output này gần nhất (có thể đã bị xóa sau khi chuyển đổi)
+        row = self.conn.execute("SELECT path FROM entries WHERE output = ? ORDER BY converted_at DESC LIMIT 1",
+                                (os.path.abspath(output),)).fetchone()
+        return row[0] if row is not None else None
+
+    def record(self, result, params):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO entries "
+            "(path, size, mtime_ns, content_hash, params, output, output_size, converted_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (os.path.abspath(result["input"]), result["original_size"], result["source_mtime_ns"],
+             result.get("source_hash"), params_key(params), os.path.abspath(result["output"]),
+             result["converted_size"], time.time())
+        )
+        self._mark_dirty()
+
+    def _mark_dirty(self):
+        self.pending_writes += 1
+        if self.pending_writes >= COMMIT_EVERY:
+            self.flush()
+
+    def flush(self):
+        self.conn.commit()
+        self.pending_writes = 0
+
+    def close(self):
+        self.flush()
+        self.conn.close()
@@ -0,0 +1,78 @@
+import os
+
+from webp_core import apply_pixel_limit, fit_size
+
+
+# Mỗi pixel sau giải mã tối đa 4 byte (RGBA); thêm một bản copy cho đổi mode / buffer của encoder
+BYTES_PER_PIXEL = 4
+WORKING_COPIES = 2
+
+# Ngưỡng chống decompression bomb. Cao hơn mặc định của Pillow (~179 MP) để ảnh scan 20k x 20k
+# vẫn chạy được (tuần tự nhờ ngân sách bộ nhớ), nhưng file khai báo kích thước vô lý bị loại ngay.
+DEFAULT_MAX_PIXELS = 1_000_000_000
+
+
+def default_memory_budget():
+    try:
+        total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return 2 * 1024 * 1024 * 1024
+    return total // 2
+
+
+def probe_image(file_path):
+    # Image.open chỉ đọc header, chưa giải mã pixel
+    from PIL import Image
+
+    with Image.open(file_path) as img:
+        return img.width, img.height, img.format
+
+
+def estimate_decoded_bytes(width, height, fmt, options):
+    target = fit_size((width, height), options.get("max_width"), options.get("max_height"))
+    if target is not None and fmt == "JPEG":
+        # draft() giải mã ở 1/2, 1/4 hoặc 1/8 kích thước, chọn tỉ lệ lớn nhất vẫn >= kích thước đích
+        scale = 1
+        while scale < 8 and width // (scale * 2) >= target[0] and height // (scale * 2) >= target[1]:
+            scale *= 2
+        width //= scale
+        height //= scale
+    return width * height * BYTES_PER_PIXEL * WORKING_COPIES
+
+
+class MemoryBudget:
+    def __init__(self, budget_bytes=None, max_pixels=DEFAULT_MAX_PIXELS):
+        # Pillow báo lỗi ở 2 x MAX_IMAGE_PIXELS; đặt bằng max_pixels để ngưỡng của ta được kiểm tra trước
+        apply_pixel_limit(max_pixels)
+        self.budget_bytes = budget_bytes or default_memory_budget()
+        self.max_pixels = max_pixels
+        self.in_flight_bytes = 0
+        self.in_flight_jobs = 0
+
+    def estimate(self, file_path, options, source=None):
+        # source: bytes đã đọc trước (file-like), tránh mở lại file chỉ để đọc header
+        from PIL import Image
+
+        try:
+            width, height, fmt = probe_image(source if source is not None else file_path)
+        except Image.DecompressionBombError:
+            raise
+        except Exception:
+            # Không đọc được header: để worker báo lỗi chi tiết, coi như không tốn bộ nhớ
+            return 0
+        if self.max_pixels and width * height > self.max_pixels:
+            raise Image.DecompressionBombError(
+                f"Ảnh {width}x{height} vượt ngưỡng {self.max_pixels} pixel, nghi là decompression bomb")
+        return estimate_decoded_bytes(width, height, fmt, options)
+
+    def can_admit(self, estimate):
+        # Ảnh vượt cả ngân sách chỉ chạy khi không còn việc nào khác, và chặn mọi việc khác khi đang chạy
+        return self.in_flight_jobs == 0 or self.in_flight_bytes + estimate <= self.budget_bytes
+
+    def acquire(self, estimate):
+        self.in_flight_bytes += estimate
+        self.in_flight_jobs += 1
+
+    def release(self, estimate):
+        self.in_flight_bytes -= estimate
+        self.in_flight_jobs -= 1
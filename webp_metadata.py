@@ -0,0 +1,141 @@
+import re
+
+from webp_core import default_workers
+
+
+# Mỗi task đọc header của chừng này file: gửi đường dẫn sang process worker theo lô, không theo từng file
+METADATA_BATCH_SIZE = 64
+
+METADATA_COLUMNS = ("width", "height", "mode", "frames", "taken_at")
+
+# GIF và TIFF không ghi số frame trong header: n_frames phải lướt qua từng frame (GIF đọc hết dữ liệu nén của
+# từng frame), nên chỉ đếm khi được yêu cầu. APNG (acTL), WebP (ANIM), MPO (MP index) có sẵn trong header.
+SEEK_FRAME_FORMATS = ("GIF", "TIFF")
+
+# width = 0: đã thử nhưng không đọc được header (width None = chưa đọc), lần sau không thử lại
+UNREADABLE = {"width": 0, "height": 0, "mode": None, "frames": None, "taken_at": None}
+
+# Thẻ EXIF: DateTimeOriginal nằm trong Exif IFD, DateTime trong IFD0
+EXIF_IFD = 0x8769
+EXIF_DATETIME_ORIGINAL = 0x9003
+EXIF_DATETIME = 0x0132
+
+EXIF_DATE = re.compile(r"(\d{4}):(\d{2}):(\d{2})[ T](\d{2}):(\d{2}):(\d{2})")
+
+
+def parse_exif_date(value):
+    # "2023:05:01 14:30:00" -> "2023-05-01 14:30:00" (so sánh / sắp xếp được như chuỗi)
+    match = EXIF_DATE.match(str(value or "").strip())
+    if match is None:
+        return None
+    year, month, day, hour, minute, second = match.groups()
+    return f"{year}-{month}-{day} {hour}:{minute}:{second}"
+
+
+def read_metadata(file_path, count_frames=False):
+    # Image.open chỉ đọc header (và EXIF nằm trong header của JPEG/TIFF), không giải mã pixel.
+    # frames None = chưa đếm (GIF / TIFF khi count_frames=False).
+    from PIL import Image
+
+    try:
+        with Image.open(file_path) as img:
+            taken_at = None
+            # PNG: chunk eXIf nằm sau IDAT thì getexif() giải mã cả ảnh để tới được nó; chỉ lấy khi có trong header
+            if img.format != "PNG" or "exif" in img.info:
+                exif = img.getexif()
+                taken_at = exif.get_ifd(EXIF_IFD).get(EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME)
+            return {
+                "width": img.width,
+                "height": img.height,
+                "mode": img.mode,
+                "frames": (getattr(img, "n_frames", 1) if count_frames or img.format not in SEEK_FRAME_FORMATS
+                           else None),
+                "taken_at": parse_exif_date(taken_at),
+            }
+    except Exception:
+        return dict(UNREADABLE)
+
+
+def read_metadata_batch(paths, count_frames=False):
+    # Chạy trong worker process. Chỉ đọc header nên ảnh vượt ngưỡng decompression bomb vẫn lấy được
+    # kích thước; ngưỡng vẫn được áp dụng khi giải mã thật (MemoryBudget / worker encode).
+    import warnings
+    from PIL import Image
+
+    Image.MAX_IMAGE_PIXELS = None
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return [read_metadata(path, count_frames) for path in paths]
+
+
+def needs_metadata(entry, count_frames=False):
+    # Chỉ file đã nhận ra là ảnh (webp_sniff) và chưa có trong chỉ mục (hoặc chưa đếm frame khi cần)
+    if not entry.get("format"):
+        return False
+    return entry.get("width") is None or (count_frames and entry["width"] and entry.get("frames") is None)
+
+
+def parse_dimensions(value):
+    # "800x600" -> (800, 600); trả về None nếu sai cú pháp
+    match = re.fullmatch(r"\s*(\d+)\s*[xX×]\s*(\d+)\s*", value or "")
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+def matches_dimensions(entry, criteria):
+    # criteria: min_width, min_height, max_width, max_height, min_pixels, max_pixels (thiếu / 0 = bỏ qua).
+    # Ảnh chưa đọc được kích thước không khớp bộ lọc nào.
+    if not criteria:
+        return True
+    width = entry.get("width") if entry is not None else None
+    if not width:
+        return False
+    height = entry["height"]
+    pixels = width * height
+    return (width >= (criteria.get("min_width") or 0) and height >= (criteria.get("min_height") or 0)
+            and pixels >= (criteria.get("min_pixels") or 0)
+            and (not criteria.get("max_width") or width <= criteria["max_width"])
+            and (not criteria.get("max_height") or height <= criteria["max_height"])
+            and (not criteria.get("max_pixels") or pixels <= criteria["max_pixels"]))
+
+
+class MetadataIndexer:
+    # Đọc kích thước / mode / số frame / ngày chụp cho các entry chưa có, lưu vào chỉ mục quét (nếu có).
+    # Sửa entry tại chỗ và trả về theo từng lô để giao diện cập nhật dần.
+    def __init__(self, workers=None, index=None, batch_size=METADATA_BATCH_SIZE, count_frames=False):
+        self.workers = max(1, workers or default_workers())
+        self.count_frames = count_frames
+        self.index = index
+        self.batch_size = batch_size
+        self.is_running = True
+        self.read_count = 0
+
+    def run(self, entries):
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        todo = [entry for entry in entries if needs_metadata(entry, self.count_frames)]
+        if not todo:
+            return
+        chunks = [todo[start:start + self.batch_size] for start in range(0, len(todo), self.batch_size)]
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(chunks))) as executor:
+            futures = {executor.submit(read_metadata_batch, [entry["path"] for entry in chunk],
+                                       self.count_frames): chunk
+                       for chunk in chunks}
+            try:
+                for future in as_completed(futures):
+                    if not self.is_running:
+                        break
+                    chunk = futures[future]
+                    for entry, metadata in zip(chunk, future.result()):
+                        entry.update(metadata)
+                    self.read_count += len(chunk)
+                    if self.index is not None:
+                        self.index.update_columns(chunk, METADATA_COLUMNS)
+                    yield chunk
+            finally:
+                for future in futures:
+                    future.cancel()
+                if self.index is not None:
+                    self.index.flush()
+
+    def stop(self):
+        self.is_running = False
@@ -0,0 +1,179 @@
+import json
+import time
+from pathlib import Path
+
+from webp_core import write_output
+
+
+# Thứ tự các bước trong một lần chuyển đổi; "hash" chỉ có khi dùng manifest --hash hoặc cache,
+# "read" là bước đọc trước của pipeline (thay cho "stat" trong worker)
+STAGES = ("read", "stat", "hash", "open", "decode", "resize", "convert", "encode", "write", "delete")
+
+# Biên trên (giây) của các bucket histogram, theo kiểu Prometheus (bucket cuối là +Inf)
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Nhóm theo dung lượng file gốc: ảnh lớn chậm vì giải mã hay vì I/O thì tách riêng được
+SIZE_BUCKETS = (
+    (100 * 1024, "lt_100k"),
+    (1024 * 1024, "100k_1m"),
+    (10 * 1024 * 1024, "1m_10m"),
+    (None, "ge_10m"),
+)
+
+DEFAULT_REPORT_PATH = Path.home() / ".convert_webp" / "last_run.json"
+
+FORMAT_LABELS = {".jpg": "jpeg", ".jpeg": "jpeg", ".tif": "tiff"}
+
+
+def size_bucket(size_bytes):
+    for limit, label in SIZE_BUCKETS:
+        if limit is None or size_bytes < limit:
+            return label
+
+
+def format_label(file_path):
+    ext = Path(file_path).suffix.lower()
+    return FORMAT_LABELS.get(ext, ext.lstrip(".") or "unknown")
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_labels(labels):
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in labels.items()) + "}"
+
+
+class RunMetrics:
+    def __init__(self):
+        self.started_at = time.time()
+        self.finished_at = None
+        # (stage, format, size bucket) -> {"buckets": [...], "sum": giây, "count": số lần}
+        self.histograms = {}
+        self.converted_count = 0
+        self.skipped_count = 0
+        self.error_count = 0
+        self.cache_hit_count = 0
+        self.original_bytes = 0
+        self.converted_bytes = 0
+
+    def observe(self, stage_name, fmt, size_label, seconds):
+        key = (stage_name, fmt, size_label)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = {"buckets": [0] * (len(DURATION_BUCKETS) + 1), "sum": 0.0, "count": 0}
+            self.histograms[key] = histogram
+        index = next((i for i, bound in enumerate(DURATION_BUCKETS) if seconds <= bound), len(DURATION_BUCKETS))
+        histogram["buckets"][index] += 1
+        histogram["sum"] += seconds
+        histogram["count"] += 1
+
+    def record(self, result):
+        fmt = format_label(result["input"])
+        size_label = size_bucket(result["original_size"])
+        for stage_name, seconds in result.get("timings", {}).items():
+            self.observe(stage_name, fmt, size_label, seconds)
+        self.converted_count += 1
+        self.original_bytes += result["original_size"]
+        self.converted_bytes += result["converted_size"]
+        if result["cache_hit"]:
+            self.cache_hit_count += 1
+
+    def record_skipped(self):
+        self.skipped_count += 1
+
+    def record_error(self):
+        self.error_count += 1
+
+    def finish(self):
+        self.finished_at = time.time()
+
+    def stage_totals(self):
+        totals = {}
+        for (stage_name, _, _), histogram in self.histograms.items():
+            totals[stage_name] = totals.get(stage_name, 0.0) + histogram["sum"]
+        return {name: totals[name] for name in sorted(totals, key=lambda name: STAGES.index(name)
+                                                      if name in STAGES else len(STAGES))}
+
+    def stage_summary(self):
+        # Ví dụ "decode 41% · encode 52% · write 5%": tổng thời gian các worker, không phải thời gian thực
+        totals = self.stage_totals()
+        total = sum(totals.values())
+        if total <= 0:
+            return ""
+        return " · ".join(f"{name} {seconds / total * 100:.0f}%" for name, seconds in totals.items()
+                          if seconds / total >= 0.005)
+
+    def to_report(self):
+        finished_at = self.finished_at or time.time()
+        totals = self.stage_totals()
+        total_stage_time = sum(totals.values())
+        return {
+            "started_at": self.started_at,
+            "finished_at": finished_at,
+            "duration": finished_at - self.started_at,
+            "files": {
+                "converted": self.converted_count,
+                "skipped": self.skipped_count,
+                "errors": self.error_count,
+                "cache_hits": self.cache_hit_count,
+            },
+            "bytes": {"original": self.original_bytes, "converted": self.converted_bytes},
+            "stages": {
+                name: {"seconds": seconds, "share": seconds / total_stage_time if total_stage_time else 0.0}
+                for name, seconds in totals.items()
+            },
+            "bucket_bounds": list(DURATION_BUCKETS),
+            "histograms": [
+                {"stage": stage_name, "format": fmt, "size": size_label, **histogram}
+                for (stage_name, fmt, size_label), histogram in sorted(self.histograms.items())
+            ],
+        }
+
+    def to_prometheus(self):
+        finished_at = self.finished_at or time.time()
+        lines = [
+            "# HELP webp_convert_stage_seconds Thời gian từng bước chuyển đổi của lần chạy gần nhất",
+            "# TYPE webp_convert_stage_seconds histogram",
+        ]
+        for (stage_name, fmt, size_label), histogram in sorted(self.histograms.items()):
+            labels = {"stage": stage_name, "format": fmt, "size": size_label}
+            cumulative = 0
+            for bound, count in zip(DURATION_BUCKETS + ("+Inf",), histogram["buckets"]):
+                cumulative += count
+                bucket_labels = prometheus_labels(dict(labels, le=bound))
+                lines.append(f"webp_convert_stage_seconds_bucket{bucket_labels} {cumulative}")
+            lines.append(f"webp_convert_stage_seconds_sum{prometheus_labels(labels)} {histogram['sum']:.6f}")
+            lines.append(f"webp_convert_stage_seconds_count{prometheus_labels(labels)} {histogram['count']}")
+
+        lines += [
+            "# HELP webp_convert_last_run_files Số file theo kết quả trong lần chạy gần nhất",
+            "# TYPE webp_convert_last_run_files gauge",
+        ]
+        for result, count in (("converted", self.converted_count), ("skipped", self.skipped_count),
+                              ("error", self.error_count), ("cache_hit", self.cache_hit_count)):
+            lines.append(f'webp_convert_last_run_files{{result="{result}"}} {count}')
+        lines += [
+            "# HELP webp_convert_last_run_bytes Tổng dung lượng file gốc và WebP trong lần chạy gần nhất",
+            "# TYPE webp_convert_last_run_bytes gauge",
+            f'webp_convert_last_run_bytes{{kind="original"}} {self.original_bytes}',
+            f'webp_convert_last_run_bytes{{kind="converted"}} {self.converted_bytes}',
+            "# HELP webp_convert_last_run_duration_seconds Thời gian thực của lần chạy gần nhất",
+            "# TYPE webp_convert_last_run_duration_seconds gauge",
+            f"webp_convert_last_run_duration_seconds {finished_at - self.started_at:.3f}",
+            "# HELP webp_convert_last_run_timestamp_seconds Thời điểm kết thúc lần chạy gần nhất",
+            "# TYPE webp_convert_last_run_timestamp_seconds gauge",
+            f"webp_convert_last_run_timestamp_seconds {finished_at:.0f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_output(path, json.dumps(self.to_report(), ensure_ascii=False, indent=2).encode("utf-8"))
+
+    def write_prometheus(self, path):
+        # node_exporter textfile collector đọc cả thư mục: ghi atomic để không bao giờ đọc phải file dở
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_output(path, self.to_prometheus().encode("utf-8"))
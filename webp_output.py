@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from webp_core import CONVERT_EXTENSIONS, write_output
+from webp_sniff import format_extension
+
+
+# Bảng source -> output nằm trong thư mục output: lần chạy sau giữ nguyên tên đã cấp, kể cả khi có trùng tên
+MAP_FILENAME = "webp-map.json"
+
+
+def shard_dirs(relative_path, levels):
+    # Chia theo hash của đường dẫn tương đối: 2 ký tự hex mỗi cấp, 256 thư mục con mỗi cấp
+    digest = hashlib.sha1(relative_path.encode("utf-8")).hexdigest()
+    return [digest[i * 2:i * 2 + 2] for i in range(levels)]
+
+
+def extension_priority(file_path, entry=None):
+    # Khi trùng tên, file theo thứ tự CONVERT_EXTENSIONS (jpg trước png...) giữ tên `stem.webp`.
+    # Xếp theo định dạng thật nếu bộ quét đã đọc header (PNG đặt tên .jpg xếp như PNG).
+    ext = format_extension(entry, Path(file_path).suffix.lower())
+    return CONVERT_EXTENSIONS.index(ext) if ext in CONVERT_EXTENSIONS else len(CONVERT_EXTENSIONS)
+
+
+class OutputLayout:
+    # Quyết định file WebP của mỗi ảnh nằm ở đâu, trước khi encode bất kỳ ảnh nào.
+    # Mặc định cạnh file gốc; với output_root là cây thư mục song song (hoặc chia shard).
+    # owner_of (output -> file gốc, thường là ConversionManifest.output_owner): chế độ cạnh file gốc không có
+    # bảng tên riêng, manifest cho biết WebP đang nằm trên đĩa là của file gốc nào.
+    def __init__(self, output_root=None, source_roots=(), shard_levels=0, owner_of=None):
+        self.output_root = Path(output_root).resolve() if output_root else None
+        # Gốc dài nhất khớp trước: thư mục con được chọn làm gốc riêng vẫn ra đúng đường dẫn tương đối
+        self.source_roots = sorted({os.path.abspath(root) for root in source_roots}, key=len, reverse=True)
+        self.shard_levels = shard_levels if self.output_root is not None else 0
+        self.owner_of = owner_of
+        # đường dẫn tuyệt đối của file gốc -> đường dẫn output đã cấp
+        self.assigned = {}
+        self.taken = set()
+        # Thư mục output của các file mới được cấp, chưa tạo trên đĩa
+        self.new_dirs = set()
+        self.dirty = False
+        self.map_path = self.output_root / MAP_FILENAME if self.output_root is not None else None
+        if self.map_path is not None:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.map_path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        for source, relative_output in entries.items():
+            output = str(self.output_root / relative_output)
+            self.assigned[source] = output
+            self.taken.add(output)
+
+    def save(self):
+        if self.map_path is None or not self.dirty:
+            return
+        entries = {source: os.path.relpath(output, self.output_root) for source, output in self.assigned.items()}
+        self.map_path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps(entries, ensure_ascii=False, indent=1, sort_keys=True).encode("utf-8")
+        write_output(self.map_path, data)
+        self.dirty = False
+
+    def relative_source(self, file_path):
+        for root in self.source_roots:
+            if file_path.startswith(root + os.sep):
+                return os.path.relpath(file_path, root)
+        # File được chọn lẻ, không nằm trong thư mục gốc nào
+        return os.path.basename(file_path)
+
+    def output_dir(self, file_path):
+        if self.output_root is None:
+            return os.path.dirname(file_path)
+        relative = self.relative_source(file_path)
+        if self.shard_levels:
+            return os.path.join(self.output_root, *shard_dirs(relative, self.shard_levels))
+        return os.path.join(self.output_root, os.path.dirname(relative))
+
+    def default_output(self, file_path):
+        return os.path.join(self.output_dir(file_path), Path(file_path).stem + ".webp")
+
+    def alternatives(self, file_path):
+        # photo.png -> photo.png.webp, nếu vẫn trùng thì thêm hash của đường dẫn gốc
+        directory = self.output_dir(file_path)
+        name = os.path.basename(file_path)
+        digest = hashlib.sha1(self.relative_source(file_path).encode("utf-8")).hexdigest()[:8]
+        yield os.path.join(directory, name + ".webp")
+        yield os.path.join(directory, f"{Path(name).stem}-{digest}.webp")
+        for index in range(2, 1000):
+            yield os.path.join(directory, f"{Path(name).stem}-{digest}-{index}.webp")
+
+    def claimed(self, output, file_path):
+        # Đã cấp cho file khác, hoặc (cạnh file gốc) đang là WebP của file gốc khác: photo.jpg đã thành photo.webp
+        # ở lần trước thì photo.png lần này không được ghi đè, kể cả khi photo.jpg đã bị xóa
+        if output in self.taken:
+            return True
+        if self.output_root is not None or self.owner_of is None:
+            return False
+        owner = self.owner_of(output)
+        return owner is not None and owner != file_path and os.path.exists(output)
+
+    def plan(self, files, catalog=None):
+        # Trả về danh sách trùng tên mới phát hiện: [(output mặc định, [(file gốc, output được cấp), ...])]
+        groups = {}
+        entries = {}
+        for file_path in files:
+            if catalog:
+                entries[os.path.abspath(file_path)] = catalog.get(file_path)
+            file_path = os.path.abspath(file_path)
+            if file_path not in self.assigned:
+                groups.setdefault(self.default_output(file_path), []).append(file_path)
+        if not groups:
+            return []
+
+        # Lượt 1: mỗi output mặc định cấp cho file ưu tiên nhất (trừ khi đã thuộc về file của lần trước).
+        # Lượt 2 mới cấp tên thay thế, để tên thay thế không chiếm mất output mặc định của file khác.
+        losers = []
+        for output, paths in groups.items():
+            owner = self.owner_of(output) if self.output_root is None and self.owner_of is not None else None
+            # File gốc đã sở hữu output từ lần trước giữ nguyên tên
+            paths.sort(key=lambda path: (path != owner, extension_priority(path, entries.get(path)), path))
+            start = 0
+            if not self.claimed(output, paths[0]):
+                self.assign(paths[0], output)
+                start = 1
+            losers.extend((output, path) for path in paths[start:])
+
+        collisions = {}
+        for output, file_path in losers:
+            candidate = next(path for path in self.alternatives(file_path) if not self.claimed(path, file_path))
+            self.assign(file_path, candidate)
+            collisions.setdefault(output, []).append(file_path)
+
+        return [(output, [(path, self.assigned[path]) for path in groups[output]])
+                for output in sorted(collisions)]
+
+    def assign(self, file_path, output):
+        self.assigned[file_path] = output
+        self.taken.add(output)
+        self.new_dirs.add(os.path.dirname(output))
+        self.dirty = True
+
+    def prepare(self):
+        # Tạo sẵn thư mục output (mỗi thư mục một lần) và lưu bảng tên trước khi worker bắt đầu ghi
+        if self.output_root is not None:
+            for directory in self.new_dirs:
+                os.makedirs(directory, exist_ok=True)
+            self.save()
+        self.new_dirs.clear()
+
+    def output_for(self, file_path):
+        output = self.assigned.get(os.path.abspath(file_path))
+        return output if output is not None else self.default_output(os.path.abspath(file_path))
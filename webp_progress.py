@@ -0,0 +1,109 @@
+import os
+import time
+from collections import deque
+
+from webp_core import format_size
+
+
+# Tối đa 4 lần cập nhật/giây: đủ mượt cho thanh tiến trình mà không làm nghẽn event loop với file nhỏ
+PROGRESS_INTERVAL = 0.25
+
+# Tốc độ tính trên cửa sổ trượt: phản ánh tốc độ hiện tại thay vì trung bình từ đầu lô
+RATE_WINDOW = 10.0
+
+
+def file_sizes(files, catalog=None):
+    # Tổng dung lượng cho ETA và dung lượng từng file khi nó xong. Lấy từ catalog của bộ quét (đã stat lúc quét),
+    # chỉ stat file không có trong đó (file chọn lẻ): trên NFS mỗi stat là một round-trip.
+    sizes = {}
+    for file_path in files:
+        entry = catalog.get(file_path) if catalog else None
+        if entry is not None and entry.get("size") is not None:
+            sizes[file_path] = entry["size"]
+            continue
+        try:
+            sizes[file_path] = os.path.getsize(file_path)
+        except OSError:
+            sizes[file_path] = 0
+    return sizes
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "đang ước tính..."
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds} giây"
+    if seconds < 3600:
+        return f"{seconds // 60} phút {seconds % 60} giây"
+    return f"{seconds // 3600} giờ {seconds % 3600 // 60} phút"
+
+
+def format_progress(progress):
+    text = f"{progress['files_per_second']:.1f} file/s · {format_size(int(progress['bytes_per_second']))}/s"
+    if progress["total"] is None:
+        return text
+    return f"{text} · còn lại {format_eta(progress['eta'])}"
+
+
+class ProgressTracker:
+    # total_files = None khi chưa biết trước số file (archive tar đọc kiểu stream): không có ETA
+    def __init__(self, total_files, total_bytes, interval=PROGRESS_INTERVAL, window=RATE_WINDOW):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.interval = interval
+        self.window = window
+        self.done_files = 0
+        self.done_bytes = 0
+        # Chỉ tính byte của file thực sự được xử lý: file bỏ qua xong ngay, không phản ánh tốc độ
+        self.worked_bytes = 0
+        self.started_at = time.monotonic()
+        self.last_emit = 0.0
+        self.samples = deque([(self.started_at, 0, 0)])
+
+    def advance(self, size, worked=True):
+        # Trả về snapshot khi đến lúc cập nhật giao diện (hoặc khi xong file cuối), ngược lại None
+        self.done_files += 1
+        self.done_bytes += size
+        if worked:
+            self.worked_bytes += size
+        now = time.monotonic()
+        finished = self.total_files is not None and self.done_files >= self.total_files
+        if now - self.last_emit < self.interval and not finished:
+            return None
+        self.last_emit = now
+        return self.snapshot(now)
+
+    def snapshot(self, now=None):
+        now = now or time.monotonic()
+        self.samples.append((now, self.done_files, self.worked_bytes))
+        while len(self.samples) > 2 and now - self.samples[1][0] >= self.window:
+            self.samples.popleft()
+        start_time, start_files, start_bytes = self.samples[0]
+        elapsed = now - start_time
+
+        files_per_second = (self.done_files - start_files) / elapsed if elapsed > 0 else 0.0
+        bytes_per_second = (self.worked_bytes - start_bytes) / elapsed if elapsed > 0 else 0.0
+        # ETA theo dung lượng còn lại: một file 40 MB không được tính bằng một thumbnail 20 KB
+        remaining_bytes = max(0, self.total_bytes - self.done_bytes)
+        if self.total_files is None:
+            eta = None
+        elif self.done_files >= self.total_files:
+            eta = 0.0
+        elif bytes_per_second > 0:
+            eta = remaining_bytes / bytes_per_second
+        elif files_per_second > 0:
+            eta = (self.total_files - self.done_files) / files_per_second
+        else:
+            eta = None
+
+        return {
+            "done": self.done_files,
+            "total": self.total_files,
+            "done_bytes": self.done_bytes,
+            "total_bytes": self.total_bytes,
+            "files_per_second": files_per_second,
+            "bytes_per_second": bytes_per_second,
+            "eta": eta,
+            "elapsed": now - self.started_at,
+        }
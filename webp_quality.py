@@ -0,0 +1,178 @@
+import io
+import math
+
+
+SEARCH_MIN_QUALITY = 20
+
+# SSIM tính trên kênh sáng của một lưới ô lấy đều khắp ảnh, ở độ phân giải gốc: thu nhỏ cả ảnh sẽ làm mờ
+# chính các lỗi nén cần đo. 8x8 ô 32 px tốn ngang ảnh 256 px, đủ để xếp hạng các mức quality mà không cần numpy.
+SSIM_TILE = 32
+SSIM_TILES_PER_SIDE = 8
+SSIM_WINDOW = 8
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+
+def psnr(reference, candidate):
+    from PIL import ImageChops
+
+    diff = ImageChops.difference(reference.convert("RGB"), candidate.convert("RGB"))
+    squared_error = sum(count * (value % 256) ** 2 for value, count in enumerate(diff.histogram()))
+    mse = squared_error / (reference.width * reference.height * 3)
+    if mse == 0:
+        return math.inf
+    return 10 * math.log10(255 ** 2 / mse)
+
+
+def sample_boxes(width, height):
+    # Ảnh nhỏ dùng nguyên ảnh; ảnh lớn lấy ô tile x tile rải đều theo cả hai chiều. Trả về (các ô, số cột).
+    if max(width, height) <= SSIM_TILE * SSIM_TILES_PER_SIDE:
+        return [(0, 0, width, height)], 1
+    tile_width = min(SSIM_TILE, width)
+    tile_height = min(SSIM_TILE, height)
+    columns = min(SSIM_TILES_PER_SIDE, width // tile_width)
+    rows = min(SSIM_TILES_PER_SIDE, height // tile_height)
+    boxes = []
+    for row in range(rows):
+        top = (height - tile_height) * row // max(1, rows - 1)
+        for column in range(columns):
+            left = (width - tile_width) * column // max(1, columns - 1)
+            boxes.append((left, top, left + tile_width, top + tile_height))
+    return boxes, columns
+
+
+def luma_mosaic(img, boxes, columns):
+    # Ghép các ô cạnh nhau thành một ảnh: kích thước ô chia hết cho cửa sổ SSIM nên cửa sổ không vắt qua hai ô
+    gray = img.convert("L")
+    if len(boxes) == 1:
+        return gray
+    from PIL import Image
+
+    left, top, right, bottom = boxes[0]
+    tile_width, tile_height = right - left, bottom - top
+    mosaic = Image.new("L", (tile_width * columns, tile_height * (len(boxes) // columns)))
+    for index, box in enumerate(boxes):
+        mosaic.paste(gray.crop(box), ((index % columns) * tile_width, (index // columns) * tile_height))
+    return mosaic
+
+
+def luma_samples(img):
+    boxes, columns = sample_boxes(img.width, img.height)
+    mosaic = luma_mosaic(img, boxes, columns)
+    return img.size, boxes, columns, mosaic.width, mosaic.height, mosaic.tobytes()
+
+
+def ssim(reference_luma, candidate):
+    size, boxes, columns, width, height, ref = reference_luma
+    if candidate.size != size:
+        candidate = candidate.resize(size)
+    cand = luma_mosaic(candidate, boxes, columns).tobytes()
+
+    total = 0.0
+    windows = 0
+    for top in range(0, max(1, height - SSIM_WINDOW + 1), SSIM_WINDOW):
+        for left in range(0, max(1, width - SSIM_WINDOW + 1), SSIM_WINDOW):
+            sum_x = sum_y = sum_xx = sum_yy = sum_xy = 0
+            count = 0
+            for row in range(top, min(top + SSIM_WINDOW, height)):
+                offset = row * width
+                for index in range(offset + left, offset + min(left + SSIM_WINDOW, width)):
+                    x = ref[index]
+                    y = cand[index]
+                    sum_x += x
+                    sum_y += y
+                    sum_xx += x * x
+                    sum_yy += y * y
+                    sum_xy += x * y
+                    count += 1
+            mean_x = sum_x / count
+            mean_y = sum_y / count
+            var_x = sum_xx / count - mean_x * mean_x
+            var_y = sum_yy / count - mean_y * mean_y
+            cov = sum_xy / count - mean_x * mean_y
+            total += ((2 * mean_x * mean_y + SSIM_C1) * (2 * cov + SSIM_C2)) / \
+                     ((mean_x * mean_x + mean_y * mean_y + SSIM_C1) * (var_x + var_y + SSIM_C2))
+            windows += 1
+    return total / windows
+
+
+def search_quality(passes, lo, hi, hint=None):
+    # passes(q) phải đơn điệu: sai ở quality thấp, đúng ở quality cao. Trả về q thấp nhất đạt, hoặc None.
+    # Bắt đầu từ hint (kết quả của ảnh trước cùng thư mục), nhân đôi bước cho tới khi kẹp được biên rồi chia đôi.
+    hint = (lo + hi) // 2 if hint is None else min(max(hint, lo), hi)
+    step = 2
+
+    if passes(hint):
+        good, bad = hint, lo - 1
+        q = hint - step
+        while q >= lo:
+            if not passes(q):
+                bad = q
+                break
+            good = q
+            step *= 2
+            q = good - step
+    else:
+        good, bad = None, hint
+        q = hint + step
+        while q <= hi:
+            if passes(q):
+                good = q
+                break
+            bad = q
+            step *= 2
+            q = bad + step
+        if good is None:
+            if bad < hi and passes(hi):
+                good = hi
+            else:
+                return None
+
+    while good - bad > 1:
+        mid = (good + bad) // 2
+        if passes(mid):
+            good = mid
+        else:
+            bad = mid
+    return good
+
+
+def encode_to_target(img, options, encode):
+    from PIL import Image
+
+    max_quality = options["quality"]
+    hint = options.get("quality_hint")
+    encoded = {}
+
+    def encode_at(quality):
+        if quality not in encoded:
+            encoded[quality] = encode(img, quality, options)
+        return encoded[quality]
+
+    # Trả về (bytes, quality, target_met). target_met False: kể cả quality biên của khoảng tìm kiếm cũng không đạt
+    # (file vẫn lớn hơn target_size ở SEARCH_MIN_QUALITY, hoặc chưa đạt ngưỡng SSIM/PSNR ở quality tối đa)
+    if options.get("target_size"):
+        budget = options["target_size"]
+        over_budget = search_quality(lambda q: len(encode_at(q)) > budget, SEARCH_MIN_QUALITY, max_quality, hint)
+        if over_budget is None:
+            quality = max_quality
+        else:
+            quality = max(SEARCH_MIN_QUALITY, over_budget - 1)
+        target_met = len(encode_at(quality)) <= budget
+    else:
+        metric = options["target_metric"]
+        threshold = options["target_value"]
+        reference = luma_samples(img) if metric == "ssim" else img
+
+        def meets_target(quality):
+            with Image.open(io.BytesIO(encode_at(quality))) as candidate:
+                if metric == "ssim":
+                    return ssim(reference, candidate) >= threshold
+                return psnr(reference, candidate) >= threshold
+
+        quality = search_quality(meets_target, SEARCH_MIN_QUALITY, max_quality, hint)
+        target_met = quality is not None
+        if quality is None:
+            quality = max_quality
+
+    return encode_at(quality), quality, target_met
@@ -0,0 +1,172 @@
+import os
+import re
+from pathlib import Path
+
+from webp_core import write_output
+
+
+# Bộ quy tắc lưu theo tên site, mỗi site một file kiểu .gitignore. Không đặt file trong thư mục web
+# (sẽ bị tải về công khai), nên không có .webpignore trong thư mục gốc của site.
+DEFAULT_RULES_DIR = Path.home() / ".convert_webp" / "rules"
+RULES_SUFFIX = ".rules"
+
+# Gợi ý cho site WordPress (placeholder của ô quy tắc), không tự áp dụng
+EXAMPLE_RULES = "cache/\nnode_modules/\nbackup*/\nupdraft/\n!uploads/cache-keep/"
+
+# Windows không phân biệt hoa thường trong tên file
+RULE_FLAGS = re.IGNORECASE if os.name == "nt" else 0
+
+
+def translate_pattern(pattern):
+    # glob kiểu .gitignore -> regex khớp với đường dẫn tương đối (phân tách bằng "/")
+    parts = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2:]:
+            end = pattern.index("]", i + 2)
+            content = pattern[i + 1:end].replace("\\", "\\\\")
+            parts.append("[" + ("^" + content[1:] if content.startswith("!") else content) + "]")
+            i = end + 1
+        elif pattern[i] == "\\" and i + 1 < len(pattern):
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(parts)
+
+
+def compile_rule(line):
+    # Trả về (regex, phủ định, chỉ thư mục) hoặc None với dòng trống / chú thích
+    line = line.rstrip()
+    if not line or line.startswith("#"):
+        return None
+    negate = line.startswith("!")
+    if negate:
+        line = line[1:]
+    elif line.startswith("\\"):
+        # \# và \! là ký tự thường ở đầu mẫu
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+    # Có "/" ở đầu hoặc giữa: neo theo thư mục gốc; không có: khớp tên ở mọi cấp
+    anchored = "/" in line
+    body = translate_pattern(line.lstrip("/"))
+    regex = re.compile(("^" if anchored else "^(?:.*/)?") + body + "$", RULE_FLAGS)
+    return regex, negate, dir_only
+
+
+class ScanRules:
+    # Quy tắc include/exclude kiểu .gitignore: quy tắc khớp sau cùng quyết định, "!" để lấy lại.
+    # Như git, thư mục đã bị loại thì không lấy lại được file bên trong: bộ quét bỏ cả cây con, không readdir.
+    def __init__(self, lines=()):
+        self.lines = []
+        self.rules = []
+        for line in lines:
+            self.add(line)
+
+    @classmethod
+    def from_text(cls, text):
+        return cls((text or "").splitlines())
+
+    def add(self, line):
+        self.lines.append(line)
+        rule = compile_rule(line)
+        if rule is not None:
+            self.rules.append(rule)
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def text(self):
+        return "\n".join(self.lines)
+
+    def excluded(self, relative_path, is_dir=False):
+        for regex, negate, dir_only in reversed(self.rules):
+            if dir_only and not is_dir:
+                continue
+            if regex.match(relative_path):
+                return not negate
+        return False
+
+    def excludes_path(self, relative_path):
+        # Bị loại nếu chính file hoặc một thư mục cha bị loại
+        parts = relative_path.split("/")
+        for depth in range(1, len(parts)):
+            if self.excluded("/".join(parts[:depth]), True):
+                return True
+        return self.excluded(relative_path)
+
+    def excludes_file(self, path, roots):
+        # File không đi qua bộ quét (watch mode): tìm thư mục gốc chứa file rồi xét từ đó
+        root = root_for(path, roots)
+        return root is not None and self.excludes_path(relative_path(path, root))
+
+
+def relative_path(path, root):
+    # path luôn được ghép từ root (scandir / os.walk), cắt chuỗi thay vì os.path.relpath cho nhanh
+    return path[len(root):].lstrip(os.sep).replace(os.sep, "/")
+
+
+def root_for(path, roots):
+    for root in roots:
+        relative = os.path.relpath(path, root)
+        if relative != os.pardir and not relative.startswith(os.pardir + os.sep):
+            return root
+    return None
+
+
+def prune_walk(rules, root, dirpath, dirnames, filenames):
+    # Cho os.walk (topdown): bỏ thư mục con bị loại khỏi dirnames tại chỗ để os.walk không đi vào.
+    # Trả về các file còn lại.
+    base = relative_path(dirpath, root)
+    prefix = base + "/" if base else ""
+    dirnames[:] = [name for name in dirnames if not rules.excluded(prefix + name, True)]
+    return [name for name in filenames if not rules.excluded(prefix + name)]
+
+
+def site_name(name):
+    # Tên site làm tên file: bỏ ký tự phân cách đường dẫn và ký tự lạ
+    return re.sub(r"[^\w.-]+", "-", name.strip()).strip(".-")
+
+
+def rules_path(site, rules_dir=None):
+    return Path(rules_dir or DEFAULT_RULES_DIR) / f"{site_name(site)}{RULES_SUFFIX}"
+
+
+def list_sites(rules_dir=None):
+    directory = Path(rules_dir or DEFAULT_RULES_DIR)
+    if not directory.is_dir():
+        return []
+    return sorted(path.name[:-len(RULES_SUFFIX)] for path in directory.glob(f"*{RULES_SUFFIX}"))
+
+
+def load_rules(site, rules_dir=None):
+    # Trả về nội dung (chuỗi) của bộ quy tắc đã lưu; site chưa có thì None
+    try:
+        return rules_path(site, rules_dir).read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None
+
+
+def save_rules(site, text, rules_dir=None):
+    if not site_name(site):
+        raise ValueError("Tên site không hợp lệ")
+    path = rules_path(site, rules_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    write_output(path, (text.rstrip("\n") + "\n").encode("utf-8"))
+    return path
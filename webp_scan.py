@@ -0,0 +1,191 @@
+import os
+import threading
+import time
+
+from webp_rules import relative_path
+from webp_sniff import SNIFF_BATCH_SIZE, format_extension, is_mislabeled, should_sniff, sniff_entries
+
+
+# Mỗi thư mục là một task: trên NFS mỗi readdir/stat là một round-trip, chạy song song thì chờ chồng lên nhau
+DEFAULT_SCAN_THREADS = 8
+SCAN_BATCH_SIZE = 500
+# Chưa đủ lô nhưng đã quá chừng này giây thì vẫn đẩy ra, để giao diện có kết quả ngay từ đầu
+SCAN_FLUSH_INTERVAL = 0.25
+
+
+def matches_extensions(path, extensions):
+    return extensions is None or path.lower().endswith(extensions)
+
+
+def entry_matches(entry, extensions):
+    # File đặt sai đuôi (hoặc không đuôi) được xét theo định dạng đọc từ header
+    if extensions is None:
+        return True
+    extension = os.path.splitext(entry["path"])[1].lower()
+    if is_mislabeled(entry):
+        extension = format_extension(entry, extension)
+    return extension in extensions
+
+
+def needs_sniff(entry):
+    return entry.get("format") is None and should_sniff(entry["path"])
+
+
+def scan_directory(directory, extensions=None, known_mtime_ns=None):
+    # Một thư mục, không đệ quy. Trả về (mtime_ns của thư mục, [entry], [thư mục con]).
+    # mtime vẫn bằng known_mtime_ns (chỉ mục còn đúng): không readdir, entry và thư mục con là None.
+    try:
+        # stat trước readdir: file được thêm trong lúc đang đọc làm mtime khác, lần sau sẽ quét lại
+        mtime_ns = os.stat(directory).st_mtime_ns
+    except OSError:
+        # Không có quyền đọc / thư mục bị xóa giữa chừng: bỏ qua như os.walk
+        return None, [], []
+    if known_mtime_ns is not None and mtime_ns == known_mtime_ns:
+        return mtime_ns, None, None
+
+    entries = []
+    subdirs = []
+    try:
+        with os.scandir(directory) as dir_entries:
+            for entry in dir_entries:
+                try:
+                    # d_type từ readdir: không tốn stat để phân biệt file / thư mục
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif ((matches_extensions(entry.name, extensions) or should_sniff(entry.name))
+                          and entry.is_file()):
+                        # DirEntry.stat() được cache trên entry (miễn phí trên Windows), dùng lại cho preview
+                        stat = entry.stat()
+                        entries.append({"path": entry.path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+                except OSError:
+                    continue
+    except OSError:
+        return None, [], []
+    return mtime_ns, entries, subdirs
+
+
+class ParallelScanner:
+    # index (ScanIndex): thư mục có mtime không đổi so với lần quét trước được lấy từ chỉ mục, không readdir.
+    # rescan=True đọc lại mọi thư mục (ví dụ sau khi file bị ghi đè tại chỗ) và cập nhật chỉ mục.
+    # File có đuôi ảnh hoặc không đuôi được đọc vài byte đầu (webp_sniff) theo lô trên cùng pool thread,
+    # định dạng được lưu vào entry["format"] và vào chỉ mục, lần sau không đọc lại.
+    # rules (webp_rules.ScanRules): thư mục con bị loại không được gửi đi quét, cả cây con bị bỏ qua.
+    def __init__(self, roots, extensions=None, threads=DEFAULT_SCAN_THREADS, batch_size=SCAN_BATCH_SIZE,
+                 flush_interval=SCAN_FLUSH_INTERVAL, index=None, rescan=False, rules=None):
+        # Chỉ mục lưu đường dẫn tuyệt đối
+        self.roots = [os.path.abspath(root) for root in roots] if index is not None else roots
+        self.extensions = tuple(extensions) if extensions is not None else None
+        self.threads = max(1, threads)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.index = index
+        self.rescan = rescan
+        self.rules = rules or None
+        self.cancel_event = threading.Event()
+        self.found_count = 0
+        self.cached_dirs = 0
+        self.scanned_dirs = 0
+        self.sniffed_files = 0
+        self.pruned_dirs = 0
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        # Gọi được từ thread khác; các thư mục đang đọc dở xong thì dừng, không nhận thêm thư mục mới
+        self.cancel_event.set()
+
+    def directory_result(self, directory, mtime_ns, entries, subdirs):
+        # Chạy ở thread gọi iter_batches: chỉ thread này dùng kết nối SQLite
+        if self.index is None:
+            self.scanned_dirs += mtime_ns is not None
+            return entries, subdirs
+        if mtime_ns is None:
+            self.index.forget(directory)
+            return [], []
+        if entries is None:
+            self.cached_dirs += 1
+            entries, subdirs = self.index.cached_directory(directory)
+        else:
+            self.scanned_dirs += 1
+            entries = self.index.update_directory(directory, mtime_ns, entries, subdirs)
+        # Chỉ mục giữ mọi file (tab xóa cần cả file không phải ảnh), lọc đuôi sau khi biết định dạng
+        return entries, subdirs
+
+    def apply_rules(self, root, entries, subdirs):
+        # Lọc sau chỉ mục: chỉ mục giữ danh sách đầy đủ, dùng chung cho mọi bộ quy tắc
+        rules = self.rules
+        kept = [subdir for subdir in subdirs if not rules.excluded(relative_path(subdir, root), True)]
+        self.pruned_dirs += len(subdirs) - len(kept)
+        entries = [entry for entry in entries if not rules.excluded(relative_path(entry["path"], root))]
+        return entries, kept
+
+    def sniff_result(self, entries):
+        self.sniffed_files += len(entries)
+        if self.index is not None:
+            self.index.update_columns(entries, ("format",))
+        return entries
+
+    def iter_batches(self):
+        from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+        known = {}
+        if self.index is not None and not self.rescan:
+            for root in self.roots:
+                known.update(self.index.dir_mtimes(root))
+        worker_extensions = self.extensions if self.index is None else None
+
+        # future -> (thư mục gốc, thư mục), hoặc None với task đọc header
+        pending = {}
+        batch = []
+        last_flush = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            def submit(root, directory):
+                future = executor.submit(scan_directory, directory, worker_extensions, known.get(directory))
+                pending[future] = (root, directory)
+
+            def submit_sniff(entries):
+                for start in range(0, len(entries), SNIFF_BATCH_SIZE):
+                    pending[executor.submit(sniff_entries, entries[start:start + SNIFF_BATCH_SIZE])] = None
+
+            try:
+                for root in self.roots:
+                    submit(root, root)
+                while pending and not self.cancelled:
+                    done, _ = wait(pending, timeout=self.flush_interval, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        task = pending.pop(future)
+                        if task is None:
+                            entries = self.sniff_result(future.result())
+                        else:
+                            root, directory = task
+                            entries, subdirs = self.directory_result(directory, *future.result())
+                            if self.rules is not None:
+                                entries, subdirs = self.apply_rules(root, entries, subdirs)
+                            if not self.cancelled:
+                                for subdir in subdirs:
+                                    submit(root, subdir)
+                            # Entry chờ đọc header xong mới được đẩy ra, để lọc theo định dạng ngay từ lô đầu.
+                            # Chia trước khi submit: thread đọc header sửa entry tại chỗ.
+                            unsniffed = [entry for entry in entries if needs_sniff(entry)]
+                            entries = [entry for entry in entries if not needs_sniff(entry)]
+                            submit_sniff(unsniffed)
+                        batch.extend(entry for entry in entries if entry_matches(entry, self.extensions))
+                    now = time.monotonic()
+                    if batch and (len(batch) >= self.batch_size or now - last_flush >= self.flush_interval):
+                        # Thư mục 100k file cũng chỉ ra từng lô batch_size, giao diện không bị khựng
+                        while batch and not self.cancelled:
+                            chunk, batch = batch[:self.batch_size], batch[self.batch_size:]
+                            self.found_count += len(chunk)
+                            yield chunk
+                        last_flush = now
+                while batch and not self.cancelled:
+                    chunk, batch = batch[:self.batch_size], batch[self.batch_size:]
+                    self.found_count += len(chunk)
+                    yield chunk
+            finally:
+                for future in pending:
+                    future.cancel()
+                if self.index is not None:
+                    self.index.flush()
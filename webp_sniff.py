@@ -0,0 +1,71 @@
+import os
+
+from webp_core import FORMAT_EXTENSIONS
+
+
+# Đủ cho mọi chữ ký bên dưới (WebP cần 12 byte đầu)
+SNIFF_BYTES = 16
+
+# Số file mỗi task đọc header: đủ lớn để không tốn công điều phối, đủ nhỏ để chia đều cho các thread
+SNIFF_BATCH_SIZE = 64
+
+# Chỉ mở file có đuôi ảnh hoặc không có đuôi: .php, .css, .pdf... không bao giờ là ảnh cần chuyển đổi
+SNIFF_EXTENSIONS = tuple(ext for extensions in FORMAT_EXTENSIONS.values() for ext in extensions)
+
+# Đã đọc header nhưng không nhận ra định dạng (khác None = chưa đọc)
+UNKNOWN_FORMAT = ""
+
+
+def sniff_bytes(header):
+    if header.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    if header[:4] in (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+"):
+        return "tiff"
+    if header[:2] == b"BM" and header[6:10] == b"\x00\x00\x00\x00":
+        return "bmp"
+    return UNKNOWN_FORMAT
+
+
+def should_sniff(path):
+    name = os.path.basename(path).lower()
+    return name.endswith(SNIFF_EXTENSIONS) or "." not in name.lstrip(".")
+
+
+def sniff_file(path):
+    try:
+        with open(path, "rb") as f:
+            return sniff_bytes(f.read(SNIFF_BYTES))
+    except OSError:
+        return None
+
+
+def sniff_entries(entries):
+    # Chạy trong thread của bộ quét: mỗi file chỉ một open + read vài byte, không giải mã
+    for entry in entries:
+        entry["format"] = sniff_file(entry["path"])
+    return entries
+
+
+def sniff_catalog(paths):
+    # File được chọn lẻ / file mới upload: không qua bộ quét nhưng vẫn cần định dạng theo nội dung
+    return {path: {"path": path, "format": sniff_file(path)} for path in paths}
+
+
+def format_extension(entry, default=None):
+    # Đuôi "thật" theo nội dung: PNG đặt tên .jpg là .png, WebP đặt tên .jpg là .webp, ảnh không đuôi có đuôi.
+    # File đuôi .webp luôn giữ đuôi: output của nó là chính nó, không bao giờ được làm nguồn chuyển đổi.
+    file_format = entry.get("format") if entry is not None else None
+    if file_format and not entry["path"].lower().endswith(".webp"):
+        return FORMAT_EXTENSIONS[file_format][0]
+    return default
+
+
+def is_mislabeled(entry):
+    extension = os.path.splitext(entry["path"])[1].lower()
+    return bool(entry.get("format")) and extension not in FORMAT_EXTENSIONS[entry["format"]]
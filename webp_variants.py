@@ -0,0 +1,180 @@
+import json
+import os
+import re
+from pathlib import Path
+
+from webp_core import (check_pixels, convert_file, fit_size, is_animated, output_path, prepare_image, save_webp,
+                       stage, write_output)
+
+
+# WordPress đặt tên size con là {tên gốc}-{rộng}x{cao}.{ext}, ví dụ photo-300x200.jpg
+VARIANT_PATTERN = re.compile(r"^(?P<base>.+)-(?P<width>\d+)x(?P<height>\d+)$")
+
+MIME_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".bmp": "image/bmp",
+    ".tif": "image/tiff",
+    ".tiff": "image/tiff",
+}
+
+
+def load_wp_metadata(json_path, uploads_root):
+    # File JSON là danh sách kết quả wp_get_attachment_metadata(), ví dụ xuất bằng:
+    # wp eval 'echo json_encode(array_map("wp_get_attachment_metadata", get_posts(["post_type" => "attachment", "numberposts" => -1, "fields" => "ids"])));'
+    with open(json_path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+
+    metadata = {}
+    for entry in entries:
+        if not isinstance(entry, dict) or not entry.get("file") or not isinstance(entry.get("sizes"), dict):
+            continue
+        base_path = os.path.abspath(os.path.join(uploads_root, entry["file"]))
+        metadata[base_path] = entry["sizes"]
+    return metadata
+
+
+def sizes_from_filenames(files):
+    # Dựng bảng sizes cùng cấu trúc với _wp_attachment_metadata['sizes'] khi không có metadata từ database
+    by_path = {os.path.abspath(file_path): file_path for file_path in files}
+    groups = {}
+    for abs_path in by_path:
+        file_obj = Path(abs_path)
+        match = VARIANT_PATTERN.match(file_obj.stem)
+        if not match:
+            continue
+        base_path = str(file_obj.parent / f"{match.group('base')}{file_obj.suffix}")
+        if base_path not in by_path:
+            continue
+        width, height = int(match.group("width")), int(match.group("height"))
+        groups.setdefault(base_path, {})[f"{width}x{height}"] = {
+            "file": file_obj.name,
+            "width": width,
+            "height": height,
+            "mime-type": MIME_TYPES.get(file_obj.suffix.lower(), "image/jpeg"),
+        }
+    return groups
+
+
+def group_variants(files, wp_metadata=None):
+    by_path = {os.path.abspath(file_path): file_path for file_path in files}
+    groups = sizes_from_filenames(files)
+    if wp_metadata:
+        for base_path, sizes in wp_metadata.items():
+            if base_path in by_path:
+                groups[base_path] = sizes
+
+    jobs = []
+    grouped = set()
+    for base_path, sizes in groups.items():
+        parent = Path(base_path).parent
+        # Chỉ giữ các size đang được chọn (không bị lọc, chưa có trong manifest)
+        selected_sizes = {}
+        for name, data in sizes.items():
+            variant_path = str(parent / data.get("file", ""))
+            if variant_path in by_path and variant_path != base_path and variant_path not in grouped:
+                selected_sizes[name] = data
+                grouped.add(variant_path)
+        if selected_sizes:
+            jobs.append((by_path[base_path], selected_sizes))
+            grouped.add(base_path)
+
+    for abs_path, file_path in by_path.items():
+        if abs_path not in grouped:
+            jobs.append((file_path, None))
+    return jobs
+
+
+def render_variant(img, target):
+    from PIL import Image
+
+    width, height = target
+    src_ratio = img.width / img.height
+    dst_ratio = width / height
+    # Size crop cứng (thumbnail 150x150...) lệch tỉ lệ rõ rệt: cắt giữa giống WordPress trước khi resize
+    if abs(src_ratio - dst_ratio) / dst_ratio > 0.02:
+        if src_ratio > dst_ratio:
+            crop_width = round(img.height * dst_ratio)
+            left = (img.width - crop_width) // 2
+            img = img.crop((left, 0, left + crop_width, img.height))
+        else:
+            crop_height = round(img.width / dst_ratio)
+            top = (img.height - crop_height) // 2
+            img = img.crop((0, top, img.width, top + crop_height))
+    return img.resize(target, Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+
+def convert_variant(img, variant_file, data, options):
+    timings = {}
+    with stage(timings, "stat"):
+        source_stat = variant_file.stat()
+    output_file = output_path(variant_file, options.get("outputs"))
+
+    width, height = int(data["width"]), int(data["height"])
+    target = fit_size((width, height), options.get("max_width"), options.get("max_height")) or (width, height)
+    with stage(timings, "resize"):
+        variant_img = render_variant(img, target)
+    webp_data, quality, target_met = save_webp(variant_img, options, timings)
+    with stage(timings, "write"):
+        write_output(output_file, webp_data)
+
+    return {
+        "input": str(variant_file),
+        "output": str(output_file),
+        "original_size": source_stat.st_size,
+        "converted_size": output_file.stat().st_size,
+        "removed": False,
+        "source_mtime_ns": source_stat.st_mtime_ns,
+        "source_hash": None,
+        "cache_key": None,
+        "cache_hit": False,
+        "quality": quality,
+        "target_met": target_met,
+        "timings": timings,
+    }
+
+
+def convert_group(base_path, sizes, options):
+    from PIL import Image
+
+    base_file = Path(base_path)
+    variant_files = [(base_file.parent / data["file"], data) for data in sizes.values()]
+    results = []
+
+    try:
+        # Thời gian giải mã ảnh gốc tính cho ảnh gốc, các size con chỉ tính resize/encode/ghi của riêng chúng
+        timings = {}
+        with stage(timings, "open"):
+            source = Image.open(base_file)
+        with source:
+            check_pixels(source, options)
+            animated = is_animated(source, options)
+            img = prepare_image(source, options, timings)
+            img.load()
+
+        if animated:
+            # Ảnh gốc động giữ animation; các size con của WordPress là ảnh tĩnh lấy từ frame đầu
+            results.append((base_path, convert_file(base_file, options), None))
+        else:
+            results.append((base_path, convert_file(base_file, options, decoded=img, timings=timings), None))
+
+        for variant_file, data in variant_files:
+            try:
+                results.append((str(variant_file), convert_variant(img, variant_file, data, options), None))
+            except Exception as e:
+                results.append((str(variant_file), None, e))
+    except Exception as e:
+        # Không giải mã được ảnh gốc: chuyển đổi từng size con độc lập như bình thường
+        results.append((base_path, None, e))
+        done = {result_path for result_path, _, _ in results}
+        for variant_file, _ in variant_files:
+            if str(variant_file) in done:
+                continue
+            try:
+                results.append((str(variant_file), convert_file(variant_file, options), None))
+            except Exception as variant_error:
+                results.append((str(variant_file), None, variant_error))
+
+    return results
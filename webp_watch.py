@@ -0,0 +1,220 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+from webp_rules import prune_walk, relative_path, root_for
+from webp_sniff import should_sniff
+
+
+# Hằng số của <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_ONLYDIR
+EVENT_HEADER = struct.Struct("iIII")
+
+# File phải yên (không sự kiện, mtime không đổi) trong chừng này giây mới được coi là upload xong
+DEFAULT_SETTLE_SECONDS = 2.0
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_POLL_INTERVAL = 30.0
+
+
+def is_candidate(name, extensions):
+    # Như bộ quét (ParallelScanner): file đuôi ảnh bất kỳ hoặc không đuôi đều có thể là ảnh cần chuyển đổi,
+    # định dạng thật được đọc từ header khi xử lý lô (sniff_catalog + filter_files). File .webp luôn là chính nó
+    # (thường là output vừa ghi), không bao giờ là nguồn, trừ khi được chọn rõ.
+    name = name.lower()
+    return name.endswith(tuple(extensions)) or (should_sniff(name) and not name.endswith(".webp"))
+
+
+def iter_files(roots, extensions, rules=None):
+    for root in roots:
+        for dirpath, dirnames, filenames in os.walk(root):
+            if rules:
+                filenames = prune_walk(rules, root, dirpath, dirnames, filenames)
+            for filename in filenames:
+                if is_candidate(filename, extensions):
+                    yield os.path.join(dirpath, filename)
+
+
+class InotifyWatcher:
+    # inotify qua ctypes, không cần thư viện ngoài. Một watch cho mỗi thư mục trong cây
+    # (trừ cây con bị loại theo rules: không tốn watch cho cache/, node_modules/...).
+    def __init__(self, roots, extensions, rules=None):
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.roots = roots
+        self.extensions = extensions
+        self.rules = rules
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 thất bại")
+        self.watches = {}
+        try:
+            for root in roots:
+                self.add_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def add_tree(self, directory):
+        # Trả về các file đã có sẵn trong thư mục mới (được tạo trước khi kịp đặt watch)
+        found = []
+        root = root_for(directory, self.roots) if self.rules else None
+        for dirpath, dirnames, filenames in os.walk(directory):
+            if root is not None:
+                filenames = prune_walk(self.rules, root, dirpath, dirnames, filenames)
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dirpath), WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error == errno.ENOSPC:
+                    raise OSError(error, "Hết giới hạn fs.inotify.max_user_watches")
+                continue
+            self.watches[wd] = dirpath
+            found.extend(os.path.join(dirpath, name) for name in filenames)
+        return found
+
+    def read(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+
+        changed = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, name_length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + name_length].rstrip(b"\0")
+                offset += name_length
+
+                if mask & IN_Q_OVERFLOW:
+                    # Hàng đợi kernel tràn, đã mất sự kiện: quét lại toàn bộ, manifest sẽ bỏ qua file không đổi
+                    changed.extend(iter_files(self.roots, self.extensions, self.rules))
+                    continue
+                if mask & IN_IGNORED:
+                    self.watches.pop(wd, None)
+                    continue
+                directory = self.watches.get(wd)
+                if directory is None or not name:
+                    continue
+                path = os.path.join(directory, os.fsdecode(name))
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO) and not self.excluded_directory(path):
+                        changed.extend(self.add_tree(path))
+                else:
+                    changed.append(path)
+        return changed
+
+    def excluded_directory(self, directory):
+        root = root_for(directory, self.roots) if self.rules else None
+        return root is not None and self.rules.excludes_path(relative_path(directory, root))
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher:
+    # Dự phòng khi không có inotify (macOS, Windows, ổ mạng, hết giới hạn watch): so sánh size + mtime định kỳ
+    def __init__(self, roots, extensions, interval=DEFAULT_POLL_INTERVAL, rules=None):
+        self.roots = roots
+        self.extensions = extensions
+        self.rules = rules
+        self.interval = interval
+        self.snapshot = self.scan()
+        self.next_poll = time.monotonic() + interval
+
+    def scan(self):
+        snapshot = {}
+        for file_path in iter_files(self.roots, self.extensions, self.rules):
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            snapshot[file_path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def read(self, timeout):
+        wait = self.next_poll - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        if wait > 0:
+            time.sleep(wait)
+        self.next_poll = time.monotonic() + self.interval
+
+        snapshot = self.scan()
+        changed = [path for path, signature in snapshot.items() if self.snapshot.get(path) != signature]
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher(roots, extensions, poll_interval=DEFAULT_POLL_INTERVAL, use_polling=False, rules=None):
+    if not use_polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(roots, extensions, rules)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(roots, extensions, poll_interval, rules)
+
+
+def watch(roots, extensions, handle_batch, settle=DEFAULT_SETTLE_SECONDS, batch_size=DEFAULT_BATCH_SIZE,
+          poll_interval=DEFAULT_POLL_INTERVAL, use_polling=False, watcher=None, rules=None):
+    # Chạy tới khi bị ngắt (KeyboardInterrupt). handle_batch nhận danh sách file đã upload xong.
+    watcher = watcher or create_watcher(roots, extensions, poll_interval, use_polling, rules)
+    # path -> thời điểm có sự kiện gần nhất
+    pending = {}
+    try:
+        while True:
+            now = time.monotonic()
+            for path in watcher.read(min(settle / 2, 1.0) if pending else 1.0):
+                name = os.path.basename(path)
+                # Bỏ file ẩn: file tạm của chính converter (.photo.webp.123.tmp), file tạm của rsync/FTP
+                if (is_candidate(name, extensions) and not name.startswith(".")
+                        and not (rules and rules.excludes_file(path, roots))):
+                    pending[path] = now
+
+            ready = []
+            now = time.monotonic()
+            for path, seen in list(pending.items()):
+                if now - seen < settle:
+                    continue
+                try:
+                    modified = os.stat(path).st_mtime
+                except FileNotFoundError:
+                    del pending[path]
+                    continue
+                if time.time() - modified < settle:
+                    # Vẫn đang được ghi (ví dụ không có sự kiện vì đang polling): chờ thêm
+                    pending[path] = now
+                    continue
+                del pending[path]
+                ready.append(path)
+
+            ready.sort()
+            for start in range(0, len(ready), batch_size):
+                handle_batch(ready[start:start + batch_size])
+    finally:
+        watcher.close()